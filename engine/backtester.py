@@ -4,6 +4,7 @@ from one4all.backtesting import run_multiple_strategies
 from one4all.strategy import DCA
 from one4all.utils import ParameterGrid, spawn_strategy, transform_timeframe
 from one4all.signals import bollinger_bands_series, compute_boll_signal, project_signal_to, RSI, bollinger_bands_OHLC, compute_rsi_signal
+from one4all.signals import combine_signals, signal_and
 
 #  1. Load and filter the data
 # ----------------------------------------------------------------------------------------------------------------------
@@ -69,12 +70,12 @@ SIGNAL_DF = pd.concat(BB_SERIES, axis=1)
 #SIGNAL_DF['PROJ_BB30'] = project_signal_to(SIGNAL_DF['BB30'], n_min=15)
 
 # 3.2.5 Compute the column 'SPIKE_AND' that look for BB in different timeframes coincide to activate
-#PROJECTED_COLS = [col for col in SIGNAL_DF if col.startswith('PROJ')]
-#SIGNAL_DF['SPIKE_AND30_60'] = SIGNAL_DF['BB30'] * SIGNAL_DF['PROJ_BB60']
-#SIGNAL_DF['SPIKE_AND15_30'] = SIGNAL_DF['BB15'] * SIGNAL_DF['PROJ_BB30']
-#SIGNAL_DF['SPIKE_AND15_60'] = SIGNAL_DF['BB15'] * SIGNAL_DF['PROJ_BB60']
-#SIGNAL_DF['SPIKE_AND10_60'] = SIGNAL_DF['BB10'] * SIGNAL_DF['PROJ_BB60']
-#SIGNAL_DF['SPIKE_AND10_240'] = SIGNAL_DF['BB10'] * SIGNAL_DF['PROJ_BB240']
+# signal_and projects the higher timeframe signal given in windows (the same as multiply by the PROJ_ column)
+#SIGNAL_DF['SPIKE_AND30_60'] = signal_and(SIGNAL_DF[['BB30', 'BB60']], windows={'BB60': 60})
+#SIGNAL_DF['SPIKE_AND15_30'] = signal_and(SIGNAL_DF[['BB15', 'BB30']], windows={'BB30': 30})
+#SIGNAL_DF['SPIKE_AND15_60'] = signal_and(SIGNAL_DF[['BB15', 'BB60']], windows={'BB60': 60})
+#SIGNAL_DF['SPIKE_AND10_60'] = signal_and(SIGNAL_DF[['BB10', 'BB60']], windows={'BB60': 60})
+#SIGNAL_DF['SPIKE_AND10_240'] = signal_and(SIGNAL_DF[['BB10', 'BB240']], windows={'BB240': 240})
 
 #print(SIGNAL_DF.loc[SIGNAL_DF['SPIKE_AND10_240'] == True])
 #print(SIGNAL_DF.loc[SIGNAL_DF['BB60'] == True], 'BB60')
@@ -86,9 +87,10 @@ SIGNAL_DF = pd.concat(BB_SERIES, axis=1)
 
 
 # 3.2.6 Compute the column 'SPIKE_OR' that look for BB signasl with different timeframes
-#print(SIGNAL_DF)
-#SIGNAL_DF['SPIKE'] = SIGNAL_DF.sum(axis=1)
-#SIGNAL_DF['SPIKE_OR'] = SIGNAL_DF['SPIKE'] > 1
+#BB_COLS = ['BB10', 'BB15', 'BB30', 'BB60', 'BB240']
+#SIGNAL_DF['SPIKE'] = SIGNAL_DF[BB_COLS].sum(axis=1)
+# al menos dos bollinger bands con señal en la misma kline
+#SIGNAL_DF['SPIKE_OR'] = combine_signals(SIGNAL_DF[BB_COLS], min_count=2)
 
 
 # Note: You want to run a backtester using one of the above signals?
@@ -0,0 +1,210 @@
+"""
+benchmarks.py
+Benchmark suite of the hot paths of one4all over synthetic 1 minute klines (a geometric brownian motion with
+wicks) and random signals, from 10^4 to 10^7 klines. The timings are saved as a JSON baseline and a later run is
+compared against it to find regressions.
+
+Usage (from engine/):
+  PYTHONPATH=.. python benchmarks.py --save output_data/benchmark_baseline.json
+  PYTHONPATH=.. python benchmarks.py --compare output_data/benchmark_baseline.json --tolerance 0.25
+  PYTHONPATH=.. python benchmarks.py --sizes 10000 100000 --only backtesting_bar make_report
+  PYTHONPATH=.. python benchmarks.py --sizes 525600 --only transform_timeframe_15 transform_timeframe_60
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from one4all.backtesting import backtesting, eval_strategies
+from one4all.reports import make_report, summary_strategy
+from one4all.signals import compute_boll_signal, compute_rsi_signal, project_signal_to
+from one4all.strategy import DCA
+from one4all.utils import ParameterGrid, spawn_strategy, transform_timeframe
+
+SIZES = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+# -1: ningun drawdown alcanza la tolerancia, las estrategias recorren todas las klines
+DRAWDOWN_TOLERANCE = -1
+PARAMS = {'TP': .5, 'bo_size': 10, 'so_qty': 4, 'size_1st_so': 10, 'so_vol_scale': 1.5, 'so_step': .5,
+          'so_step_scale': 1.2, 'long': True, 'EC': .1}
+GRID = {'TP': [.5, 1], 'bo_size': [10], 'so_qty': [2, 4], 'size_1st_so': [10], 'so_vol_scale': [1.5],
+        'so_step': [.5, 1], 'so_step_scale': [1.2], 'long': [True], 'EC': [.1]}
+
+
+def gbm_klines(n, sigma=0.8, mu=None, price=100.0, seed=0, start='2021-01-01'):
+    """
+    n klines of 1 minute following a geometric brownian motion
+    :param sigma: the annual volatility of the close price (0.8 is usual for crypto)
+    :param mu: the annual drift, by default sigma ** 2 / 2: the log price has no drift, so over many years the
+    price doesn't go to 0 (the median of a driftless geometric brownian motion does)
+    :param price: the first open price
+    :return: an OHLC dataframe with a Volume column and an open_time index. The open is the previous close, the
+    wicks go beyond the body a half-normal distance with the volatility of a minute
+    """
+    rng = np.random.default_rng(seed)
+    dt = 1 / (365 * 1440)
+    mu = sigma ** 2 / 2 if mu is None else mu
+    step_sigma = sigma * np.sqrt(dt)
+    log_return = (mu - sigma ** 2 / 2) * dt + step_sigma * rng.standard_normal(n)
+    close = price * np.exp(np.cumsum(log_return))
+    open_price = np.append(price, close[:-1])
+    wicks = np.exp(np.abs(rng.standard_normal((2, n))) * step_sigma / 2)
+    return pd.DataFrame({'Open': open_price,
+                         'High': np.maximum(open_price, close) * wicks[0],
+                         'Low': np.minimum(open_price, close) / wicks[1],
+                         'Close': close,
+                         'Volume': rng.lognormal(3, 1, n)},
+                        index=pd.date_range(start, periods=n, freq='1min', name='open_time'))
+
+
+def random_signal(n, density=0.001, seed=0):
+    """A bool array with n values, True with probability density"""
+    return np.random.default_rng(seed).random(n) < density
+
+
+class Data:
+    """The synthetic klines, signal and deals of a size, built once and shared by the benchmarks"""
+
+    def __init__(self, n, seed=0):
+        # multiplo de 60 para transformar a 15, 30 y 60 minutos
+        n -= n % 60
+        self.OHLC = gbm_klines(n, seed=seed)
+        self.signal = random_signal(n, seed=seed)
+        self._deals = None
+        self._report = None
+
+    @property
+    def deals(self):
+        if self._deals is None:
+            self._deals = backtesting(DCA(**PARAMS), self.OHLC, self.signal, DRAWDOWN_TOLERANCE, mode='event')
+        return self._deals
+
+    @property
+    def report(self):
+        if self._report is None:
+            self._report = make_report(self.deals)
+        return self._report
+
+
+# cada benchmark recibe Data y devuelve la funcion a medir (la preparacion no se mide)
+BENCHMARKS = {
+    'transform_timeframe_15': lambda d: lambda: transform_timeframe(d.OHLC, 15),
+    'transform_timeframe_30': lambda d: lambda: transform_timeframe(d.OHLC, 30),
+    'transform_timeframe_60': lambda d: lambda: transform_timeframe(d.OHLC, 60),
+    'compute_boll_signal': lambda d: lambda: compute_boll_signal(d.OHLC, 15, cache=None),
+    'compute_rsi_signal': lambda d: lambda: compute_rsi_signal(d.OHLC, 15, cache=None),
+    'project_signal_to': lambda d: lambda: project_signal_to(d.signal, 60),
+    'backtesting_bar': lambda d: lambda: backtesting(DCA(**PARAMS), d.OHLC, d.signal, DRAWDOWN_TOLERANCE),
+    'backtesting_event': lambda d: lambda: backtesting(DCA(**PARAMS), d.OHLC, d.signal, DRAWDOWN_TOLERANCE,
+                                                       mode='event'),
+    'eval_strategies_bar': lambda d: lambda: eval_strategies(spawn_strategy(DCA, ParameterGrid(GRID)), d.OHLC,
+                                                             d.signal, DRAWDOWN_TOLERANCE, progress=None),
+    'eval_strategies_event': lambda d: lambda: eval_strategies(spawn_strategy(DCA, ParameterGrid(GRID)), d.OHLC,
+                                                               d.signal, DRAWDOWN_TOLERANCE, mode='event',
+                                                               progress=None),
+    'eval_strategies_batch': lambda d: lambda: eval_strategies(spawn_strategy(DCA, ParameterGrid(GRID)), d.OHLC,
+                                                               d.signal, DRAWDOWN_TOLERANCE, mode='batch',
+                                                               progress=None),
+    'make_report': lambda d: lambda: make_report(d.deals),
+    'summary_strategy': lambda d: lambda: summary_strategy(d.report, MIN_CAPITAL=DCA(**PARAMS).compute_min_capital()),
+}
+
+
+def measure(function, repeat=3, budget=10.0):
+    """
+    Best time by call of function in seconds. Like timeit, a fast function is called in loops lasting at least 0.2
+    seconds, and the loop is repeated only while the total time is under budget seconds
+    """
+    timer = timeit.Timer(function)
+    number, spent = timer.autorange()
+    best = spent / number
+    for _ in range(repeat - 1):
+        if spent >= budget:
+            break
+        seconds = timer.timeit(number)
+        spent += seconds
+        best = min(best, seconds / number)
+    return best
+
+
+def run(sizes, names, repeat=3, budget=10.0, seed=0):
+    """:return: a dict {benchmark: {number of klines: seconds}}"""
+    results = {name: {} for name in names}
+    for n in sizes:
+        data = Data(n, seed=seed)
+        for name in names:
+            seconds = measure(BENCHMARKS[name](data), repeat, budget)
+            results[name][str(data.OHLC.shape[0])] = seconds
+            print(f'{name:<24} {data.OHLC.shape[0]:>10,} klines  {seconds:10.4f}s', flush=True)
+        del data
+    return results
+
+
+def calibrate():
+    """Time of a fixed python and numpy workload, to scale a baseline made in a faster or slower machine"""
+    values = np.random.default_rng(0).random(10 ** 6)
+
+    def workload():
+        total = 0.0
+        for x in values[:10 ** 5].tolist():
+            total += x if x > 0.5 else -x
+        return total + np.sort(values).sum()
+    return measure(workload, repeat=5)
+
+
+def compare(results, baseline, tolerance, noise=1e-3, speed=1.0):
+    """
+    :param speed: the calibrate time of this run divided by the one of the baseline
+    :return: a list of the (benchmark, number of klines, seconds, baseline seconds scaled by speed) slower than
+    the baseline by more than tolerance (0.25 is 25% slower) and by more than noise seconds
+    """
+    regressions = []
+    for name, timings in results.items():
+        for n, seconds in timings.items():
+            reference = baseline['results'].get(name, {}).get(n)
+            reference = None if reference is None else reference * speed
+            if reference is not None and seconds > reference * (1 + tolerance) and seconds - reference > noise:
+                regressions.append((name, n, seconds, reference))
+    return regressions
+
+
+def environment():
+    return {'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'system': platform.system()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of one4all over synthetic klines')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of 1 minute klines')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3, help='runs by benchmark, the best one is kept')
+    parser.add_argument('--budget', type=float, default=10.0, help='seconds after which a benchmark is not repeated')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='save the timings as a JSON baseline')
+    parser.add_argument('--compare', help='a JSON baseline to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    calibration = calibrate()
+    print(f'calibration {calibration:.4f}s')
+    results = run(args.sizes, args.only, args.repeat, args.budget, args.seed)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'seed': args.seed, 'calibration': calibration,
+                       'results': results}, f, indent=2)
+        print('Baseline saved in ' + args.save)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        speed = calibration / baseline.get('calibration', calibration)
+        print(f'speed against the baseline machine: {speed:.2f}')
+        regressions = compare(results, baseline, args.tolerance, speed=speed)
+        for name, n, seconds, reference in regressions:
+            print(f'REGRESSION {name} ({n} klines): {seconds:.4f}s vs {reference:.4f}s '
+                  f'(+{(seconds / reference - 1) * 100:.0f}%)')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against ' + args.compare)
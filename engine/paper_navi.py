@@ -0,0 +1,31 @@
+"""
+paper_navi.py
+Paper trading of a DCA bot with the BOLL15 signal, replaying the sample klines as if they came from the exchange
+"""
+import asyncio
+from one4all.live import LiveRunner, replay_csv
+from one4all.strategy import DCA
+from one4all.streaming import StreamBollSignal
+
+params = {'TP': 0.9,
+          'bo_size': 125,
+          'so_qty': 3,
+          'size_1st_so': 125,
+          'so_vol_scale': 1.5,
+          'so_step': 3,
+          'so_step_scale': 1.25,
+          'long': True,
+          'EC': 0.1}
+
+
+def print_event(event):
+    print(f"{event['date']}  {event['event']:<11} price: {event['price']:<10} size: {event['size']}")
+
+
+# delay=0 reproduce las klines lo mas rapido posible; delay=60 simula el ritmo real de las klines de 1 minuto
+runner = LiveRunner(DCA(**params), signal=StreamBollSignal(TIMEFRAME_LENGTH=15), on_event=print_event)
+asyncio.run(runner.run(replay_csv('sample_data/ETHUSDT_010122_150122.csv', delay=0)))
+
+print('\nLatencia por kline:')
+print('---------------------------')
+print(runner.latency())
@@ -5,34 +5,54 @@ This file contains the classes that create the backtesting engine.
 
 NOTA:!!
 
-Se desactivo el registro del best_try para correr mas rapido las estrategias, leer lo siiguiente con atencion.
-
-Para desactivar seguir el best_try (ojala por eficiencia), comentar las siguientes lineas de codigo:
- - strategy.py, linea 69, 76, 85 y 110
- - backtesting.py, lineas 69-73
+Para correr mas rapido las estrategias se puede desactivar el registro del best_try y/o del drawdown usando el
+parametro tracking de DCA (ver strategy.py), por ejemplo DCA(**params, tracking='drawdown'):
+ - 'full': registra drawdown y best_try (default)
+ - 'drawdown': registra solo el drawdown, se mantiene el early stop
+ - 'none': no registra nada, la estrategia no se detiene por drawdown
+make_report recibe el mismo parametro tracking y omite las columnas que no se registraron.
 
 """
 from collections.abc import Mapping, Sequence, Iterable
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from itertools import accumulate, product
 from functools import partial, reduce
+import logging
 import operator
+import os
+import tempfile
+import time
 import numpy as np
 import pandas as pd
 import random as random
+from .cache import ResultCache
+from .ledger import DealLedger
+from .profiling import deal_counters, measure, print_progress
 from .reports import *
 
+logger = logging.getLogger(__name__)
+
 
 class Order:
+    __slots__ = ['size', 'price', 'date', 'filled', 'bt_price', 'bt_price_index', 'bt_date']
+
     def __init__(self, size, price, date):
         self.size = size
         self.price = price
         self.date = date
         self.filled = False
-        self.best_try = {'price': 0,
-                         'price_index': 0,
-                         'date': self.date,
-                         'pct': 0}
+        # best_try
+        self.bt_price = 0
+        self.bt_price_index = 0
+        self.bt_date = date
+
+    @property
+    def best_try(self):
+        return {'price': self.bt_price,
+                'price_index': self.bt_price_index,
+                'date': self.bt_date,
+                'pct': 0}
 
     @property
     def is_long(self):
@@ -55,6 +75,9 @@ def create_safe_order(so_qty, price, date, size_1st_so=12, so_vol_scale=2, so_st
 
 
 class Position:
+    __slots__ = ['pos', 'weighted_price', 'order_list', 'closed', 'TP', 'TP_price',
+                 'dd_price', 'dd_date', 'dd_pct_float']
+
     def __init__(self, TP):
         self.pos = 0
         self.weighted_price = 0
@@ -62,10 +85,17 @@ class Position:
         self.closed = False
         self.TP = TP
         self.TP_price = 0
-        self.drawdown = {'price': 0,
-                         'date': None,
-                         'pct': 0,
-                         'pct_float': 0}
+        # drawdown
+        self.dd_price = 0
+        self.dd_date = None
+        self.dd_pct_float = 0
+
+    @property
+    def drawdown(self):
+        return {'price': self.dd_price,
+                'date': self.dd_date,
+                'pct': 0 if self.dd_date is None else format_pct(self.dd_pct_float * 100),
+                'pct_float': self.dd_pct_float}
 
     def new_entry(self, size, price, date, TP):
         """Gives size and price"""
@@ -75,11 +105,11 @@ class Position:
         self.TP_price = round(self.weighted_price * (1 + TP / 100), 7)
         self.pos += size
         if len(self.order_list) == 1:
-            self.drawdown['price'] = self.weighted_price
+            self.dd_price = self.weighted_price
         # if len(self.order_list) == 1:
-        #    self.order_list[-1].best_try['price'] = self.weighted_price
-        #    self.order_list[-1].best_try['price_index'] = \
-        #        round((self.order_list[-1].best_try['price'] - self.order_list[-1].price) / (
+        #    self.order_list[-1].bt_price = self.weighted_price
+        #    self.order_list[-1].bt_price_index = \
+        #        round((self.order_list[-1].bt_price - self.order_list[-1].price) / (
         #                self.TP_price - self.order_list[-1].price), 7)
 
     def close_entry(self, price, date):
@@ -114,97 +144,479 @@ class Position:
     def is_closed(self):
         return self.closed
 
-    def try_high(self, last_OLHC):
+    def try_high(self, klines, i):
         """
         Record best try for long strategies
-        :param last_OLHC:
+        :param klines: a Klines instance with the OHLC arrays
+        :param i: the bar index inside klines
         :return: None
         """
-        if self.order_list[-1].best_try['price'] < last_OLHC['High']:
+        high = klines.high[i]
+        order = self.order_list[-1]
+        if order.bt_price < high:
             # compute min between 'High' and self.TP_price
-            update_price = min(last_OLHC['High'], self.TP_price)
+            update_price = min(high, self.TP_price)
             # update best_price
-            self.order_list[-1].best_try['price'] = update_price
+            order.bt_price = update_price
             # compute price index using last entry price and TP_price
-            self.order_list[-1].best_try['price_index'] = \
-                round((update_price - self.order_list[-1].price) / (self.TP_price - self.order_list[-1].price), 7)
+            order.bt_price_index = round((update_price - order.price) / (self.TP_price - order.price), 7)
             # record the date
-            self.order_list[-1].best_try['date'] = last_OLHC.name  # pd.df index -> pd.series is name
+            order.bt_date = klines.index[i]
 
-    def try_low(self, last_OLHC):
+    def try_low(self, klines, i):
         # record best try for short strategies
-        if self.order_list[-1].best_try['price'] > last_OLHC['Low']:
-            self.order_list[-1].best_try['price'] = max(last_OLHC['Low'], self.TP_price)
-            self.order_list[-1].best_try['date'] = last_OLHC.name  # pd.df index -> pd.series name
+        low = klines.low[i]
+        order = self.order_list[-1]
+        if order.bt_price > low:
+            order.bt_price = max(low, self.TP_price)
+            order.bt_date = klines.index[i]
 
-    def lowest_low(self, last_OLHC):
+    def lowest_low(self, klines, i):
         # drawdown for long strategies
-        if self.drawdown['price'] > last_OLHC['Low']:
-            self.drawdown['price'] = last_OLHC['Low']
-            self.drawdown['date'] = last_OLHC.name  # pd.df index -> pd.series name
-            self.drawdown['pct'] = ''.join(
-                [str(round((self.drawdown['price'] / self.order_list[0].price - 1) * 100, 2)), '%'])
-            self.drawdown['pct_float'] = self.drawdown['price'] / self.order_list[0].price - 1
-
-    def highest_high(self, last_OLHC):
+        low = klines.low[i]
+        if self.dd_price > low:
+            self.dd_price = low
+            self.dd_date = klines.index[i]
+            self.dd_pct_float = self.dd_price / self.order_list[0].price - 1
+
+    def highest_high(self, klines, i):
         # drawdown for short strategies
-        if self.drawdown['price'] < last_OLHC['High']:
-            self.drawdown['price'] = last_OLHC['High']
-            self.drawdown['date'] = last_OLHC.name  # pd.df index -> pd.series name
-            self.drawdown['pct'] = ''.join(
-                [str(round((self.drawdown['price'] / self.order_list[0].price - 1) * 100, 2)), '%'])
-            self.drawdown['pct_float'] = self.drawdown['price'] / self.order_list[0].price - 1
+        high = klines.high[i]
+        if self.dd_price < high:
+            self.dd_price = high
+            self.dd_date = klines.index[i]
+            self.dd_pct_float = self.dd_price / self.order_list[0].price - 1
+
+
+class Klines:
+    """
+    Bar-cursor view of an OHLC dataframe: every column is stored once as a contiguous float64 numpy array and
+    strategies read scalars from it using a bar index, instead of receiving a growing OHLC slice on each bar.
+    """
+
+    def __init__(self, open, high, low, close, index):
+        self.open = np.ascontiguousarray(open, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        self.index = index
+
+    @classmethod
+    def from_frame(cls, OHLC):
+        """
+        :param OHLC: a dataframe with open, high, low, close price information
+        :return: a Klines instance sharing the OHLC index
+        """
+        return cls(OHLC['Open'].to_numpy(), OHLC['High'].to_numpy(), OHLC['Low'].to_numpy(),
+                   OHLC['Close'].to_numpy(), OHLC.index)
+
+    def __len__(self):
+        return self.open.shape[0]
+
+    def window(self, first, last):
+        """The klines [first, last) as a Klines instance sharing the arrays (without copying them)"""
+        return Klines(self.open[first:last], self.high[first:last], self.low[first:last], self.close[first:last],
+                      self.index[first:last])
+
+    def next_cross(self, i, high_above=np.inf, low_below=-np.inf, chunk=64):
+        """
+        Find the first bar at or after i whose High is above high_above or whose Low is below low_below.
+        The arrays are scanned in growing chunks so the cost is proportional to the distance to the event.
+        :return: the bar index, or len(self) when no bar crosses the levels
+        """
+        NROW = len(self)
+        while i < NROW:
+            stop = min(i + chunk, NROW)
+            cross = (self.high[i:stop] > high_above) | (self.low[i:stop] < low_below)
+            k = cross.argmax()
+            if cross[k]:
+                return i + int(k)
+            i = stop
+            chunk *= 2
+        return NROW
 
 
-def backtesting(strategy, OHLC, signal, DRAWDOWN_TOLERANCE):
+def as_klines(OHLC):
+    """Return OHLC as a Klines instance, converting it when a dataframe is given"""
+    if isinstance(OHLC, Klines):
+        return OHLC
+    return Klines.from_frame(OHLC)
+
+
+def is_stopped(strategy, DRAWDOWN_TOLERANCE):
+    """Check if the drawdown of the last position is beyond the tolerance, without reporting it"""
+    return len(strategy.strategy_pos) != 0 and strategy.strategy_pos[-1].dd_pct_float < DRAWDOWN_TOLERANCE
+
+
+def early_stop(strategy, DRAWDOWN_TOLERANCE):
+    """Check if the drawdown of the last position is beyond the tolerance to stop the strategy early"""
+    if is_stopped(strategy, DRAWDOWN_TOLERANCE):
+        logger.info('early stop, drawdown %s', strategy.strategy_pos[-1].drawdown)
+        return True
+    return False
+
+
+def backtesting(strategy, OHLC, signal, DRAWDOWN_TOLERANCE, mode='bar', start=0):
     """
     :param strategy:
-    :param OHLC: a dataframe with open, high, low, close price information
+    :param OHLC: a dataframe with open, high, low, close price information (or a Klines instance)
     :param signal: a boolean list with the same length that OHLC's number of rows
+    :param mode: 'bar' evaluates the strategy on every bar, 'event' jumps between the bars that can change
+    the strategy state (strategies without next_event support run bar by bar), 'batch' runs the strategy as a batch
+    of one (see backtesting_batch)
+    :param start: the first bar to evaluate, to resume a strategy that already ran over the bars [0, start) of
+    the same klines (see checkpoint.py). A strategy already early stopped is not evaluated again
     :return: a list with close deals given a strategy run in time range indicated by OHLC
     """
-    NROW = OHLC.shape[0]
-    for i in range(NROW):
+    if mode not in ('bar', 'event', 'batch'):
+        raise ValueError('Unknown backtesting mode ({!r})'.format(mode))
+    klines = as_klines(OHLC)
+    signal = np.asarray(signal, dtype=bool)
+    if is_stopped(strategy, DRAWDOWN_TOLERANCE):
+        return strategy.strategy_pos
+    if mode == 'batch' and hasattr(strategy, 'run_batch'):
+        return strategy.run_batch([strategy], klines, signal, DRAWDOWN_TOLERANCE, start)[0]
+    if mode in ('event', 'batch') and hasattr(strategy, 'next_event'):
+        return backtesting_events(strategy, klines, signal, DRAWDOWN_TOLERANCE, start)
+    NROW = len(klines)
+    for i in range(start, NROW):
         # agregar linea con tolerancia de max drawdown para parar estrategia de manera temprana
-        strategy.next(OHLC.iloc[0:(i + 1), :], signal[i])
-        if len(strategy.strategy_pos) != 0:
-            if strategy.strategy_pos[-1].drawdown['pct_float'] < DRAWDOWN_TOLERANCE:
-                print('early stop')
-                print(strategy.strategy_pos[-1].drawdown)
+        strategy.next(i, klines, signal[i])
+        if early_stop(strategy, DRAWDOWN_TOLERANCE):
+            break
+    return strategy.strategy_pos
+
+
+def backtesting_events(strategy, klines, signal, DRAWDOWN_TOLERANCE, start=0):
+    """
+    Event-driven backtesting: strategy.next_event gives the next bar that can change the strategy state (a fill,
+    a take profit or a signal), the quiet bars in between only update the drawdown and best_try tracking in bulk
+    with strategy.track_range. Produces the same deals than running strategy.next over every bar.
+    :param strategy: a strategy implementing next, next_event and track_range (e.g. DCA)
+    :param klines: a Klines instance
+    :param signal: a boolean numpy array with the same length that klines
+    :param start: the first bar to evaluate (see backtesting)
+    :return: a list with close deals given a strategy run in time range indicated by klines
+    """
+    NROW = len(klines)
+    signal_idx = np.flatnonzero(signal)
+    i = start
+    while i < NROW:
+        j = strategy.next_event(i, klines, signal_idx)
+        if j > i:
+            # tracking stops at the bar breaking the drawdown tolerance
+            strategy.track_range(i, j, klines, DRAWDOWN_TOLERANCE)
+            if early_stop(strategy, DRAWDOWN_TOLERANCE):
                 break
+        if j >= NROW:
+            break
+        strategy.next(j, klines, signal[j])
+        if early_stop(strategy, DRAWDOWN_TOLERANCE):
+            break
+        i = j + 1
     return strategy.strategy_pos
 
 
-def eval_strategies(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE):
+def backtesting_batch(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE, start=0):
+    """
+    Backtest the strategies in a single pass over the klines: the strategies of a class implementing run_batch
+    (e.g. DCA, see DCABatch) advance all at once, the other ones run one by one in event mode
+    :param start: the first bar to evaluate (see backtesting)
+    :return: a list of (name, deals) tuples in the same order than strategy_dic
+    """
+    klines = as_klines(OHLC)
+    signal = np.asarray(signal, dtype=bool)
+    groups = {}
+    for name, strategy in strategy_dic.items():
+        groups.setdefault(type(strategy), []).append(name)
+    output = {}
+    for cls, names in groups.items():
+        if hasattr(cls, 'run_batch'):
+            deals = cls.run_batch([strategy_dic[name] for name in names], klines, signal, DRAWDOWN_TOLERANCE, start)
+        else:
+            deals = [backtesting(strategy_dic[name], klines, signal, DRAWDOWN_TOLERANCE, 'event', start)
+                     for name in names]
+        output.update(zip(names, deals))
+    return [(name, output[name]) for name in strategy_dic]
+
+
+def iter_strategies(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE, mode='bar', n_jobs=1, compact=False,
+                    profiler=None, progress=print_progress, summary_only=False):
+    """
+    Run backtesting over different strategies yielding (name, deals) as each strategy finishes, in the same order
+    than strategy_dic. The parameters are the same than eval_strategies.
+    """
+    OHLC = as_klines(OHLC)
+    signal = np.asarray(signal, dtype=bool)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    # segundos de simulacion por estrategia
+    timings = {}
+    if summary_only:
+        for strategy in strategy_dic.values():
+            strategy.deal_summary = DealSummary(tracking=getattr(strategy, 'tracking', 'full'))
+    if n_jobs > 1 and len(strategy_dic) > 1:
+        results = eval_strategies_parallel(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE, mode, n_jobs, compact,
+                                           timings=timings)
+    elif mode == 'batch':
+        def run_batch():
+            start = time.perf_counter()
+            deals = backtesting_batch(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE)
+            # el tiempo de simulacion del batch se reparte entre sus estrategias
+            seconds = (time.perf_counter() - start) / len(deals)
+            for s, back_result in deals:
+                timings[s] = seconds
+                yield s, back_result
+        results = run_batch()
+    else:
+        def run(s):
+            start = time.perf_counter()
+            deals = backtesting(strategy_dic[s], OHLC, signal, DRAWDOWN_TOLERANCE, mode)
+            timings[s] = time.perf_counter() - start
+            return s, deals
+        results = map(run, strategy_dic)
+    N = 1
+    for s, back_result in results:
+        if not isinstance(back_result, (DealLedger, DealSummary)):
+            back_result = collect_deals(strategy_dic[s], back_result, compact)
+        if profiler is not None:
+            profiler.add('simulation', timings[s], s)
+            profiler.count(s, deal_counters(back_result, OHLC, DRAWDOWN_TOLERANCE))
+        strategy_dic[s].strategy_pos = [] if compact or summary_only else back_result
+        strategy_dic[s].deal_summary = None
+        if progress is not None:
+            progress(N, len(strategy_dic))
+        N += 1
+        yield s, back_result
+
+
+def eval_strategies(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE, mode='bar', n_jobs=1, compact=False,
+                    profiler=None, progress=print_progress, summary_only=False):
     """
     Run backtesting over different strategies and collect the report.
     :param strategy_dic:
     :param OHLC:
     :param signal:
-    :return: a dictionary with a report_list by each strategy instance
+    :param mode: backtesting mode, 'bar', 'event' or 'batch' (every strategy advances in the same pass, see
+    backtesting_batch)
+    :param n_jobs: number of worker processes, -1 uses every core. With more than one worker the OHLC and
+    signal arrays are published once as memory-mapped files instead of being pickled to each worker
+    :param compact: store the deals of each strategy in a DealLedger instead of keeping the Position objects
+    :param profiler: a Profiler (see profiling.py) recording the simulation time and the counters (bars, orders
+    filled, deals closed, early stop) of every strategy, None to not measure anything
+    :param progress: a function called with (strategies done, number of strategies) after every strategy, by
+    default it prints the progress. None to not report it
+    :param summary_only: don't keep the deals, every strategy adds each deal to a DealSummary (see reports.py) as
+    soon as it doesn't change anymore, so the memory by strategy doesn't depend on the number of deals
+    :return: a dictionary with a report_list (a DealLedger when compact, a DealSummary when summary_only) by each
+    strategy instance
     """
     output = {key: [] for key in strategy_dic.keys()}
-    N = 1
-    for s in strategy_dic.keys():
-        back_result = backtesting(strategy_dic[s], OHLC, signal, DRAWDOWN_TOLERANCE)
-        output[s] += back_result
-        if N % 2 == 0: print('Progress:', round(N / len(strategy_dic), 4) * 100)
-        N += 1
+    output.update(iter_strategies(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE, mode, n_jobs, compact, profiler,
+                                  progress, summary_only))
     return output
 
 
-def run_multiple_strategies(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE=-0.35):
+def collect_deals(strategy, deals, compact=False):
+    """
+    The output of eval_strategies for a backtested strategy: its DealSummary completed with the last deals when it
+    ran in summary mode, else the deals as a DealLedger when compact or the list of Position
+    """
+    if getattr(strategy, 'deal_summary', None) is not None:
+        return strategy.deal_summary.completed(deals)
+    return DealLedger.from_positions(deals) if compact else deals
+
+
+def publish_klines(klines, signal, directory):
+    """
+    Save the klines arrays and the signal as .npy files, so worker processes can memory-map them
+    :return: a dict with the information required by load_klines
+    """
+    shared = {'directory': directory, 'index': None}
+    arrays = {'open': klines.open, 'high': klines.high, 'low': klines.low, 'close': klines.close, 'signal': signal}
+    if isinstance(klines.index, pd.DatetimeIndex):
+        arrays['index'] = klines.index.asi8
+        shared['unit'], shared['tz'] = klines.index.unit, klines.index.tz
+    else:
+        shared['index'] = klines.index
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), values)
+    return shared
+
+
+def load_klines(shared):
+    """
+    Memory-map the arrays saved by publish_klines
+    :return: a Klines instance and the signal array
+    """
+    arrays = {name: np.load(os.path.join(shared['directory'], name + '.npy'), mmap_mode='r')
+              for name in ['open', 'high', 'low', 'close', 'signal']}
+    index = shared['index']
+    if index is None:
+        index = np.load(os.path.join(shared['directory'], 'index.npy'), mmap_mode='r')
+        index = pd.DatetimeIndex(index.view('datetime64[' + shared['unit'] + ']'))
+        if shared['tz'] is not None:
+            index = index.tz_localize('UTC').tz_convert(shared['tz'])
+    klines = Klines(arrays['open'], arrays['high'], arrays['low'], arrays['close'], index)
+    return klines, arrays['signal']
+
+
+_WORKER = {}
+
+
+def _init_worker(shared, DRAWDOWN_TOLERANCE, mode):
+    _WORKER['klines'], _WORKER['signal'] = load_klines(shared)
+    _WORKER['DRAWDOWN_TOLERANCE'], _WORKER['mode'] = DRAWDOWN_TOLERANCE, mode
+
+
+def _run_worker(worker, item):
+    return worker(item, _WORKER['klines'], _WORKER['signal'], _WORKER['DRAWDOWN_TOLERANCE'], _WORKER['mode'])
+
+
+def parallel_map(worker, items, klines, signal, DRAWDOWN_TOLERANCE, mode='bar', n_jobs=2, chunksize=1):
+    """
+    Run worker over the items in a pool of n_jobs processes. The klines and the signal are published once as
+    memory-mapped files (see publish_klines) and loaded by every process when it starts. Yields the results in the
+    same order than items
+    :param worker: a module level function (it must be picklable) called as
+    worker(item, klines, signal, DRAWDOWN_TOLERANCE, mode) in the pool processes
+    :param chunksize: number of items sent to a process at once
+    """
+    with tempfile.TemporaryDirectory(prefix='one4all_') as directory:
+        shared = publish_klines(klines, signal, directory)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(shared, DRAWDOWN_TOLERANCE, mode)) as executor:
+            yield from executor.map(partial(_run_worker, worker), items, chunksize=chunksize)
+
+
+def _backtesting_worker(item, klines, signal, DRAWDOWN_TOLERANCE, mode, compact=False):
+    name, strategy = item
+    start = time.perf_counter()
+    deals = backtesting(strategy, klines, signal, DRAWDOWN_TOLERANCE, mode)
+    return name, collect_deals(strategy, deals, compact), time.perf_counter() - start
+
+
+def _batch_worker(items, klines, signal, DRAWDOWN_TOLERANCE, mode, compact=False):
+    strategy_dic = dict(items)
+    start = time.perf_counter()
+    results = backtesting_batch(strategy_dic, klines, signal, DRAWDOWN_TOLERANCE)
+    seconds = (time.perf_counter() - start) / len(results)
+    return [(name, collect_deals(strategy_dic[name], deals, compact), seconds) for name, deals in results]
+
+
+def eval_strategies_parallel(strategy_dic, klines, signal, DRAWDOWN_TOLERANCE, mode='bar', n_jobs=2, compact=False,
+                             timings=None):
+    """
+    Run backtesting over the strategies using a pool of n_jobs processes. Yields (name, deals) in the same order
+    than strategy_dic, the deals are a DealLedger when compact is True (a DealSummary for the strategies in summary
+    mode, see eval_strategies). In 'batch' mode every worker runs a batch with a contiguous chunk of the strategies.
+    :param timings: a dict receiving the simulation seconds of every strategy measured in the workers
+    """
+    items = list(strategy_dic.items())
+    if mode == 'batch':
+        size = -(-len(items) // n_jobs)
+        chunks = [items[k:k + size] for k in range(0, len(items), size)]
+        results = (row for chunk in parallel_map(partial(_batch_worker, compact=compact), chunks, klines, signal,
+                                                 DRAWDOWN_TOLERANCE, mode, n_jobs) for row in chunk)
+    else:
+        results = parallel_map(partial(_backtesting_worker, compact=compact), items, klines, signal,
+                               DRAWDOWN_TOLERANCE, mode, n_jobs, chunksize=max(1, len(items) // (4 * n_jobs)))
+    for name, deals, seconds in results:
+        if timings is not None:
+            timings[name] = seconds
+        yield name, deals
+
+
+DEDUP_MODES = ('exact', 'scale')
+
+
+def group_equivalent_strategies(strategy_dic, scale=True):
+    """
+    Group the strategies giving the same simulation, by their class and canonical_params (see DCA). Strategies
+    without canonical_params are never grouped.
+    :return: a dict with the name of the first strategy of every group as key and the names of the group as value
+    """
+    groups, representative = {}, {}
+    for name, strategy in strategy_dic.items():
+        canonical = getattr(strategy, 'canonical_params', None)
+        key = (type(strategy), canonical(scale=scale)) if canonical is not None else name
+        groups.setdefault(representative.setdefault(key, name), []).append(name)
+    return groups
+
+
+def run_multiple_strategies(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE=-0.35, mode='bar', n_jobs=1,
+                            compact=False, cache=None, dedup=None, profiler=None, progress=print_progress,
+                            summary_only=False):
+    """
+    Backtest the strategies and summary each one with summary_strategy
+    :param cache: a ResultCache (see cache.py) or the path of its file. The strategies already in the cache for
+    the same klines, signal and DRAWDOWN_TOLERANCE are not backtested, and the summary of every new strategy is
+    written to the cache as soon as it finishes, so an interrupted run is resumed by running it again
+    :param dedup: None, 'exact' or 'scale'. Backtest just one strategy by group of equivalent strategies (see
+    group_equivalent_strategies) and copy its summary to the others. 'exact' groups the strategies with the same
+    deals, 'scale' also the ones that only differ in the scale of bo_size and size_1st_so. The strategy_pos of
+    the strategies not backtested stays empty
+    :param profiler: a Profiler (see profiling.py) recording the simulation, report and summary time and the
+    counters of every strategy
+    :param progress: the progress callback of eval_strategies
+    :param summary_only: summary the deals as they're made (see DealSummary) instead of building the make_report of
+    every strategy, the memory by strategy doesn't depend on the number of deals. The full report of the chosen
+    strategies is made later with eval_strategies and make_report
+    :return: a pd.DataFrame with the summary and the parameters of every strategy by column
+    """
+    if dedup is not None and dedup not in DEDUP_MODES:
+        raise ValueError('Unknown dedup mode {!r}, expected one of {}'.format(dedup, DEDUP_MODES))
     C = random.choice(list(strategy_dic.values()))
-    info_by_strategy = eval_strategies(strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE)
+    groups = None
+    if dedup is not None:
+        groups = group_equivalent_strategies(strategy_dic, scale=dedup == 'scale')
+        logger.info('Equivalent: %d of %d', len(strategy_dic) - len(groups), len(strategy_dic))
+    runs = strategy_dic if groups is None else {name: strategy_dic[name] for name in groups}
+    summaries = {}
+    pending = runs
+    if cache is not None:
+        if isinstance(cache, (str, os.PathLike)):
+            cache = ResultCache(cache)
+        OHLC = as_klines(OHLC)
+        signal = np.asarray(signal, dtype=bool)
+        keys = cache.keys(runs, OHLC, signal, DRAWDOWN_TOLERANCE)
+        summaries = {name: cache.get(keys[name]) for name in runs if keys[name] in cache}
+        pending = {name: strategy for name, strategy in runs.items() if name not in summaries}
+        if summaries:
+            logger.info('Cached: %d of %d', len(summaries), len(runs))
     # results = []
-    results = [summary_strategy(make_report(deals), MIN_CAPITAL=strategy_dic[name].compute_min_capital()) for
-               name, deals in info_by_strategy.items()]
+    for name, deals in iter_strategies(pending, OHLC, signal, DRAWDOWN_TOLERANCE, mode, n_jobs, compact, profiler,
+                                       progress, summary_only):
+        if summary_only:
+            with measure(profiler, 'summary', name):
+                summaries[name] = deals.summary(MIN_CAPITAL=strategy_dic[name].compute_min_capital())
+            if cache is not None:
+                cache.put(keys[name], summaries[name], strategy_dic[name])
+            continue
+        with measure(profiler, 'report', name):
+            report = make_report(deals, tracking=getattr(strategy_dic[name], 'tracking', 'full'), lazy_nested=True)
+        with measure(profiler, 'summary', name):
+            summaries[name] = summary_strategy(report, MIN_CAPITAL=strategy_dic[name].compute_min_capital())
+        if cache is not None:
+            cache.put(keys[name], summaries[name], strategy_dic[name])
+    if groups is not None:
+        for representative, names in groups.items():
+            for name in names[1:]:
+                summaries[name] = summaries[representative].copy()
     # for name, deals in info_by_strategy.items():
     #    results.append(summary_strategy(make_report(deals), MIN_CAPITAL=strategy_dic[name].compute_min_capital))
-    results = pd.concat(results, axis=1)
-    results.columns = [name for name in info_by_strategy.keys()]
+    return summary_table(summaries, strategy_dic)
+
+
+def summary_table(summaries, strategy_dic):
+    """
+    The output of run_multiple_strategies: the summary and the parameters of every strategy by column
+    :param summaries: a dict with the summary_strategy of every strategy of strategy_dic
+    """
+    results = pd.concat([summaries[name] for name in strategy_dic], axis=1)
+    results.columns = [name for name in strategy_dic.keys()]
     strategy_settings = [pd.DataFrame.from_dict(strategy_dic[k].get_params, orient='index') for k in strategy_dic]
     strategy_settings = pd.concat(strategy_settings, axis=1)
-    strategy_settings.columns = [name for name in info_by_strategy.keys()]
+    strategy_settings.columns = [name for name in strategy_dic.keys()]
     results = pd.concat([results, strategy_settings], axis=0)
     return results
@@ -0,0 +1,118 @@
+"""
+cache.py
+
+This file contains a persistent cache of the strategy summaries made by run_multiple_strategies, so a parameter
+sweep only backtests the strategies it didn't run before.
+
+Usage:
+  eval = run_multiple_strategies(spawn_strategy(DCA, candidates), OHLC, signal=SIGNAL, cache='output_data/cache.jsonl')
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+def data_fingerprint(klines, signal):
+    """
+    sha1 of the klines (open_time and OHLC arrays) and of the signal
+    :param klines: a Klines instance
+    :param signal: a boolean array with the same length that klines
+    """
+    digest = hashlib.sha1()
+    index = klines.index
+    if isinstance(index, pd.DatetimeIndex):
+        digest.update(str(index.tz).encode())
+        digest.update(np.ascontiguousarray(index.as_unit('ns').asi8).tobytes())
+    else:
+        digest.update(pd.util.hash_array(np.asarray(index)).tobytes())
+    for values in (klines.open, klines.high, klines.low, klines.close):
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    digest.update(np.packbits(np.asarray(signal, dtype=bool)).tobytes())
+    return digest.hexdigest()
+
+
+def python_params(params):
+    """The parameters with the numpy scalars of a grid (np.int64, np.float64, np.bool_) as python numbers"""
+    return {key: value.item() if isinstance(value, np.generic) else value for key, value in params.items()}
+
+
+def _encode(value):
+    if isinstance(value, pd.Timestamp):
+        return {'timestamp': value.isoformat()}
+    if isinstance(value, pd.Timedelta):
+        return {'timedelta': value.value}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if 'timestamp' in value:
+            return pd.Timestamp(value['timestamp'])
+        return pd.Timedelta(value['timedelta'])
+    return value
+
+
+class ResultCache:
+    """
+    Append-only JSON lines file with the summary of a strategy by line, keyed by a hash of the klines, the signal,
+    the DRAWDOWN_TOLERANCE, the strategy class and its parameters. Every summary is written and flushed when it's
+    put, and an incomplete last line (an interrupted write) is ignored when the file is read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.summaries = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.summaries[record['key']] = record['summary']
+
+    def __len__(self):
+        return len(self.summaries)
+
+    def __contains__(self, key):
+        return key in self.summaries
+
+    @staticmethod
+    def key(strategy, fingerprint, DRAWDOWN_TOLERANCE):
+        """
+        :param strategy: a strategy instance (e.g. DCA)
+        :param fingerprint: the data_fingerprint of the klines and signal
+        """
+        cls = type(strategy)
+        record = {'data': fingerprint, 'DRAWDOWN_TOLERANCE': DRAWDOWN_TOLERANCE,
+                  'class': cls.__module__ + '.' + cls.__qualname__, 'params': python_params(strategy.get_params),
+                  'tracking': getattr(strategy, 'tracking', 'full')}
+        return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+    def keys(self, strategy_dic, klines, signal, DRAWDOWN_TOLERANCE):
+        """:return: a dict with the key of every strategy of strategy_dic"""
+        fingerprint = data_fingerprint(klines, signal)
+        return {name: self.key(strategy, fingerprint, DRAWDOWN_TOLERANCE) for name, strategy in strategy_dic.items()}
+
+    def get(self, key):
+        """:return: the summary as a pd.Series, like summary_strategy"""
+        return pd.Series({name: _decode(value) for name, value in self.summaries[key].items()})
+
+    def put(self, key, summary, strategy=None):
+        """Append the summary (a pd.Series made by summary_strategy) of a strategy"""
+        record = {'key': key, 'summary': {name: _encode(value) for name, value in summary.items()}}
+        if strategy is not None:
+            record['params'] = python_params(strategy.get_params)
+        line = json.dumps(record, default=str)
+        with open(self.path, 'ab+') as f:
+            # una escritura interrumpida deja la ultima linea incompleta: la siguiente empieza en una linea nueva
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write(line.encode() + b'\n')
+        self.summaries[key] = record['summary']
@@ -0,0 +1,92 @@
+"""
+checkpoint.py
+
+This file contains the checkpoints of incremental backtests: the state of the strategies after the first N klines
+(closed deals, open position, weighted price, drawdown and pending safe orders) is saved in a compressed .npz
+file, and when new klines are appended the backtest resumes from bar N instead of running the whole history
+again. The deals are the same than a full run over all the klines, as long as the first N klines and the values
+of the signal over them didn't change (checked with the data_fingerprint of cache.py).
+
+Usage:
+  strategies = spawn_strategy(DCA, candidates)
+  deals = eval_strategies(strategies, OHLC, SIGNAL, DRAWDOWN_TOLERANCE=-0.35, mode='event')
+  save_checkpoint('output_data/checkpoint.npz', strategies, OHLC, SIGNAL, DRAWDOWN_TOLERANCE=-0.35)
+  ... (the klines of the new day appended to OHLC and SIGNAL computed again)
+  deals = resume('output_data/checkpoint.npz', OHLC, SIGNAL, mode='event')
+"""
+import json
+import os
+import numpy as np
+from .backtesting import as_klines, backtesting, backtesting_batch
+from .cache import data_fingerprint, python_params
+from .strategy import DCA
+
+STRATEGIES = {'DCA': DCA}
+
+
+def save_checkpoint(path, strategy_dic, OHLC, signal, DRAWDOWN_TOLERANCE):
+    """
+    Save the state of the strategies after they ran over all the klines of OHLC. The strategies must hold their
+    own state (backtesting or eval_strategies with n_jobs=1)
+    :param strategy_dic: a dict of strategies implementing checkpoint (e.g. DCA)
+    :param OHLC: the klines the strategies ran over, a dataframe or a Klines instance
+    :param signal: the signal the strategies ran with
+    """
+    klines = as_klines(OHLC)
+    info = {'bar': len(klines), 'fingerprint': data_fingerprint(klines, signal),
+            'DRAWDOWN_TOLERANCE': DRAWDOWN_TOLERANCE, 'strategies': {}}
+    arrays = {}
+    for name, strategy in strategy_dic.items():
+        state = strategy.checkpoint()
+        info['strategies'][name] = {'class': type(strategy).__name__, 'params': python_params(state['params']),
+                                    'tracking': state['tracking'], 'unit': state['unit'], 'tz': state['tz']}
+        for table in ['deals', 'orders', 'so_magazine']:
+            for column, values in state[table].items():
+                arrays['/'.join([name, table, column])] = values
+    # se escribe en un archivo temporal para no dejar un checkpoint incompleto
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, info=np.array(json.dumps(info)), **arrays)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    """
+    :return: a dict with the restored strategies and a dict with the information of the checkpoint: the number of
+    klines processed (bar), the data_fingerprint of the klines and the signal, and the DRAWDOWN_TOLERANCE
+    """
+    with np.load(path) as data:
+        info = json.loads(data['info'].item())
+        strategy_dic = {}
+        for name, meta in info.pop('strategies').items():
+            state = dict(meta)
+            for table in ['deals', 'orders', 'so_magazine']:
+                prefix = name + '/' + table + '/'
+                state[table] = {key[len(prefix):]: data[key] for key in data.files if key.startswith(prefix)}
+            strategy_dic[name] = STRATEGIES[state.pop('class')].restore(state)
+    return strategy_dic, info
+
+
+def resume(path, OHLC, signal, mode='bar', save=True):
+    """
+    Resume the strategies of a checkpoint over the klines appended since it was saved
+    :param OHLC: all the klines, the ones of the checkpoint followed by the new ones
+    :param signal: the signal over all the klines
+    :param mode: backtesting mode, 'bar', 'event' or 'batch' (all the strategies resume in the same pass)
+    :param save: replace the checkpoint with the state after the new klines
+    :return: a dictionary with the deals of each strategy over all the klines
+    """
+    klines = as_klines(OHLC)
+    signal = np.asarray(signal, dtype=bool)
+    strategy_dic, info = load_checkpoint(path)
+    start, DRAWDOWN_TOLERANCE = info['bar'], info['DRAWDOWN_TOLERANCE']
+    if start > len(klines) or data_fingerprint(klines.window(0, start), signal[:start]) != info['fingerprint']:
+        raise ValueError('The first {} klines or their signal changed since the checkpoint was saved'.format(start))
+    if mode == 'batch':
+        output = dict(backtesting_batch(strategy_dic, klines, signal, DRAWDOWN_TOLERANCE, start))
+    else:
+        output = {name: backtesting(strategy, klines, signal, DRAWDOWN_TOLERANCE, mode, start)
+                  for name, strategy in strategy_dic.items()}
+    if save:
+        save_checkpoint(path, strategy_dic, klines, signal, DRAWDOWN_TOLERANCE)
+    return output
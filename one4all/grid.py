@@ -0,0 +1,213 @@
+"""
+grid.py
+
+This file contains a grid search runner that splits a parameter sweep into shards, so it can run on several
+machines (or processes) reading the same data. Every shard writes the summaries of its strategies to a partial
+result file (a ResultCache, see cache.py) as they finish, and the merge step assembles the run_multiple_strategies
+table of the whole grid. A failed or interrupted shard is re-run on its own, skipping the strategies it finished.
+
+The grid is described by a JSON spec:
+  {"strategy": "DCA",
+   "param_grid": {"TP": [0.5, 1], "bo_size": [10], "so_qty": [2, 4], ...},
+   "data": {"store": "store", "symbol": "ETHUSDT", "start": "2022-01-01", "end": "2022-01-10 23:59:00"},
+   "signal": {"signals": [{"name": "boll", "TIMEFRAME_LENGTH": 15}, {"name": "boll", "TIMEFRAME_LENGTH": 60}],
+              "min_count": 1},
+   "DRAWDOWN_TOLERANCE": -0.35, "mode": "event", "dedup": "exact"}
+
+data is a KlineStore (see store.py) or {"csv": path, "nrows": n} with the format of engine/sample_data. The
+signals are compute_boll_signal ("boll") or compute_rsi_signal ("rsi") combined with combine_signals, without
+signal the strategies open a deal ASAP. With "summary_only": true the shards summary the deals as they're made
+instead of building their reports (see DealSummary in reports.py).
+
+Usage:
+  python -m one4all.grid run spec.json --shard 0 --shards 4 --out output_data/sweep --n-jobs 8
+  python -m one4all.grid merge spec.json --out output_data/sweep
+  python -m one4all.grid local spec.json --shards 4 --out output_data/sweep
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+from .backtesting import as_klines, group_equivalent_strategies, run_multiple_strategies, summary_table
+from .cache import ResultCache, data_fingerprint
+from .profiling import Profiler, measure
+from .signals import combine_signals, compute_boll_signal, compute_rsi_signal
+from .store import KlineStore
+from .strategy import DCA
+from .utils import ParameterGrid, iter_spawn_strategy, spawn_strategy
+
+STRATEGIES = {'DCA': DCA}
+
+
+def read_spec(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_ohlc(data):
+    """The OHLC dataframe of the data entry of a spec"""
+    if 'store' in data:
+        return KlineStore(data['store']).frame(data['symbol'], data.get('start'), data.get('end'))
+    OHLC = pd.read_csv(data['csv'], parse_dates=['open_time'], index_col='open_time', nrows=data.get('nrows'),
+                       usecols=['open_time', 'open', 'high', 'low', 'close'])
+    OHLC.columns = ['Open', 'High', 'Low', 'Close']
+    return OHLC.loc[data.get('start'):data.get('end')]
+
+
+def build_signal(OHLC, spec):
+    """The bool signal array of the signal entry of a spec"""
+    if spec is None:
+        return np.ones(OHLC.shape[0], dtype=bool)
+    columns = {}
+    for params in spec['signals']:
+        params = dict(params)
+        name = params.pop('name')
+        if name == 'boll':
+            columns.update(compute_boll_signal(OHLC, **params))
+        elif name == 'rsi':
+            columns['RSI' + str(params['TIMEFRAME_LENGTH'])] = compute_rsi_signal(OHLC, **params)
+        else:
+            raise ValueError('Unknown signal {!r}, expected boll or rsi'.format(name))
+    signals = pd.DataFrame(columns, index=OHLC.index)
+    return combine_signals(signals, min_count=spec.get('min_count'), windows=spec.get('windows')).to_numpy()
+
+
+def shard_path(out, k, n, extension):
+    return os.path.join(out, 'shard-{}-of-{}.{}'.format(k, n, extension))
+
+
+def run_shard(spec, k, n, out, n_jobs=1, profiler=None):
+    """
+    Backtest the k-th of n shards of the grid (see ParameterGrid.shard). The summaries are appended to
+    shard-k-of-n.jsonl and shard-k-of-n.json is written when the shard is complete
+    :param spec: a grid spec (a dict, see the module docstring)
+    :param profiler: a Profiler measuring the data load, the signal build and the sweep
+    :return: the number of strategies of the shard
+    """
+    os.makedirs(out, exist_ok=True)
+    start = time.time()
+    grid = ParameterGrid(spec['param_grid'])
+    strategy_dic = dict(iter_spawn_strategy(STRATEGIES[spec.get('strategy', 'DCA')], grid.shard(k, n)))
+    with measure(profiler, 'load'):
+        OHLC = load_ohlc(spec['data'])
+        klines = as_klines(OHLC)
+    with measure(profiler, 'signal'):
+        signal = build_signal(OHLC, spec.get('signal'))
+    if strategy_dic:
+        run_multiple_strategies(strategy_dic, klines, signal, spec.get('DRAWDOWN_TOLERANCE', -0.35),
+                                mode=spec.get('mode', 'bar'), n_jobs=n_jobs, cache=shard_path(out, k, n, 'jsonl'),
+                                dedup=spec.get('dedup'), profiler=profiler,
+                                summary_only=spec.get('summary_only', False))
+    manifest = {'shard': k, 'shards': n, 'strategies': len(strategy_dic),
+                'fingerprint': data_fingerprint(klines, signal), 'seconds': round(time.time() - start, 2)}
+    tmp = shard_path(out, k, n, 'json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, shard_path(out, k, n, 'json'))
+    return len(strategy_dic)
+
+
+def missing_shards(out, n):
+    """The shards without a complete manifest"""
+    return [k for k in range(n) if not os.path.isfile(shard_path(out, k, n, 'json'))]
+
+
+def merge_shards(spec, out, n):
+    """
+    Assemble the run_multiple_strategies table of the whole grid from the partial result files of the n shards
+    :return: a pd.DataFrame with the summary and the parameters of every strategy by column
+    """
+    missing = missing_shards(out, n)
+    if missing:
+        raise FileNotFoundError('Shards {} of {} are not complete in {}'.format(missing, n, out))
+    fingerprints = set()
+    for k in range(n):
+        with open(shard_path(out, k, n, 'json')) as f:
+            fingerprints.add(json.load(f)['fingerprint'])
+    if len(fingerprints) != 1:
+        raise ValueError('The shards were run over different klines or signals')
+    fingerprint = fingerprints.pop()
+    caches = [ResultCache(shard_path(out, k, n, 'jsonl')) for k in range(n)]
+
+    strategy_dic = spawn_strategy(STRATEGIES[spec.get('strategy', 'DCA')], ParameterGrid(spec['param_grid']))
+    dedup = spec.get('dedup')
+    if dedup is None:
+        groups = {name: [name] for name in strategy_dic}
+    else:
+        groups = group_equivalent_strategies(strategy_dic, scale=dedup == 'scale')
+    tolerance = spec.get('DRAWDOWN_TOLERANCE', -0.35)
+    summaries = {}
+    for names in groups.values():
+        # con dedup solo el representante de cada grupo dentro de su shard tiene resumen
+        summary = None
+        for name in names:
+            key = ResultCache.key(strategy_dic[name], fingerprint, tolerance)
+            cache = next((c for c in caches if key in c), None)
+            if cache is not None:
+                summary = cache.get(key)
+                break
+        if summary is None:
+            raise KeyError('No summary of the strategies {} in the shards'.format(names))
+        for name in names:
+            summaries[name] = summary.copy()
+    return summary_table(summaries, strategy_dic)
+
+
+def run_local(spec_path, n, out, n_jobs=1):
+    """
+    Launch the n shards as local processes and wait for them
+    :return: the shards that failed
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+    processes = [subprocess.Popen([sys.executable, '-m', 'one4all.grid', 'run', spec_path, '--shard', str(k),
+                                   '--shards', str(n), '--out', out, '--n-jobs', str(n_jobs)], env=env)
+                 for k in range(n)]
+    return [k for k, process in enumerate(processes) if process.wait() != 0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sharded grid search of a strategy')
+    parser.add_argument('command', choices=['run', 'merge', 'local'],
+                        help='run a shard, merge the shards or run every shard as a local process and merge them')
+    parser.add_argument('spec', help='the JSON grid spec')
+    parser.add_argument('--out', required=True, help='the directory of the partial result files')
+    parser.add_argument('--shard', type=int, help='the shard to run (run)')
+    parser.add_argument('--shards', type=int, required=True, help='the number of shards')
+    parser.add_argument('--n-jobs', type=int, default=1, help='worker processes by shard, -1 uses every core')
+    parser.add_argument('--csv', help='where to save the merged table, by default <out>/result.csv')
+    args = parser.parse_args(argv)
+    spec = read_spec(args.spec)
+    if args.command == 'run':
+        if args.shard is None:
+            parser.error('run requires --shard')
+        profiler = Profiler()
+        count = run_shard(spec, args.shard, args.shards, args.out, args.n_jobs, profiler)
+        profiler.to_json(shard_path(args.out, args.shard, args.shards, 'profile.json'))
+        print('Shard {} of {}: {} strategies, {:.0f} bars/sec'.format(args.shard, args.shards, count,
+                                                                      profiler.to_dict()['bars_per_sec'] or 0))
+        return 0
+    if args.command == 'local':
+        failed = run_local(args.spec, args.shards, args.out, args.n_jobs)
+        if failed:
+            print('Failed shards: {}, re-run them with: python -m one4all.grid run {} --shard K --shards {} --out {}'
+                  .format(failed, args.spec, args.shards, args.out))
+            return 1
+    missing = missing_shards(args.out, args.shards)
+    if missing:
+        print('Shards not complete: {}'.format(missing))
+        return 1
+    results = merge_shards(spec, args.out, args.shards)
+    path = args.csv or os.path.join(args.out, 'result.csv')
+    results.to_csv(path)
+    print('{} strategies merged into {}'.format(results.shape[1], path))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+ledger.py
+
+This file contains a compact columnar store for the deals and orders produced by the backtester.
+"""
+import numpy as np
+import pandas as pd
+
+NAT = np.iinfo(np.int64).min
+
+
+class GrowableArray:
+    """
+    Append-only typed numpy array, the capacity is doubled when it is full. It records if every appended value
+    was an integer, so float columns filled with integers can be read back as integers.
+    """
+
+    def __init__(self, dtype, capacity=16):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+        self.integer = True
+
+    def append(self, value):
+        if self.size == self.data.shape[0]:
+            self.data = np.concatenate([self.data, np.empty_like(self.data)])
+        self.data[self.size] = value
+        self.size += 1
+        if self.integer and not isinstance(value, (int, np.integer)):
+            self.integer = False
+
+    def extend(self, values):
+        values = np.asarray(values)
+        if values.shape[0] == 0:
+            return
+        if self.size + values.shape[0] > self.data.shape[0]:
+            capacity = max(2 * self.data.shape[0], self.size + values.shape[0])
+            self.data = np.concatenate([self.data[:self.size], np.empty(capacity - self.size, self.data.dtype)])
+        self.data[self.size:self.size + values.shape[0]] = values
+        self.size += values.shape[0]
+        self.integer = self.integer and values.dtype.kind in 'iu'
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
+
+
+class DealLedger:
+    """
+    Append-only columnar store of deals (positions) and their orders. Every column is a typed numpy array,
+    dates are stored as int64 nanoseconds (NaT for missing dates) and the orders of the i-th deal are the rows
+    order_offsets[i]:order_offsets[i + 1] of the order columns.
+
+    Usage:
+      ledger = DealLedger.from_positions(strategy.strategy_pos)
+      report = make_report(ledger)
+    """
+    ORDER_COLUMNS = {'size': np.float64, 'price': np.float64, 'date': np.int64,
+                     'bt_price': np.float64, 'bt_price_index': np.float64, 'bt_date': np.int64}
+    DEAL_COLUMNS = {'order_start': np.int64, 'closed': np.bool_, 'pos': np.float64, 'weighted_price': np.float64,
+                    'TP': np.float64, 'TP_price': np.float64, 'dd_price': np.float64, 'dd_date': np.int64,
+                    'dd_pct_float': np.float64}
+    DATE_COLUMNS = ['date', 'bt_date', 'dd_date']
+    # per-deal lists with one value by order: the order column of every list
+    NESTED_COLUMNS = {'trigger_prices': 'price', 'trigger_dates': 'date', 'price_best_try': 'bt_price_index',
+                      'date_best_try': 'bt_date'}
+
+    def __init__(self):
+        self.orders = {name: GrowableArray(dtype) for name, dtype in self.ORDER_COLUMNS.items()}
+        self.deals = {name: GrowableArray(dtype) for name, dtype in self.DEAL_COLUMNS.items()}
+        # unit and timezone of the stored dates, taken from the first pd.Timestamp appended
+        self.unit = None
+        self.tz = None
+
+    @classmethod
+    def from_positions(cls, strategy_pos):
+        """
+        :param strategy_pos: a list received from the backtester with position objects
+        :return: a DealLedger with the deals
+        """
+        ledger = cls()
+        ledger.extend(strategy_pos)
+        return ledger
+
+    def __len__(self):
+        return len(self.deals['order_start'])
+
+    def _date(self, date):
+        if date is None or date is pd.NaT:
+            return NAT
+        if isinstance(date, pd.Timestamp):
+            if self.unit is None:
+                self.unit, self.tz = date.unit, date.tz
+            return date.value
+        return int(date)
+
+    @staticmethod
+    def _values(column):
+        if column.integer and column.data.dtype == np.float64:
+            return column.values.astype(np.int64)
+        return column.values
+
+    def extend(self, strategy_pos):
+        """Append a list of Position objects, collecting the columns in a single pass"""
+        deals = {name: [] for name in self.DEAL_COLUMNS}
+        orders = {name: [] for name in self.ORDER_COLUMNS}
+        start = len(self.orders['size'])
+        for pos in strategy_pos:
+            deals['order_start'].append(start)
+            start += len(pos.order_list)
+            deals['closed'].append(pos.closed)
+            deals['pos'].append(pos.pos)
+            deals['weighted_price'].append(pos.weighted_price)
+            deals['TP'].append(pos.TP)
+            deals['TP_price'].append(pos.TP_price)
+            deals['dd_price'].append(pos.dd_price)
+            deals['dd_date'].append(pos.dd_date)
+            deals['dd_pct_float'].append(pos.dd_pct_float)
+            for o in pos.order_list:
+                orders['size'].append(o.size)
+                orders['price'].append(o.price)
+                orders['date'].append(o.date)
+                orders['bt_price'].append(o.bt_price)
+                orders['bt_price_index'].append(o.bt_price_index)
+                orders['bt_date'].append(o.bt_date)
+        for table, columns in [(self.deals, deals), (self.orders, orders)]:
+            for name, values in columns.items():
+                if name in self.DATE_COLUMNS:
+                    values = np.array([self._date(date) for date in values], dtype=np.int64)
+                table[name].extend(values)
+
+    def order_column(self, name):
+        return self._values(self.orders[name])
+
+    def deal_column(self, name):
+        return self._values(self.deals[name])
+
+    @property
+    def order_offsets(self):
+        """Offsets of the orders of each deal, with len(self) + 1 values"""
+        return np.append(self.deal_column('order_start'), len(self.orders['size']))
+
+    def to_dates(self, values):
+        """Convert int64 dates into a pd.DatetimeIndex with the unit and timezone of the appended dates"""
+        if self.unit is None:
+            return values
+        dates = pd.DatetimeIndex(np.asarray(values).view('datetime64[ns]'))
+        if self.tz is not None:
+            dates = dates.tz_localize('UTC').tz_convert(self.tz)
+        return dates.as_unit(self.unit)
+
+    def nested(self, name, as_str=False, deals=None):
+        """
+        Materialize one of the per-deal lists of make_report ('trigger_prices', 'trigger_dates', 'price_best_try'
+        or 'date_best_try') with one value by order
+        :param name: the nested column name
+        :param as_str: give every list as a str
+        :param deals: positions of the deals to materialize, all of them by default
+        :return: a list with a value by deal
+        """
+        column = self.NESTED_COLUMNS[name]
+        values = self.order_column(column)
+        if column in self.DATE_COLUMNS:
+            values = self.to_dates(values)
+        elif column == 'price':
+            values = np.round(values, 2)
+        # slicing a list of scalars is cheaper than slicing the array (or DatetimeIndex) for every deal
+        values = list(values)
+        offsets = self.order_offsets.tolist()
+        deals = range(len(self)) if deals is None else deals
+        nested = [values[offsets[i]:offsets[i + 1]] for i in deals]
+        return [str(x) for x in nested] if as_str else nested
+
+    def nbytes(self):
+        """Memory used by the stored columns"""
+        return sum(column.data.nbytes for column in list(self.orders.values()) + list(self.deals.values()))
@@ -0,0 +1,167 @@
+"""
+live.py
+
+This file contains a streaming runner that advances a strategy kline by kline from a feed (live or paper trading),
+instead of backtesting it over a complete OHLC dataframe.
+
+Usage:
+  runner = LiveRunner(DCA(**params), signal=StreamBollSignal(TIMEFRAME_LENGTH=15), on_event=print)
+  asyncio.run(runner.run(replay_csv('sample_data/ETHUSDT_010122_150122.csv')))
+  print(runner.latency())
+"""
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+from .backtesting import Klines, early_stop
+from .ledger import GrowableArray
+
+
+class KlineBuffer(Klines):
+    """
+    Klines receiving one kline at a time. The OHLC arrays double their capacity when they are full, so appending
+    a kline is O(1) and the strategies read it with the same bar index than in backtesting.
+    """
+
+    def __init__(self, capacity=1024):
+        empty = np.empty(capacity)
+        super().__init__(empty, empty.copy(), empty.copy(), empty.copy(), [])
+        self.size = 0
+
+    def append(self, open_time, open_price, high, low, close):
+        """Append a kline and return its bar index"""
+        if self.size == self.open.shape[0]:
+            self.open, self.high, self.low, self.close = [np.concatenate([x, np.empty_like(x)])
+                                                          for x in (self.open, self.high, self.low, self.close)]
+        i = self.size
+        self.open[i], self.high[i], self.low[i], self.close[i] = open_price, high, low, close
+        self.index.append(open_time)
+        self.size += 1
+        return i
+
+    def __len__(self):
+        return self.size
+
+    def to_frame(self):
+        """The received klines as an OHLC dataframe"""
+        n = self.size
+        return pd.DataFrame({'Open': self.open[:n], 'High': self.high[:n], 'Low': self.low[:n],
+                             'Close': self.close[:n]}, index=pd.DatetimeIndex(self.index, name='open_time'))
+
+
+async def replay_csv(path, delay=0, nrows=None, chunksize=10000):
+    """
+    Replay the klines of a CSV with the format of engine/sample_data (open_time, open, high, low, close, ...),
+    standing in for the klines websocket of the exchange
+    :param path: the CSV path
+    :param delay: seconds to wait between klines, 0 gives control back to the event loop without waiting
+    :param nrows: read just the first nrows klines
+    :return: an async iterator of (open_time, open, high, low, close) tuples
+    """
+    for chunk in pd.read_csv(path, parse_dates=['open_time'], nrows=nrows, chunksize=chunksize,
+                             usecols=['open_time', 'open', 'high', 'low', 'close']):
+        for kline in chunk[['open_time', 'open', 'high', 'low', 'close']].itertuples(index=False, name=None):
+            yield kline
+            await asyncio.sleep(delay)
+
+
+async def queue_source(queue):
+    """
+    Read (open_time, open, high, low, close) klines from an asyncio.Queue until a None is received, e.g. filled
+    by the callback of an exchange websocket
+    """
+    while True:
+        kline = await queue.get()
+        if kline is None:
+            return
+        yield kline
+
+
+class LiveRunner:
+    """
+    Advance a strategy (e.g. DCA) kline by kline. Every kline is appended to a KlineBuffer and the strategy
+    evaluates it with strategy.next, exactly like backtesting() does, so the deals are the same than
+    backtesting the received klines. The orders are emitted as events when they happen and the processing time
+    of every kline is recorded.
+
+    The events are dicts with the keys event ('open', 'safe_order', 'close' or 'early_stop'), bar, date, price
+    and size.
+    """
+
+    def __init__(self, strategy, signal=None, DRAWDOWN_TOLERANCE=-0.35, on_event=None, capacity=1024):
+        """
+        :param strategy: a strategy implementing next (e.g. DCA)
+        :param signal: a streaming signal with an update(open_time, open, high, low, close) method returning a
+        bool (see streaming.py), None is a signal always True (ASAP)
+        :param on_event: a function called with every event
+        """
+        self.strategy = strategy
+        self.signal = signal
+        self.DRAWDOWN_TOLERANCE = DRAWDOWN_TOLERANCE
+        self.on_event = on_event
+        self.klines = KlineBuffer(capacity)
+        self.events = []
+        self.latency_ns = GrowableArray(np.int64, capacity)
+        self.stopped = False
+
+    def emit(self, event, bar, date, price, size):
+        event = {'event': event, 'bar': bar, 'date': date, 'price': price, 'size': size}
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def on_kline(self, open_time, open_price, high, low, close):
+        """
+        Process a kline
+        :return: False once the strategy was early stopped
+        """
+        if self.stopped:
+            return False
+        start = time.perf_counter_ns()
+        strategy = self.strategy
+        i = self.klines.append(open_time, open_price, high, low, close)
+        signal = True if self.signal is None else self.signal.update(open_time, open_price, high, low, close)
+        positions = len(strategy.strategy_pos)
+        orders = len(strategy.strategy_pos[-1].order_list) if positions else 0
+        strategy.next(i, self.klines, signal)
+        if len(strategy.strategy_pos) > positions:
+            orders = 0
+        if strategy.strategy_pos:
+            pos = strategy.strategy_pos[-1]
+            for k in range(orders, len(pos.order_list)):
+                order = pos.order_list[k]
+                if k == 0:
+                    event = 'open'
+                elif pos.closed and k == len(pos.order_list) - 1:
+                    event = 'close'
+                else:
+                    event = 'safe_order'
+                self.emit(event, i, order.date, order.price, order.size)
+        if early_stop(strategy, self.DRAWDOWN_TOLERANCE):
+            pos = strategy.strategy_pos[-1]
+            self.emit('early_stop', i, pos.dd_date, pos.dd_price, pos.pos)
+            self.stopped = True
+        self.latency_ns.append(time.perf_counter_ns() - start)
+        return not self.stopped
+
+    async def run(self, source):
+        """
+        Consume an async iterator of (open_time, open, high, low, close) klines until it ends or the strategy is
+        early stopped
+        :return: the strategy_pos of the strategy
+        """
+        async for kline in source:
+            if not self.on_kline(*kline):
+                break
+        return self.strategy.strategy_pos
+
+    def latency(self):
+        """Summary of the processing time by kline in microseconds"""
+        latency = self.latency_ns.values / 1e3
+        if latency.shape[0] == 0:
+            return {'klines': 0}
+        return {'klines': latency.shape[0],
+                'mean_us': round(float(latency.mean()), 2),
+                'p50_us': round(float(np.percentile(latency, 50)), 2),
+                'p99_us': round(float(np.percentile(latency, 99)), 2),
+                'max_us': round(float(latency.max()), 2)}
@@ -0,0 +1,129 @@
+"""
+profiling.py
+
+This file contains the instrumentation of the sweeps: the time spent in every phase (data load, signal build,
+simulation, report and summary) in total and by strategy, and counters by strategy (bars processed, bars/sec,
+orders filled, deals closed and early stops). Without a Profiler nothing is measured.
+
+Usage:
+  profiler = Profiler(hooks=[lambda event, info: logger.debug('%s %s', event, info)])
+  with profiler.phase('load'):
+      OHLC = ...
+  with profiler.phase('signal'):
+      SIGNAL = ...
+  eval = run_multiple_strategies(strategies, OHLC, SIGNAL, profiler=profiler, progress=None)
+  profiler.to_frame()
+  profiler.to_json('output_data/profile.json')
+"""
+from contextlib import contextmanager, nullcontext
+import json
+import time
+import pandas as pd
+from .ledger import DealLedger
+from .reports import DealSummary
+
+PHASES = ('load', 'signal', 'simulation', 'report', 'summary')
+
+
+def print_progress(done, total):
+    """Default progress callback of the sweeps: print the percentage of strategies done every two strategies"""
+    if done % 2 == 0:
+        print('Progress:', round(done / total, 4) * 100)
+
+
+def measure(profiler, phase, strategy=None):
+    """profiler.phase(phase, strategy), or a context doing nothing when profiler is None"""
+    return nullcontext() if profiler is None else profiler.phase(phase, strategy)
+
+
+def deal_counters(deals, klines, DRAWDOWN_TOLERANCE):
+    """
+    Counters of the deals of a strategy
+    :param deals: the strategy_pos (a list of Position), a DealLedger or a DealSummary
+    :param klines: the Klines backtested
+    :return: a dict with the bars processed, the orders filled (base and safe orders), the deals closed and
+    early_stop (True when the strategy stopped by drawdown)
+    """
+    if isinstance(deals, DealSummary):
+        n_deals, closed = len(deals), deals.closed
+        orders = deals.orders - closed
+        last_dd = (deals.last_dd_pct, deals.last_dd_date) if n_deals else None
+    elif isinstance(deals, DealLedger):
+        n_deals, closed = len(deals), int(deals.deal_column('closed').sum())
+        orders = len(deals.orders['size']) - closed
+        last_dd = (deals.deal_column('dd_pct_float')[-1], deals.to_dates(deals.deal_column('dd_date')[-1:])[0]) \
+            if n_deals else None
+    else:
+        n_deals, closed = len(deals), sum(pos.closed for pos in deals)
+        orders = sum(len(pos.order_list) for pos in deals) - closed
+        last_dd = (deals[-1].dd_pct_float, deals[-1].dd_date) if n_deals else None
+    bars = len(klines)
+    stopped = last_dd is not None and last_dd[0] < DRAWDOWN_TOLERANCE
+    if stopped:
+        # la estrategia se detiene en la kline del drawdown
+        bars = int(pd.Index(klines.index).searchsorted(last_dd[1], side='right'))
+    return {'bars': bars, 'orders_filled': int(orders), 'deals_closed': int(closed), 'early_stop': bool(stopped)}
+
+
+class Profiler:
+    """
+    Collect the time of the phases of a sweep and the counters of every strategy. The hooks are functions called
+    with (event, info) as soon as something is measured:
+     - ('phase', {'phase', 'seconds', 'strategy'}): a phase finished, strategy is None for the phases of the sweep
+     - ('strategy', {'strategy', 'bars', 'orders_filled', 'deals_closed', 'early_stop'}): a strategy was simulated
+    """
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.phases = {}
+        self.strategies = {}
+
+    @contextmanager
+    def phase(self, phase, strategy=None):
+        """Measure the block as a phase (see PHASES), of the whole sweep or of a strategy"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start, strategy)
+
+    def add(self, phase, seconds, strategy=None):
+        """Add seconds to a phase"""
+        total = self.phases.setdefault(phase, {'seconds': 0.0, 'calls': 0})
+        total['seconds'] += seconds
+        total['calls'] += 1
+        if strategy is not None:
+            stats = self.strategies.setdefault(strategy, {})
+            stats[phase + '_seconds'] = stats.get(phase + '_seconds', 0.0) + seconds
+        self.emit('phase', {'phase': phase, 'seconds': seconds, 'strategy': strategy})
+
+    def count(self, strategy, counters):
+        """Record the counters of a strategy (see deal_counters)"""
+        self.strategies.setdefault(strategy, {}).update(counters)
+        self.emit('strategy', dict(counters, strategy=strategy))
+
+    def emit(self, event, info):
+        for hook in self.hooks:
+            hook(event, info)
+
+    def to_frame(self):
+        """A pd.DataFrame with a row by strategy: the counters, the seconds by phase and bars_per_sec"""
+        frame = pd.DataFrame.from_dict(self.strategies, orient='index')
+        if 'bars' in frame and 'simulation_seconds' in frame:
+            frame['bars_per_sec'] = frame['bars'] / frame['simulation_seconds']
+        return frame
+
+    def to_dict(self):
+        """The phases totals and the strategies stats, with the bars/sec of the whole simulation"""
+        bars = sum(stats.get('bars', 0) for stats in self.strategies.values())
+        seconds = self.phases.get('simulation', {}).get('seconds', 0.0)
+        return {'phases': self.phases, 'strategies': self.strategies,
+                'bars_per_sec': bars / seconds if seconds else None}
+
+    def to_json(self, path=None):
+        """The to_dict as a JSON string, saved in path when it's given"""
+        text = json.dumps(self.to_dict(), indent=2, default=str)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
@@ -4,77 +4,87 @@ reports.py
 This file contains reporting functions.
 """
 from typing import List, Union, Any
+import copy
 import pandas as pd
 import numpy as np
 from pandas import DataFrame
+from .ledger import DealLedger
 #from one4all.backtesting import Position
 
 
-def make_report(strategy_pos, last_close_price = 800) -> DataFrame:
+def format_pct(pct, decimals=2):
     """
-    Extract the closed deals' information from strategy_position
+    Format a percentage for display or export, e.g. -3.2149 -> '-3.21%'
+    :param pct: a float percentage
+    :return: a str
+    """
+    return ''.join([str(round(pct, decimals)), '%'])
+
+
+def make_report(strategy_pos, last_close_price = 800, tracking='full', format_pct_drawdown=False,
+                lazy_nested=False) -> DataFrame:
+    """
+    Extract the closed deals' information from strategy_position. The positions are collected into a
+    DealLedger in a single pass and every column is computed over its arrays.
     :type strategy_pos: Position
-    :param strategy_pos: a list received from the backtester with position objects
+    :param strategy_pos: a list received from the backtester with position objects, or a DealLedger
     :param last_close_price:
+    :param tracking: the tracking level used by the strategy ('full', 'drawdown' or 'none'), the drawdown and
+    best_try columns not tracked are left out of the report
+    :param format_pct_drawdown: give pct_drawdown as strings (e.g. '-3.21%') for display or export, by default
+    it's a float with the drawdown percentage
+    :param lazy_nested: leave out the per-deal lists (trigger_prices, trigger_dates, price_best_try and
+    date_best_try) and give the order_start/order_end offsets of each deal instead, the lists are materialized on
+    request with DealLedger.nested
     :return: a pd.DataFrame with summary metrics
     """
-    close_deal = strategy_pos
-    duration = [pos.order_list[-1].date - pos.order_list[0].date for pos in close_deal]
+    ledger = strategy_pos
+    if not isinstance(ledger, DealLedger):
+        ledger = DealLedger.from_positions(strategy_pos)
+    offsets = ledger.order_offsets
+    first, last = offsets[:-1], offsets[1:] - 1
+    size, price = ledger.order_column('size'), ledger.order_column('price')
+    order_date = ledger.to_dates(ledger.order_column('date'))
+    pos, TP = ledger.deal_column('pos'), ledger.deal_column('TP')
 
-    # dummy variable indicating if the position is closed (open-close order)
-    is_close = [1 if pos.is_closed() else 0 for pos in strategy_pos]
     # get open/close dates
-    open_date = [pos.order_list[0].date for pos in close_deal]
-    close_date = [pos.order_list[-1].date for pos in close_deal]
-    # get open/close price
-    open_price = [pos.order_list[0].price for pos in close_deal]
-    close_price = [round(pos.order_list[-1].price, 2) for pos in close_deal]
-    # get deal/order size
-    deal_size = [abs(pos.order_list[-1].size) for pos in close_deal]
-    order_size = [len(pos.order_list) for pos in close_deal]
-    # get safeorder info for each deal: trigger prices and dates
-    trigger_prices = [str([round(o.price, 2) for o in pos.order_list]) for pos in close_deal]
-    trigger_dates = [str([o.date for o in pos.order_list]) for pos in close_deal]
-
+    open_date, close_date = order_date[first], order_date[last]
     # compute p&l
-    pnl_usd = [abs(pos.pos) * pos.weighted_price * pos.TP / 100 for pos in close_deal]
-    #pnl_coinM: List[Union[float, Any]] = [abs(pos.pos) * pos.TP / 100 for pos in close_deal]
-    pnl_coinM = [abs(pos.pos) * pos.TP / 100 for pos in close_deal]
-    pnl_pct = [pos.TP for pos in close_deal]
-
-    # extract drawdown info per deal
-    date_drawdown = [pos.drawdown['date'] for pos in close_deal]
-    price_drawdown = [pos.drawdown['price'] for pos in close_deal]
-    pct_drawdown = [pos.drawdown['pct'] for pos in close_deal]
-
-    # extract best_try info per deal
-    price_best_try = [[o.best_try['price_index'] for o in pos.order_list] for pos in close_deal]
-    date_best_try = [[o.best_try['date'] for o in pos.order_list] for pos in close_deal]
-
+    pnl_coinM = np.abs(pos) * TP / 100
     # OJO: utiliza la instancia de strategy para obtener el ultimo precio utilizado
     # Se utiliza el argumento last_close_price
-    current_usd = [coin * last_close_price for coin in pnl_coinM]
-
-    report = pd.DataFrame({'open_date': open_date,
-                           'close_date': close_date,
-                           'is_close': is_close,
-                           'duration': duration,
-                           'order_size': order_size,
-                           'open_price': open_price,
-                           'close_price': close_price,
-                           'deal_size': deal_size,
-                           'pnl_usd': pnl_usd,
-                           'pnl_coinM': pnl_coinM,
-                           'pnl_pct': pnl_pct,
-                           'coin_pnl_at_current_usd': current_usd,
-                           'trigger_prices': trigger_prices,
-                           'trigger_dates': trigger_dates,
-                           'date_drawdown': date_drawdown,
-                           'price_drawdown': price_drawdown,
-                           'pct_drawdown': pct_drawdown,
-                           'price_best_try': price_best_try,
-                           'date_best_try': date_best_try
-                           })
+    report = {'open_date': open_date,
+              'close_date': close_date,
+              # dummy variable indicating if the position is closed (open-close order)
+              'is_close': ledger.deal_column('closed').astype(np.int64),
+              'duration': close_date - open_date,
+              'order_size': np.diff(offsets),
+              'open_price': price[first],
+              'close_price': np.round(price[last], 2),
+              'deal_size': np.abs(size[last]),
+              'pnl_usd': np.abs(pos) * ledger.deal_column('weighted_price') * TP / 100,
+              'pnl_coinM': pnl_coinM,
+              'pnl_pct': TP,
+              'coin_pnl_at_current_usd': pnl_coinM * last_close_price}
+    if lazy_nested:
+        report['order_start'], report['order_end'] = first, offsets[1:]
+    else:
+        # get safeorder info for each deal: trigger prices and dates
+        report['trigger_prices'] = ledger.nested('trigger_prices', as_str=True)
+        report['trigger_dates'] = ledger.nested('trigger_dates', as_str=True)
+    if tracking != 'none':
+        # extract drawdown info per deal
+        report['date_drawdown'] = ledger.to_dates(ledger.deal_column('dd_date'))
+        report['price_drawdown'] = ledger.deal_column('dd_price')
+        report['pct_drawdown'] = ledger.deal_column('dd_pct_float') * 100
+    if tracking == 'full' and not lazy_nested:
+        # extract best_try info per deal
+        report['price_best_try'] = ledger.nested('price_best_try')
+        report['date_best_try'] = ledger.nested('date_best_try')
+    report = pd.DataFrame(report)
+    if format_pct_drawdown and 'pct_drawdown' in report:
+        report['pct_drawdown'] = [0 if pd.isna(date) else format_pct(pct)
+                                  for date, pct in zip(report.date_drawdown, report.pct_drawdown)]
     report['num_safe_order'] = report.order_size - 2
     if np.any(report.is_close == 0):
         report.iloc[-1, -1] += 1
@@ -97,8 +107,15 @@ def summary_strategy(report, MIN_CAPITAL, LEVERAGE=1):
     pct_pnl = report.pnl_coinM.sum() / REQ_CAPITAL * 100
     daily_pct_pnl = pct_pnl / N_DAYS
     bh_return =round((report.close_price.iloc[-1] / report.open_price.iloc[0] - 1)*100,3) * LEVERAGE
-    max_drawdown = report.pct_drawdown.apply(lambda x: float(str(x).replace('%', ''))).min()
-    avg_drawdown = round(report.pct_drawdown.apply(lambda x: float(str(x).replace('%', ''))).mean(), 4)
+    # reports made without drawdown tracking have no pct_drawdown column
+    max_drawdown, avg_drawdown = np.nan, np.nan
+    if 'pct_drawdown' in report:
+        pct_drawdown = report.pct_drawdown
+        if not pd.api.types.is_numeric_dtype(pct_drawdown):
+            # reports with formatted drawdown ('-3.21%')
+            pct_drawdown = pd.to_numeric(pct_drawdown.astype(str).str.rstrip('%'))
+        max_drawdown = round(pct_drawdown.min(), 2)
+        avg_drawdown = round(pct_drawdown.mean(), 4)
     avg_so = round(report.num_safe_order.mean(), 2)
     max_so = report.num_safe_order.max()
     avg_deal_duration = (report.close_date - report.open_date).mean().total_seconds() / 86400 # seconds in a day
@@ -110,4 +127,110 @@ def summary_strategy(report, MIN_CAPITAL, LEVERAGE=1):
           'avg_so': avg_so, 'max_so': max_so, 'num_deals': report.shape[0],
           'avg_deal_duration': round(avg_deal_duration, 2),
           'max_deal_duration': round(max_deal_duration, 2)}
-    return pd.Series(df)
\ No newline at end of file
+    return pd.Series(df)
+
+class DealSummary:
+    """
+    Online version of make_report + summary_strategy: the statistics of summary_strategy (sums, min, max and
+    counts) are updated with each deal as it's added, without keeping the positions or building a report, so the
+    memory doesn't depend on the number of deals. The values are the ones of summary_strategy up to the floating
+    point rounding of the sums.
+
+    Usage:
+      summary = DealSummary(tracking='full')
+      for pos in strategy.strategy_pos:
+          summary.add(pos)
+      summary.summary(MIN_CAPITAL=strategy.compute_min_capital())
+    """
+
+    def __init__(self, tracking='full'):
+        self.tracking = tracking
+        self.num_deals = 0
+        self.closed = 0
+        self.orders = 0
+        self.start = self.end = None
+        self.open_price = self.close_price = None
+        # sumas compensadas (Neumaier): [suma, compensacion]
+        self.pnl_coinM = [0.0, 0.0]
+        self.pct_drawdown = [0.0, 0.0]
+        self.max_drawdown = np.inf
+        self.last_dd_pct, self.last_dd_date = None, None
+        # safe orders: the last deal gets one more when a deal is open (see make_report)
+        self.num_safe_order = 0
+        self.max_so = -np.inf
+        self.last_so = None
+        self.is_open = False
+        self.deal_duration = 0
+        self.max_deal_duration = None
+
+    def __len__(self):
+        return self.num_deals
+
+    @staticmethod
+    def _add(total, value):
+        s = total[0] + value
+        if abs(total[0]) >= abs(value):
+            total[1] += (total[0] - s) + value
+        else:
+            total[1] += (value - s) + total[0]
+        total[0] = s
+
+    def add(self, pos):
+        """Add a deal (a Position), the deals are added in the order they were opened"""
+        first, last = pos.order_list[0], pos.order_list[-1]
+        if self.num_deals == 0:
+            self.start, self.open_price = first.date, first.price
+        else:
+            self.max_so = max(self.max_so, self.last_so)
+        self.num_deals += 1
+        self.closed += bool(pos.closed)
+        self.is_open = self.is_open or not pos.closed
+        self.orders += len(pos.order_list)
+        self.end, self.close_price = last.date, last.price
+        self._add(self.pnl_coinM, abs(pos.pos) * pos.TP / 100)
+        pct_drawdown = pos.dd_pct_float * 100
+        self._add(self.pct_drawdown, pct_drawdown)
+        self.max_drawdown = min(self.max_drawdown, pct_drawdown)
+        self.last_dd_pct, self.last_dd_date = pos.dd_pct_float, pos.dd_date
+        self.last_so = len(pos.order_list) - 2
+        self.num_safe_order += self.last_so
+        duration = last.date - first.date
+        self.deal_duration += duration.value if isinstance(duration, pd.Timedelta) else duration
+        if self.max_deal_duration is None or duration > self.max_deal_duration:
+            self.max_deal_duration = duration
+
+    def completed(self, strategy_pos):
+        """A copy with the positions still held by the strategy added (the last deal, open or not)"""
+        summary = copy.copy(self)
+        summary.pnl_coinM, summary.pct_drawdown = list(self.pnl_coinM), list(self.pct_drawdown)
+        for pos in strategy_pos:
+            summary.add(pos)
+        return summary
+
+    def summary(self, MIN_CAPITAL, LEVERAGE=1):
+        """
+        :return: the pd.Series of summary_strategy over the report of the added deals
+        """
+        if self.num_deals == 0:
+            raise ValueError('No deals to summary')
+        REQ_CAPITAL = MIN_CAPITAL / LEVERAGE
+        duration = self.end - self.start
+        N_DAYS = duration.total_seconds() / 86400
+        # numpy division as summary_strategy: inf when REQ_CAPITAL is 0
+        pct_pnl = np.float64(sum(self.pnl_coinM)) / REQ_CAPITAL * 100
+        bh_return = round((round(self.close_price, 2) / self.open_price - 1) * 100, 3) * LEVERAGE
+        max_drawdown, avg_drawdown = np.nan, np.nan
+        if self.tracking != 'none':
+            max_drawdown = round(self.max_drawdown, 2)
+            avg_drawdown = round(sum(self.pct_drawdown) / self.num_deals, 4)
+        last_so = self.last_so + self.is_open
+        avg_deal_duration = pd.Timedelta(self.deal_duration / self.num_deals).total_seconds() / 86400
+        df = {'start': self.start, 'end': self.end, 'duration': duration,
+              'leverage': str(LEVERAGE), 'pl_ret': round(pct_pnl, 4),
+              'bh_ret': bh_return, 'daily_pl_ret': round(pct_pnl / N_DAYS, 4),
+              'max_drawdown': max_drawdown, 'avg_drawdown': avg_drawdown,
+              'avg_so': round((self.num_safe_order + self.is_open) / self.num_deals, 2),
+              'max_so': max(self.max_so, last_so), 'num_deals': self.num_deals,
+              'avg_deal_duration': round(avg_deal_duration, 2),
+              'max_deal_duration': round(self.max_deal_duration.total_seconds() / 86400, 2)}
+        return pd.Series(df)
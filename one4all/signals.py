@@ -4,7 +4,7 @@ signals.py
 This file contains signal functions to enter into the market.
 """
 from typing import List
-from one4all.utils import transform_timeframe
+from one4all.utils import transform_timeframe, RESAMPLE_CACHE
 import numpy as np
 import pandas as pd
 import ta as ta
@@ -20,6 +20,16 @@ def SMA(x, MA_LENGTH=14):
     return x.rolling(window=MA_LENGTH, closed='right').mean()
 
 
+def resample(OHLC, TIMEFRAME_LENGTH, cache=RESAMPLE_CACHE):
+    """
+    transform_timeframe drawing from a ResampleCache, shared by default by every signal function
+    :param cache: a ResampleCache, or None to transform OHLC without caching
+    """
+    if cache is None:
+        return transform_timeframe(OHLC, TIMEFRAME_LENGTH)
+    return cache.transform(OHLC, TIMEFRAME_LENGTH)
+
+
 def bollinger_bands_series(x, MA_LENGTH=20, SD_DEV=2.0):
     """
     Compute and return upper and lower bollinger band using as the typical price
@@ -52,7 +62,7 @@ def bollinger_bands_series(x, MA_LENGTH=20, SD_DEV=2.0):
     #                     'BOLU': bolu})
 
 
-def bollinger_bands_OHLC(OHLC, TIMEFRAME_LENGTH=60, MA_LENGTH=20, SD_DEV=2.0):
+def bollinger_bands_OHLC(OHLC, TIMEFRAME_LENGTH=60, MA_LENGTH=20, SD_DEV=2.0, cache=RESAMPLE_CACHE):
     """
     Compute and return upper and lower bollinger band using as the typical price
     the close price.
@@ -63,10 +73,11 @@ def bollinger_bands_OHLC(OHLC, TIMEFRAME_LENGTH=60, MA_LENGTH=20, SD_DEV=2.0):
     :param OHLC: A pd.DataFrame containing kline information with open, high, low and close prices in each row
     :param TIMEFRAME_LENGTH: The timeframe length for each kline applied previous to compute bollinger band information
     :param MA_LENGTH: Number of klines used for computing the aggregate metrics
+    :param cache: the ResampleCache used to transform OHLC, None to disable it
     :return: a pd.DataFrame with the close price moving average, the lower and upper bollinger bands
     """
     # transform OHLC to the specified timeframe length
-    data = transform_timeframe(OHLC, TIMEFRAME_LENGTH)
+    data = resample(OHLC, TIMEFRAME_LENGTH, cache)
 
     # use as a typical price the close price
     tp = data['Close']
@@ -88,28 +99,60 @@ def bollinger_bands_OHLC(OHLC, TIMEFRAME_LENGTH=60, MA_LENGTH=20, SD_DEV=2.0):
                          'BOLU': bolu})
 
 
-def compute_boll_signal(OHLC, TIMEFRAME_LENGTH, MA=20, SD_DEV=2.0):
+def boll_reentry(close, boll):
+    """
+    State machine of the bollinger re-entry computed with array operations: a close below the lower band arms the
+    signal, and the first close above the band after that fires it and disarms it.
+
+    :param close: a np.array with the close prices
+    :param boll: a np.array with the lower band at the same klines (NaN closes or bands are ignored)
+    :return: a bool np.array, True where the signal fires
+    """
+    close = np.asarray(close, dtype=np.float64)
+    boll = np.asarray(boll, dtype=np.float64)
+    below = close < boll
+    above = close > boll
+    # posicion del ultimo cierre (por debajo o por encima de la banda) anterior a cada kline
+    decisive = np.where(below | above, np.arange(close.shape[0]), -1)
+    previous = np.maximum.accumulate(np.concatenate([[-1], decisive]))[:-1]
+    armed = (previous >= 0) & below[np.maximum(previous, 0)]
+    return above & armed
+
+
+def boll_signal(OHLC, boll, index):
+    """
+    Re-entry signal over the lower bollinger band evaluated at the given klines of OHLC.
+
+    :param OHLC: a pd.DataFrame with the close prices
+    :param boll: the lower band values
+    :param index: the positions of OHLC where each band value was computed
+    :return: a bool list with the same length that the number of rows of OHLC
+    """
+    index = np.asarray(index)
+    SIGNAL = np.zeros(OHLC.shape[0], dtype=bool)
+    SIGNAL[index[boll_reentry(OHLC['Close'].to_numpy()[index], boll)]] = True
+    return SIGNAL.tolist()
+
+
+def compute_boll_signal(OHLC, TIMEFRAME_LENGTH, MA=20, SD_DEV=2.0, cache=RESAMPLE_CACHE):
     """
+    The signal is set at the first 1 minute kline after the closing of the TIMEFRAME_LENGTH kline where the
+    re-entry happens (see boll_reentry). A re-entry at the last kline falls outside OHLC and it's dropped.
 
     :param OHLC: kline information in minutes with open, high, low and close prices
     :param TIMEFRAME_LENGTH: the length for aggregate klines before computing the signal
+    :param cache: the ResampleCache used to transform OHLC, None to disable it
     :return: a signal list with the same length that the number of rows of the given OHLC input
     """
-    SIGNAL = [False for x in range(OHLC.shape[0])]
-    AUX = False
     TRANS = TIMEFRAME_LENGTH
-    OHLC_TRANS = transform_timeframe(OHLC, TIMEFRAME_LENGTH=TRANS)
+    OHLC_TRANS = resample(OHLC, TRANS, cache)
     boll = bollinger_bands_series(OHLC_TRANS['Close'], MA_LENGTH=MA, SD_DEV=SD_DEV)
-    for i in range(len(boll)):
-        BOLL = boll[i]
-        CLOSE = OHLC_TRANS.loc[boll.index[i]]['Close']
-        if (AUX == False) and (CLOSE < BOLL):
-            # Preparar terreno para evaluar re-ingreso
-            AUX = True
-        elif AUX and (CLOSE > BOLL):
-            # Evaluar re-ingreso
-            SIGNAL[OHLC.loc[:boll.index[i], :].shape[0] + (TRANS - 1)] = True
-            AUX = False
+    close = OHLC_TRANS['Close'].loc[boll.index]
+    reentry = boll.index[boll_reentry(close.to_numpy(), boll.to_numpy())]
+    # numero de klines de 1 minuto hasta la apertura de cada kline, mas el largo del timeframe
+    positions = OHLC.index.searchsorted(reentry, side='right') + (TRANS - 1)
+    SIGNAL = np.zeros(OHLC.shape[0], dtype=bool)
+    SIGNAL[positions[positions < OHLC.shape[0]]] = True
     SIGNAL_DF = pd.DataFrame({'BB' + str(TRANS): SIGNAL})
     SIGNAL_DF.index = OHLC.index
     return SIGNAL_DF
@@ -119,6 +162,18 @@ def compute_boll_signal(OHLC, TIMEFRAME_LENGTH, MA=20, SD_DEV=2.0):
     #                     'signal': signal})
 
 
+def _like(signal, values):
+    """Give values as a pd.Series with the index and name of signal when signal is a pd.Series"""
+    if isinstance(signal, pd.Series):
+        return pd.Series(values, index=signal.index, name=signal.name)
+    return values
+
+
+def _last_true(values):
+    """Position of the last True up to each element (-1 before the first True)"""
+    return np.maximum.accumulate(np.where(values, np.arange(values.shape[0]), -1))
+
+
 def project_signal_to(signal, n_min):
     """
     Project True over the following n_min forward, usually the number of minute in which
@@ -128,88 +183,173 @@ def project_signal_to(signal, n_min):
     :param n_min: project signal to n_min forward
     :return: bool pd.Series with the same length but signal projected n_min
     """
-    projected_signal = signal.copy()
-    # get the indices in which the signal is true
-    true_indices = np.where(projected_signal)[0]
-    # project the signal during n_min forward
-    for index in true_indices:
-        projected_signal.iloc[index:(index + n_min)] = True
-    return projected_signal
+    values = np.asarray(signal, dtype=bool)
+    # distancia al ultimo True: la señal se proyecta mientras sea menor a n_min
+    last = _last_true(values)
+    projected = values | ((last >= 0) & (np.arange(values.shape[0]) - last < n_min))
+    return _like(signal, projected)
+
 
+def hold_signal(signal, n_min):
+    """
+    True only where the signal has been True over the last n_min consecutive klines
 
-def RSI(OHLC, MA_LENGTH=14, RSI_LENGTH=14):
+    :param signal: a bool pd.Series (or np.array) with a signal
+    :param n_min: number of consecutive klines required
+    :return: a bool signal like the given one
     """
-    No da igual que tradingview, implementar manual la exponential moving average
-    que utiliza Pine (ver al final de este archivo).
-    Por ahora se esta utilizando ta.momentum.rsi() de la libreria
-    de analisis tecnico:
-    https://technical-analysis-library-in-python.readthedocs.io/en/latest/
+    values = np.asarray(signal, dtype=bool)
+    run = np.arange(values.shape[0]) - _last_true(~values)
+    return _like(signal, values & (run >= n_min))
 
-    Ver ademas esta implementacion del rsi (tp da igual):
-    https://github.com/lukaszbinden/rsi_tradingview/blob/main/rsi.py
 
-    :param OHLC:
-    :param MA_LENGTH:
-    :param RSI_LENGTH:
-    :return:
+def first_in_window(signal, n_min):
     """
-    close_price = OHLC['Close']
-    delta = close_price.diff()
+    Keep a True only if there isn't another True over the n_min - 1 previous klines, i.e. the first signal of
+    every cluster
 
-    up, down = delta.copy(), delta.copy()
-    ALPHA = 2 / (RSI_LENGTH + 1)
-    # ALPHA = 1 / RSI_LENGTH
+    :param signal: a bool pd.Series (or np.array) with a signal
+    :param n_min: length of the window
+    :return: a bool signal like the given one
+    """
+    values = np.asarray(signal, dtype=bool)
+    previous = np.concatenate([[-1], _last_true(values)[:-1]])
+    first = values & ((previous < 0) | (np.arange(values.shape[0]) - previous >= n_min))
+    return _like(signal, first)
 
-    up[up < 0] = 0
-    up = pd.Series.ewm(up, alpha=ALPHA, adjust=False).mean()
 
-    down[down > 0] = 0
-    down *= -1
-    down = pd.Series.ewm(down, alpha=ALPHA, adjust=False).mean()
+def cooldown_signal(signal, n_min):
+    """
+    Keep a True and drop the following Trues over its n_min klines window [i, i + n_min); unlike first_in_window
+    a dropped True doesn't extend the cooldown. The loop is over the kept signals, not over the klines.
 
-    rsi = np.where(up == 0, 0, np.where(down == 0, 100, 100 - (100 / (1 + up / down))))
+    :param signal: a bool pd.Series (or np.array) with a signal
+    :param n_min: length of the cooldown
+    :return: a bool signal like the given one
+    """
+    values = np.asarray(signal, dtype=bool)
+    true_indices = np.flatnonzero(values)
+    kept = np.zeros(values.shape[0], dtype=bool)
+    j = 0
+    while j < true_indices.shape[0]:
+        kept[true_indices[j]] = True
+        j = np.searchsorted(true_indices, true_indices[j] + max(n_min, 1), side='left')
+    return _like(signal, kept)
 
-    ema = pd.Series.ewm(close_price, alpha=ALPHA, adjust=False).mean()
-    return ta.momentum.rsi(close_price, window=RSI_LENGTH)
 
+def combine_signals(signals, min_count=None, windows=None):
+    """
+    Combine signals from different timeframes: True where at least min_count of them are True, after projecting
+    the signals given in windows.
 
-def compute_rsi_signal(OHLC, TIMEFRAME_LENGTH, RSI_LENGTH=14, RSI_OBJ=70, LOWER_THAN=True):
+    Usage:
+      SPIKE_AND30_60 = combine_signals(SIGNAL_DF[['BB30', 'BB60']], windows={'BB60': 60})
+      SPIKE_OR = combine_signals(SIGNAL_DF, min_count=1)
+
+    :param signals: a pd.DataFrame with a bool signal by column
+    :param min_count: number of signals that must be True, all of them by default (AND). Use 1 for OR
+    :param windows: a dict with the columns to project and the minutes (see project_signal_to)
+    :return: a bool pd.Series with the index of signals
+    """
+    windows = {} if windows is None else windows
+    count = np.zeros(signals.shape[0], dtype=np.int64)
+    for column in signals.columns:
+        values = np.asarray(signals[column], dtype=bool)
+        if column in windows:
+            values = project_signal_to(values, windows[column])
+        count += values
+    min_count = signals.shape[1] if min_count is None else min_count
+    return pd.Series(count >= min_count, index=signals.index)
+
+
+def signal_and(signals, windows=None):
+    """All the signals are True, see combine_signals"""
+    return combine_signals(signals, windows=windows)
+
+
+def signal_or(signals, windows=None):
+    """Any of the signals is True, see combine_signals"""
+    return combine_signals(signals, min_count=1, windows=windows)
+
+
+def RMA(x, LENGTH=14):
+    """
+    Running moving average of Pine (ta.rma): an exponential moving average with alpha = 1 / LENGTH seeded with the
+    simple moving average of the first LENGTH values.
+    :param x: a np.array, the values before the first non NA are ignored
+    :param LENGTH: the window length
+    :return: a np.array with NA before the seed
+    """
+    x = np.asarray(x, dtype=np.float64)
+    rma = np.full(x.shape[0], np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    if valid.shape[0] == 0 or valid[0] + LENGTH > x.shape[0]:
+        return rma
+    seed = valid[0] + LENGTH - 1
+    values = np.concatenate([[x[valid[0]:seed + 1].mean()], x[seed + 1:]])
+    rma[seed:] = pd.Series(values).ewm(alpha=1 / LENGTH, adjust=False).mean().to_numpy()
+    return rma
+
+
+RSI_METHODS = ('ta', 'rma')
+
+
+def RSI(OHLC, MA_LENGTH=14, RSI_LENGTH=14, method='ta'):
+    """
+    Relative strength index of the close prices.
+      - method='ta': ta.momentum.rsi() de la libreria de analisis tecnico
+        (https://technical-analysis-library-in-python.readthedocs.io/en/latest/)
+      - method='rma': the Wilder RSI of tradingview (ta.rsi of Pine), averaging the gains and losses with RMA
+
+    :param OHLC: a pd.DataFrame with the close prices
+    :param MA_LENGTH: not used, kept for compatibility
+    :param RSI_LENGTH: the window length of the RSI
+    :param method: 'ta' or 'rma'
+    :return: a pd.Series with the RSI, with the index of OHLC
     """
+    close_price = OHLC['Close']
+    if method == 'ta':
+        return ta.momentum.rsi(close_price, window=RSI_LENGTH)
+    if method != 'rma':
+        raise ValueError('Unknown RSI method {!r}, expected one of {}'.format(method, RSI_METHODS))
+    delta = np.diff(close_price.to_numpy(dtype=np.float64), prepend=np.nan)
+    up = RMA(np.where(np.isnan(delta), np.nan, np.maximum(delta, 0)), RSI_LENGTH)
+    down = RMA(np.where(np.isnan(delta), np.nan, np.maximum(-delta, 0)), RSI_LENGTH)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(down == 0, 100, np.where(up == 0, 0, 100 - (100 / (1 + up / down))))
+    rsi[np.isnan(up) | np.isnan(down)] = np.nan
+    return pd.Series(rsi, index=close_price.index, name='rsi')
+
+
+def compute_rsi_signal(OHLC, TIMEFRAME_LENGTH, RSI_LENGTH=14, RSI_OBJ=70, LOWER_THAN=True, cache=RESAMPLE_CACHE,
+                       method='ta'):
+    """
+    When the RSI of a TIMEFRAME_LENGTH kline is lower (or greater) than RSI_OBJ, the signal is True over the
+    TIMEFRAME_LENGTH 1 minute klines before the opening of the next kline. The last kline has no next kline and
+    doesn't set the signal.
+
     TODO: revisar el numero de NA que se utilizan en la ventana para computar el RSI;
     Deberian ser eliminados? Deberian quedar como NA? Ver las mismas consecuencias en el calculo de las bollinger
     cuando el numero de observaciones en menor a la ventana especificada.
-    :param OHLC:
-    :param TIMEFRAME_LENGTH:
-    :param RSI_LENGTH:
-    :param RSI_OBJ:
-    :param LOWER_THAN:
-    :return:
-    """
-    # Se utiliza el largo completo inicial del OHLC independiente de en cuanto se transforma el timestamp
-    SIGNAL = [False for _ in range(OHLC.shape[0])]
-    print(len(SIGNAL))
+    :param OHLC: kline information in minutes with open, high, low and close prices
+    :param TIMEFRAME_LENGTH: the length for aggregate klines before computing the signal
+    :param RSI_LENGTH: the window length of the RSI
+    :param RSI_OBJ: the RSI threshold
+    :param LOWER_THAN: set the signal when the RSI is lower than RSI_OBJ, otherwise when it's greater
+    :param cache: the ResampleCache used to transform OHLC, None to disable it
+    :param method: the RSI implementation, see RSI
+    :return: a bool pd.Series with the index of OHLC
+    """
     TRANS = TIMEFRAME_LENGTH
-    OHLC_TRANS = transform_timeframe(OHLC, TIMEFRAME_LENGTH=TRANS)
-    rsi_series = RSI(OHLC_TRANS, RSI_LENGTH=RSI_LENGTH)
-    AUX = False
-    for i in range(len(rsi_series)):
-        RSI_I = rsi_series[i]
-        if AUX:
-            UNTIL = OHLC.loc[:rsi_series.index[i], :].shape[0] - 1
-            FROM = UNTIL - TRANS
-            #FROM = OHLC.loc[:rsi_series.index[i], :].shape[0] - 1
-            #UNTIL = FROM + TRANS + 1
-            if UNTIL > OHLC.shape[0]:
-                UNTIL = OHLC.shape[0]
-            # SIGNAL[OHLC.loc[:rsi_series.index[i], :].shape[0]] = AUX
-            SIGNAL[FROM:UNTIL] = [True for _ in range(UNTIL - FROM)]
-            AUX = False
-        if LOWER_THAN:
-            if RSI_I < RSI_OBJ:
-                AUX = True
-        else:
-            if RSI_I > RSI_OBJ:
-                AUX = True
-    SIGNAL = pd.Series(SIGNAL)
+    OHLC_TRANS = resample(OHLC, TRANS, cache)
+    rsi = RSI(OHLC_TRANS, RSI_LENGTH=RSI_LENGTH, method=method).to_numpy()
+    hit = rsi[:-1] < RSI_OBJ if LOWER_THAN else rsi[:-1] > RSI_OBJ
+    # la ventana termina en la kline de 1 minuto anterior a la apertura de la kline siguiente
+    UNTIL = OHLC.index.searchsorted(OHLC_TRANS.index[1:][hit], side='right') - 1
+    FROM = np.maximum(UNTIL - TRANS, 0)
+    coverage = np.zeros(OHLC.shape[0] + 1, dtype=np.int64)
+    np.add.at(coverage, FROM, 1)
+    np.add.at(coverage, UNTIL, -1)
+    SIGNAL = pd.Series(np.cumsum(coverage[:-1]) > 0)
     SIGNAL.index = OHLC.index
     return SIGNAL
@@ -0,0 +1,186 @@
+"""
+store.py
+
+This file contains a columnar kline store: the klines of every symbol are saved once as binary arrays (int64
+open_time in nanoseconds and float64 or float32 OHLCV) that are memory-mapped when they are read, so loading a date
+range is a binary search over open_time and slicing, without parsing a CSV.
+
+Usage:
+  store = KlineStore('store')
+  store.from_csv('ETHUSDT', 'sample_data/ETHUSDT_010122_150122.csv')
+  OHLC = store.frame('ETHUSDT', '2022-01-02 00:00:00', '2022-01-08 23:59:00')
+
+  python -m one4all.store store ETHUSDT sample_data/ETHUSDT_010122_150122.csv --float32
+"""
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from .backtesting import Klines
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class KlineStore:
+    """
+    A directory with a subdirectory by symbol holding a <column>.bin file by column and a meta.json with the
+    number of stored klines, the dtype of the prices and the timezone of open_time
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, d, 'meta.json')))
+
+    def path(self, symbol, name):
+        return os.path.join(self.root, symbol, name)
+
+    def meta(self, symbol):
+        with open(self.path(symbol, 'meta.json')) as f:
+            return json.load(f)
+
+    def _write_meta(self, symbol, meta):
+        tmp = self.path(symbol, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.path(symbol, 'meta.json'))
+
+    def length(self, symbol):
+        return self.meta(symbol)['length']
+
+    def append(self, symbol, OHLC, dtype='float64'):
+        """
+        Append klines to a symbol, creating it when it doesn't exist. The klines at or before the last stored
+        open_time are skipped, so a refreshed download can be appended again.
+        :param OHLC: a dataframe with Open, High, Low, Close (and optionally Volume) columns and an open_time
+        DatetimeIndex
+        :param dtype: 'float64' or 'float32', the dtype of the prices of a new symbol
+        :return: the number of klines appended
+        """
+        index = pd.DatetimeIndex(OHLC.index)
+        if not index.is_monotonic_increasing or index.has_duplicates:
+            raise ValueError('The klines must be sorted by open_time without duplicates')
+        if os.path.isfile(self.path(symbol, 'meta.json')):
+            meta = self.meta(symbol)
+        else:
+            os.makedirs(os.path.join(self.root, symbol), exist_ok=True)
+            meta = {'length': 0, 'dtype': np.dtype(dtype).name, 'tz': None if index.tz is None else str(index.tz),
+                    'columns': [c for c in COLUMNS if c in OHLC.columns]}
+            for name in ['open_time'] + meta['columns']:
+                open(self.path(symbol, name + '.bin'), 'wb').close()
+        if (index.tz is None) != (meta['tz'] is None):
+            raise ValueError('The timezone of open_time ({}) differs from the stored one ({})'.format(index.tz,
+                                                                                                     meta['tz']))
+        open_time = (index if index.tz is None else index.tz_convert('UTC')).as_unit('ns').asi8
+        if meta['length']:
+            last = self.arrays(symbol, start=meta['length'] - 1)['open_time'][0]
+            new = open_time > last
+            open_time, OHLC = open_time[new], OHLC[new]
+        if open_time.shape[0] == 0:
+            return 0
+        columns = {'open_time': open_time}
+        columns.update({c: OHLC[c].to_numpy(dtype=meta['dtype']) for c in meta['columns']})
+        # los arrays se escriben antes que meta.json: un append interrumpido no cambia el largo almacenado
+        for name, values in columns.items():
+            with open(self.path(symbol, name + '.bin'), 'r+b') as f:
+                f.truncate(meta['length'] * values.dtype.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(values).tobytes())
+        meta['length'] += open_time.shape[0]
+        self._write_meta(symbol, meta)
+        return open_time.shape[0]
+
+    def from_csv(self, symbol, path, dtype='float64', chunksize=1000000):
+        """
+        Convert (or append) a kline CSV with the format of engine/sample_data: open_time, open, high, low,
+        close and volume columns
+        :return: the number of klines appended
+        """
+        appended = 0
+        for chunk in pd.read_csv(path, parse_dates=['open_time'], index_col='open_time', chunksize=chunksize,
+                                 usecols=['open_time', 'open', 'high', 'low', 'close', 'volume']):
+            chunk.columns = COLUMNS
+            appended += self.append(symbol, chunk, dtype=dtype)
+        return appended
+
+    def search(self, symbol, start=None, end=None):
+        """
+        Positions [first, last) of the klines with start <= open_time <= end, like OHLC.loc[start:end]
+        :param start: a date (str or pd.Timestamp), None is the first kline
+        :param end: a date (str or pd.Timestamp), None is the last kline
+        """
+        meta = self.meta(symbol)
+        open_time = self._memmap(symbol, 'open_time', np.int64, meta['length'])
+        first = 0 if start is None else int(np.searchsorted(open_time, self._epoch(start, meta), side='left'))
+        last = meta['length'] if end is None else int(np.searchsorted(open_time, self._epoch(end, meta),
+                                                                      side='right'))
+        return first, max(first, last)
+
+    @staticmethod
+    def _epoch(date, meta):
+        date = pd.Timestamp(date)
+        if meta['tz'] is not None:
+            date = date.tz_localize(meta['tz']) if date.tz is None else date
+            date = date.tz_convert('UTC')
+        return date.as_unit('ns').value
+
+    def _memmap(self, symbol, name, dtype, length):
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path(symbol, name + '.bin'), dtype=dtype, mode='r', shape=(length,))
+
+    def arrays(self, symbol, start=None, end=None):
+        """
+        Read-only memory-mapped views of a symbol. start and end are dates (see search) or kline positions
+        :return: a dict with the open_time (int64 nanoseconds) and price arrays
+        """
+        meta = self.meta(symbol)
+        if isinstance(start, (int, np.integer)) or isinstance(end, (int, np.integer)):
+            first, last = start or 0, meta['length'] if end is None else end
+        else:
+            first, last = self.search(symbol, start, end)
+        arrays = {'open_time': self._memmap(symbol, 'open_time', np.int64, meta['length'])[first:last]}
+        for c in meta['columns']:
+            arrays[c] = self._memmap(symbol, c, meta['dtype'], meta['length'])[first:last]
+        return arrays
+
+    def index(self, symbol, open_time):
+        """open_time as a DatetimeIndex with the timezone of the symbol"""
+        meta = self.meta(symbol)
+        index = pd.DatetimeIndex(np.asarray(open_time).view('datetime64[ns]'), name='open_time')
+        if meta['tz'] is not None:
+            index = index.tz_localize('UTC').tz_convert(meta['tz'])
+        return index
+
+    def frame(self, symbol, start=None, end=None):
+        """
+        The klines between start and end as an OHLC dataframe with an open_time index. The price columns are the
+        memory-mapped arrays, they are not copied
+        """
+        arrays = self.arrays(symbol, start, end)
+        index = self.index(symbol, arrays.pop('open_time'))
+        return pd.DataFrame(arrays, index=index, copy=False)
+
+    def klines(self, symbol, start=None, end=None):
+        """The klines between start and end as a Klines instance for backtesting"""
+        arrays = self.arrays(symbol, start, end)
+        return Klines(arrays['Open'], arrays['High'], arrays['Low'], arrays['Close'],
+                      self.index(symbol, arrays['open_time']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert (or append) a kline CSV into a KlineStore')
+    parser.add_argument('root', help='the store directory')
+    parser.add_argument('symbol')
+    parser.add_argument('csv', nargs='+', help='CSV files with the format of engine/sample_data')
+    parser.add_argument('--float32', action='store_true', help='store the prices of a new symbol as float32')
+    args = parser.parse_args()
+    store = KlineStore(args.root)
+    for path in args.csv:
+        appended = store.from_csv(args.symbol, path, dtype='float32' if args.float32 else 'float64')
+        print('{}: {} klines appended from {}'.format(args.symbol, appended, path))
+    print('{}: {} klines stored'.format(args.symbol, store.length(args.symbol)))
@@ -4,6 +4,7 @@ strategy.py
 This file contains the classes that implement strategies for backtesting.
 """
 from .backtesting import *
+from .ledger import NAT
 
 
 class Strategy(object):
@@ -13,6 +14,8 @@ class Strategy(object):
             setattr(self, key, value)
         self.strategy_pos = []
         self.so_magazine = []
+        # summary mode: a DealSummary receiving the deals that don't change anymore (see eval_strategies)
+        self.deal_summary = None
 
     @property
     def get_params(self):
@@ -24,10 +27,23 @@ class Strategy(object):
 
 
 class DCA(Strategy):
+    """
+    Dollar cost averaging strategy. Besides the parameters in __slots__ it accepts tracking, the level of
+    instrumentation recorded in each position:
+     - 'full' (default): drawdown and best_try
+     - 'drawdown': just the drawdown (required for the early stop)
+     - 'none': nothing, the strategy is never early stopped
+    """
     __slots__ = ['TP', 'bo_size', 'long', 'size_1st_so', 'so_qty', 'so_step', 'so_step_scale', 'so_vol_scale', 'EC']
+    TRACKING_LEVELS = ('full', 'drawdown', 'none')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.tracking = kwargs.get('tracking', 'full')
+        if self.tracking not in self.TRACKING_LEVELS:
+            raise ValueError('Unknown tracking level ({!r})'.format(self.tracking))
+        self.track_dd = self.tracking != 'none'
+        self.track_bt = self.tracking == 'full'
 
     #@property
     def compute_min_capital(self):
@@ -37,23 +53,54 @@ class DCA(Strategy):
         order_size = [self.bo_size] + [self.size_1st_so * aux * self.so_vol_scale ** x for x in range(self.so_qty)]
         return sum(order_size)
 
-    def track_drawdown(self, last_OLHC):
+    def canonical_params(self, scale=True):
+        """
+        The parameters that define the simulation: DCA instances with the same canonical parameters give the same
+        deals (or, with scale, the same summary_strategy)
+         - so_vol_scale and so_step_scale don't change anything with less than two safe orders, and no safe order
+           parameter does without safe orders
+         - scaling bo_size and size_1st_so by the same factor scales pos and the pnl but not the prices (up to
+           floating point rounding), and the summary is relative to compute_min_capital: with scale both sizes are
+           replaced by size_1st_so / bo_size
+        :return: a hashable tuple of (parameter, value) pairs
+        """
+        params = self.get_params
+        if self.so_qty < 2:
+            params['so_vol_scale'] = params['so_step_scale'] = None
+        if self.so_qty == 0:
+            params['size_1st_so'] = params['so_step'] = None
+        if scale and self.bo_size > 0:
+            params['size_1st_so'] = None if self.so_qty == 0 else self.size_1st_so / self.bo_size
+            params['bo_size'] = None
+        params['tracking'] = self.tracking
+        return tuple(sorted(params.items()))
+
+    def track_drawdown(self, klines, i):
         if (len(self.strategy_pos)) != 0:
             if self.long:
-                self.strategy_pos[-1].lowest_low(last_OLHC)
+                self.strategy_pos[-1].lowest_low(klines, i)
             else:
-                self.strategy_pos[-1].highest_high(last_OLHC)
+                self.strategy_pos[-1].highest_high(klines, i)
 
-    def track_best_try(self, last_OLHC):
+    def track_best_try(self, klines, i):
         if (len(self.strategy_pos)) != 0:
             if self.long:
-                self.strategy_pos[-1].try_high(last_OLHC)
+                self.strategy_pos[-1].try_high(klines, i)
             else:
-                self.strategy_pos[-1].try_low(last_OLHC)
+                self.strategy_pos[-1].try_low(klines, i)
 
-    def open_position(self, OLHC):
+    def close_price(self):
+        """Price at which the last position is closed (self.EC incorpora la comision del exchange)"""
+        return self.strategy_pos[-1].weighted_price * (1 + (self.TP + self.EC) / 100)
+
+    def open_position(self, klines, i):
+        if self.deal_summary is not None:
+            # modo resumen: los deals anteriores ya no cambian (ni su drawdown), se acumulan y se descartan
+            for pos in self.strategy_pos:
+                self.deal_summary.add(pos)
+            self.strategy_pos.clear()
         self.strategy_pos.append(Position(self.TP))
-        self.strategy_pos[-1].new_entry(self.bo_size, OLHC['Open'][-1], OLHC.index[-1], self.TP)
+        self.strategy_pos[-1].new_entry(self.bo_size, klines.open[i], klines.index[i], self.TP)
 
     def clean_so_magazine(self):
         """
@@ -61,53 +108,397 @@ class DCA(Strategy):
         """
         self.so_magazine = [o for o in self.so_magazine if o.filled == False]
 
-    def eval_so(self, OLHC):
+    def eval_so(self, klines, i):
         if self.long:
+            low = klines.low[i]
             for o in self.so_magazine:
-                o.filled = OLHC['Low'][-1] < o.price
+                o.filled = low < o.price
                 if o.filled:
-                    self.track_best_try(OLHC.iloc[-1])
-                    self.strategy_pos[-1].new_entry(o.size, o.price, OLHC.index[-1], self.TP)
+                    if self.track_bt:
+                        self.track_best_try(klines, i)
+                    self.strategy_pos[-1].new_entry(o.size, o.price, klines.index[i], self.TP)
             self.clean_so_magazine()
         else:
+            high = klines.high[i]
             for o in self.so_magazine:
-                o.filled = OLHC['High'][-1] > o.price
+                o.filled = high > o.price
                 if o.filled:
-                    self.track_best_try(OLHC.iloc[-1])
-                    self.strategy_pos[-1].new_entry(o.size, o.price, OLHC.index[-1], self.TP)
+                    if self.track_bt:
+                        self.track_best_try(klines, i)
+                    self.strategy_pos[-1].new_entry(o.size, o.price, klines.index[i], self.TP)
             self.clean_so_magazine()
 
-    def next(self, OLHC, signal):
+    def next(self, i, klines, signal):
+        """
+        Evaluate the strategy over the i-th bar
+        :param i: the bar index (cursor) inside klines
+        :param klines: a Klines instance with the OHLC arrays
+        :param signal: the signal value for the i-th bar
+        """
         if len(self.strategy_pos) != 0:
             if not self.strategy_pos[-1].is_closed():
                 # evaluar si se puede cerrar la posicion (self.EC incorpora la comision del exchange)
-                if OLHC['High'][-1] > (self.strategy_pos[-1].weighted_price * (1 + (self.TP + self.EC) / 100)):
-                    self.track_best_try(OLHC.iloc[-1])
-                    self.strategy_pos[-1].close_entry(self.strategy_pos[-1].weighted_price * (1 + (self.TP + self.EC) / 100), OLHC.index[-1])
+                close_price = self.close_price()
+                if klines.high[i] > close_price:
+                    if self.track_bt:
+                        self.track_best_try(klines, i)
+                    self.strategy_pos[-1].close_entry(close_price, klines.index[i])
                 else:
                     # evaluar si una safe order se gatilla:
-                    self.eval_so(OLHC)
+                    self.eval_so(klines, i)
 
             else:
                 # Agregar senal para el caso ASAP, la senal es simpre True
                 if signal:
-                    self.open_position(OLHC)
-                    self.so_magazine = create_safe_order(self.so_qty, OLHC['Open'][-1], OLHC.index[-1], self.size_1st_so,
+                    self.open_position(klines, i)
+                    self.so_magazine = create_safe_order(self.so_qty, klines.open[i], klines.index[i], self.size_1st_so,
                                                          self.so_vol_scale, self.so_step, self.so_step_scale, self.long)
                     # evaluar safeorder
-                    self.eval_so(OLHC)
+                    self.eval_so(klines, i)
 
         else:
             # agregar senal: para el caso ASAP, la senal siempre es True
             if signal:
-                self.open_position(OLHC)
-                self.so_magazine = create_safe_order(self.so_qty, OLHC['Open'][-1], OLHC.index[-1], self.size_1st_so,
+                self.open_position(klines, i)
+                self.so_magazine = create_safe_order(self.so_qty, klines.open[i], klines.index[i], self.size_1st_so,
                                                      self.so_vol_scale, self.so_step, self.so_step_scale, self.long)
                 # evaluar safeorder
-                self.eval_so(OLHC)
+                self.eval_so(klines, i)
         # track drawdown
-        self.track_drawdown(OLHC.iloc[-1])
-        self.track_best_try(OLHC.iloc[-1])
+        if self.track_dd:
+            self.track_drawdown(klines, i)
+            if self.track_bt:
+                self.track_best_try(klines, i)
 
+    def next_event(self, i, klines, signal_idx):
+        """
+        Find the first bar at or after i where next() can change the strategy state: the take profit or the next
+        safe order is crossed when a position is open, otherwise the next signal. The take profit is crossed by a
+        High above the close_price, and the safe orders by a Low below them for long strategies or by a High above
+        them for short ones (see eval_so).
+        :param i: the bar index (cursor) inside klines
+        :param klines: a Klines instance with the OHLC arrays
+        :param signal_idx: sorted bar indices where the signal is True
+        :return: the bar index of the next event, or len(klines) when there is none
+        """
+        if len(self.strategy_pos) != 0 and not self.strategy_pos[-1].is_closed():
+            if self.long:
+                so_price = max(o.price for o in self.so_magazine) if len(self.so_magazine) != 0 else -np.inf
+                return klines.next_cross(i, high_above=self.close_price(), low_below=so_price)
+            so_price = min(o.price for o in self.so_magazine) if len(self.so_magazine) != 0 else np.inf
+            return klines.next_cross(i, high_above=min(self.close_price(), so_price))
+        k = np.searchsorted(signal_idx, i)
+        return int(signal_idx[k]) if k < len(signal_idx) else len(klines)
 
+    def track_range(self, start, stop, klines, DRAWDOWN_TOLERANCE):
+        """
+        Update drawdown and best_try over the bars [start, stop) where next() does not change the position. Only
+        the bar holding the final value is applied, giving the same result than tracking bar by bar.
+        :return: the bar after the last tracked one, before stop when the drawdown tolerance is broken
+        """
+        if len(self.strategy_pos) == 0 or not self.track_dd:
+            return stop
+        pos = self.strategy_pos[-1]
+        low, high = klines.low[start:stop], klines.high[start:stop]
+        if self.long:
+            breach = np.flatnonzero(low / pos.order_list[0].price - 1 < DRAWDOWN_TOLERANCE)
+        else:
+            # the drawdown of a short position grows at each new High, only the first one can break the tolerance
+            breach = np.flatnonzero(high > pos.dd_price)[:1]
+            breach = breach[high[breach] / pos.order_list[0].price - 1 < DRAWDOWN_TOLERANCE]
+        if breach.size:
+            stop = start + int(breach[0]) + 1
+            low, high = low[:stop - start], high[:stop - start]
+        # drawdown: the first bar reaching the lowest low (long) or the highest high (short)
+        self.track_drawdown(klines, start + int(low.argmin() if self.long else high.argmax()))
+        if not self.track_bt:
+            return stop
+        best = pos.order_list[-1].bt_price
+        if self.long:
+            # best_try: the last bar whose High is above the best price recorded until the previous bar
+            reached = np.minimum(np.maximum.accumulate(np.concatenate(([best], high[:-1]))), pos.TP_price)
+            updates = np.flatnonzero(high > reached)
+            if updates.size:
+                self.track_best_try(klines, start + int(updates[-1]))
+        elif low.min() < best:
+            # short: the best price is lowered by a Low below it and capped by the TP price, so the last update is
+            # the lowest Low or the last Low below the TP price
+            below = np.flatnonzero(low < pos.TP_price)
+            self.track_best_try(klines, start + max(int(below[-1]) if below.size else -1, int(low.argmin())))
+        return stop
+
+    @classmethod
+    def run_batch(cls, strategies, klines, signal, DRAWDOWN_TOLERANCE, start=0):
+        """
+        Backtest several DCA instances over the same klines and signal in a single pass (see DCABatch)
+        :return: a list with the strategy_pos of each strategy
+        """
+        return DCABatch(strategies, klines).run(signal, DRAWDOWN_TOLERANCE, start)
 
+    def checkpoint(self):
+        """
+        The state of the strategy as plain values and numpy arrays (see checkpoint.py): the parameters, the deals
+        (the open position included) as the columns of a DealLedger and the size and price of the safe orders in
+        so_magazine. The so_magazine orders are created when the last position opens, so their date is not stored
+        :return: a dict, restore builds the strategy back from it
+        """
+        ledger = DealLedger.from_positions(self.strategy_pos)
+        return {'params': self.get_params, 'tracking': self.tracking,
+                'unit': ledger.unit, 'tz': None if ledger.tz is None else str(ledger.tz),
+                'deals': {name: ledger.deal_column(name) for name in ledger.DEAL_COLUMNS},
+                'orders': {name: ledger.order_column(name) for name in ledger.ORDER_COLUMNS},
+                'so_magazine': {'size': np.array([o.size for o in self.so_magazine]),
+                                'price': np.array([o.price for o in self.so_magazine])}}
+
+    @classmethod
+    def restore(cls, state):
+        """
+        Build a strategy from its checkpoint, with the same positions, orders and so_magazine
+        :param state: a dict given by checkpoint
+        """
+        strategy = cls(**state['params'], tracking=state['tracking'])
+        ledger = DealLedger()
+        ledger.unit, ledger.tz = state['unit'], state['tz']
+
+        def column(values, dates=False):
+            if not dates:
+                return np.asarray(values).tolist()
+            missing = (np.asarray(values) == NAT).tolist()
+            return [None if m else date for m, date in zip(missing, list(ledger.to_dates(values)))]
+        deals = {name: column(values, name in ledger.DATE_COLUMNS) for name, values in state['deals'].items()}
+        orders = {name: column(values, name in ledger.DATE_COLUMNS) for name, values in state['orders'].items()}
+        offsets = deals['order_start'] + [len(orders['size'])]
+        for k in range(len(deals['order_start'])):
+            pos = Position(deals['TP'][k])
+            for name in ['pos', 'weighted_price', 'closed', 'TP_price', 'dd_price', 'dd_date', 'dd_pct_float']:
+                setattr(pos, name, deals[name][k])
+            for j in range(offsets[k], offsets[k + 1]):
+                order = Order(orders['size'][j], orders['price'][j], orders['date'][j])
+                order.bt_price, order.bt_price_index = orders['bt_price'][j], orders['bt_price_index'][j]
+                order.bt_date = orders['bt_date'][j]
+                pos.order_list.append(order)
+            strategy.strategy_pos.append(pos)
+        magazine = state['so_magazine']
+        if len(magazine['size']):
+            date = strategy.strategy_pos[-1].order_list[0].date
+            strategy.so_magazine = [Order(size, price, date) for size, price in
+                                    zip(column(magazine['size']), column(magazine['price']))]
+        return strategy
+
+
+class DCABatch:
+    """
+    Simulate N DCA strategies over the same klines and signal in a single pass. The state checked on the bars is
+    held in numpy arrays with a row by strategy:
+     - close_price: the take profit of the open position (inf without open position)
+     - so_price, pending: the safe order ladder of the last position, (N, max so_qty) arrays
+     - dd_price, dd_pct, bt_price, TP_price: the drawdown of the last position and the best_try of its last order
+    The next bar with a take profit, a fill or an opening in any strategy is found with a vectorized search, and the
+    drawdown and best_try tracking over the quiet bars in between is vectorized across the strategies, so the python
+    cost doesn't depend on the number of bars nor on N. The Position and Order objects are only written for the
+    strategies with a take profit, a fill or an opening on a bar, giving the same deals than backtesting().
+    """
+
+    def __init__(self, strategies, klines):
+        self.strategies = list(strategies)
+        self.klines = klines
+        N = len(self.strategies)
+        Q = max([s.so_qty for s in self.strategies], default=0)
+        self.long = np.array([s.long for s in self.strategies], dtype=bool)
+        self.track_dd = np.array([s.track_dd for s in self.strategies], dtype=bool)
+        self.track_bt = np.array([s.track_bt for s in self.strategies], dtype=bool)
+        # active: not early stopped, flat: waiting a signal to open a position, tracked: active with a position
+        self.active = np.ones(N, dtype=bool)
+        self.flat = np.ones(N, dtype=bool)
+        self.tracked = np.zeros(N, dtype=bool)
+        self.close_price = np.full(N, np.inf)
+        self.so_price = np.zeros((N, Q))
+        self.pending = np.zeros((N, Q), dtype=bool)
+        self.magazine = [[] for _ in range(N)]
+        # the highest pending safe order of long strategies (filled by a lower Low) and the lowest of short ones
+        # (filled by a higher High)
+        self.so_low = np.full(N, -np.inf)
+        self.so_high = np.full(N, np.inf)
+        self.first_price = np.ones(N)
+        self.TP_price = np.zeros(N)
+        self.dd_price = np.zeros(N)
+        self.dd_pct = np.zeros(N)
+        self.bt_price = np.zeros(N)
+        # bar of the last drawdown and best_try update not written yet in the positions, -1 without update
+        self.dd_bar = np.full(N, -1)
+        self.bt_bar = np.full(N, -1)
+        for k, strategy in enumerate(self.strategies):
+            if len(strategy.strategy_pos) == 0:
+                continue
+            self.magazine[k] = list(strategy.so_magazine)
+            self.pending[k, :len(self.magazine[k])] = True
+            self.so_price[k, :len(self.magazine[k])] = [o.price for o in self.magazine[k]]
+            self.load(k)
+
+    def load(self, k):
+        """Read the state of the k-th strategy after its positions changed"""
+        strategy = self.strategies[k]
+        pos = strategy.strategy_pos[-1]
+        self.first_price[k] = pos.order_list[0].price
+        self.TP_price[k] = pos.TP_price
+        self.dd_price[k], self.dd_pct[k] = pos.dd_price, pos.dd_pct_float
+        self.bt_price[k] = pos.order_list[-1].bt_price
+        self.tracked[k] = True
+        prices = self.so_price[k][self.pending[k]]
+        if pos.is_closed():
+            self.close_price[k], self.so_low[k], self.so_high[k], self.flat[k] = np.inf, -np.inf, np.inf, True
+        else:
+            self.close_price[k], self.flat[k] = strategy.close_price(), False
+            if strategy.long:
+                self.so_low[k] = prices.max() if prices.size else -np.inf
+            else:
+                self.so_high[k] = prices.min() if prices.size else np.inf
+
+    def sync(self, k):
+        """Write the drawdown and best_try tracked in the arrays to the last position of the k-th strategy"""
+        strategy = self.strategies[k]
+        if self.dd_bar[k] >= 0:
+            strategy.track_drawdown(self.klines, int(self.dd_bar[k]))
+            self.dd_bar[k] = -1
+        if self.bt_bar[k] >= 0:
+            strategy.track_best_try(self.klines, int(self.bt_bar[k]))
+            self.bt_bar[k] = -1
+
+    def stop(self, k):
+        """Early stop the k-th strategy"""
+        self.sync(k)
+        self.active[k] = self.flat[k] = self.tracked[k] = False
+        self.close_price[k], self.so_low[k], self.so_high[k] = np.inf, -np.inf, np.inf
+
+    def next_event(self, i, signal_idx):
+        """The first bar at or after i with a take profit, a fill or an opening in any strategy"""
+        NROW = len(self.klines)
+        high_above, low_below = min(self.close_price.min(), self.so_high.min()), self.so_low.max()
+        j = NROW if i >= NROW or (high_above == np.inf and low_below == -np.inf) else \
+            self.klines.next_cross(i, high_above=high_above, low_below=low_below)
+        if self.flat.any():
+            k = np.searchsorted(signal_idx, i)
+            if k < len(signal_idx):
+                j = min(j, int(signal_idx[k]))
+        return j
+
+    def step(self, j, signal):
+        """Evaluate the j-th bar on the strategies with a take profit, a fill or an opening (see DCA.next)"""
+        klines = self.klines
+        high, low = klines.high[j], klines.low[j]
+        close = high > self.close_price
+        fill = (low < self.so_low) | (high > self.so_high)
+        event = close | fill
+        if signal:
+            event |= self.flat
+        for k in np.flatnonzero(event):
+            strategy = self.strategies[k]
+            self.sync(k)
+            if close[k]:
+                if strategy.track_bt:
+                    strategy.track_best_try(klines, j)
+                strategy.strategy_pos[-1].close_entry(self.close_price[k], klines.index[j])
+            else:
+                if self.flat[k]:
+                    strategy.open_position(klines, j)
+                    self.magazine[k] = create_safe_order(strategy.so_qty, klines.open[j], klines.index[j],
+                                                         strategy.size_1st_so, strategy.so_vol_scale,
+                                                         strategy.so_step, strategy.so_step_scale, strategy.long)
+                    self.pending[k] = False
+                    self.pending[k, :strategy.so_qty] = True
+                    self.so_price[k, :strategy.so_qty] = [o.price for o in self.magazine[k]]
+                # evaluar las safe orders en el orden de la escalera
+                prices = self.so_price[k]
+                cross = self.pending[k] & ((low < prices) if strategy.long else (high > prices))
+                for q in np.flatnonzero(cross):
+                    if strategy.track_bt:
+                        strategy.track_best_try(klines, j)
+                    order = self.magazine[k][q]
+                    strategy.strategy_pos[-1].new_entry(order.size, order.price, klines.index[j], strategy.TP)
+                self.pending[k] &= ~cross
+            self.load(k)
+
+    def track(self, i, j, rows):
+        """
+        Update the drawdown and best_try of the strategies in the boolean mask rows over the bars [i, j), where
+        their positions don't change. Only the bar holding the final value is recorded, as DCA.track_range
+        """
+        low, high = self.klines.low[i:j], self.klines.high[i:j]
+        bottom, top = int(low.argmin()), int(high.argmax())
+        # drawdown: the first bar reaching the lowest Low (long) or the highest High (short)
+        dd = rows & self.track_dd
+        for update, bar, price in [(dd & self.long & (low[bottom] < self.dd_price), bottom, low[bottom]),
+                                   (dd & ~self.long & (high[top] > self.dd_price), top, high[top])]:
+            self.dd_price[update] = price
+            self.dd_pct[update] = price / self.first_price[update] - 1
+            self.dd_bar[update] = i + bar
+        # best_try of long strategies: the last bar whose High is a new high above the best price, or above the TP
+        # price (the best price is capped by the TP price)
+        k = np.flatnonzero(rows & self.track_bt & self.long)
+        if k.size:
+            later = np.maximum.accumulate(high[::-1])[::-1]
+            last = np.searchsorted(-later, -self.TP_price[k]) - 1
+            last = np.where(high[top] > self.bt_price[k], np.maximum(last, top), -1)
+            k, last = k[last >= 0], last[last >= 0]
+            self.bt_price[k] = np.minimum(high[last], self.TP_price[k])
+            self.bt_bar[k] = i + last
+        # short strategies: the same with the Low
+        k = np.flatnonzero(rows & self.track_bt & ~self.long)
+        if k.size:
+            later = np.minimum.accumulate(low[::-1])[::-1]
+            last = np.searchsorted(later, self.TP_price[k]) - 1
+            last = np.where(low[bottom] < self.bt_price[k], np.maximum(last, bottom), -1)
+            k, last = k[last >= 0], last[last >= 0]
+            self.bt_price[k] = np.maximum(low[last], self.TP_price[k])
+            self.bt_bar[k] = i + last
+
+    def track_range(self, i, j, DRAWDOWN_TOLERANCE):
+        """Track the bars [i, j) of every strategy, early stopping the ones breaking the drawdown tolerance"""
+        low, high = self.klines.low[i:j], self.klines.high[i:j]
+        # the strategies already beyond the tolerance (a positive one) stop on the first bar
+        stops = {k: i for k in np.flatnonzero(self.tracked & (self.dd_pct < DRAWDOWN_TOLERANCE))}
+        dd = self.tracked & self.track_dd & (self.dd_pct >= DRAWDOWN_TOLERANCE)
+        # the drawdown of long strategies changes at each new Low, the first one beyond the tolerance stops them
+        for k in np.flatnonzero(dd & self.long & (low.min() / self.first_price - 1 < DRAWDOWN_TOLERANCE)):
+            stops[k] = i + int(np.argmax(low / self.first_price[k] - 1 < DRAWDOWN_TOLERANCE))
+        # the drawdown of short strategies grows at each new High, only the first one can be beyond the tolerance
+        k = np.flatnonzero(dd & ~self.long)
+        if k.size:
+            bar = np.searchsorted(np.maximum.accumulate(high), self.dd_price[k], side='right')
+            k, bar = k[bar < j - i], bar[bar < j - i]
+            beyond = high[bar] / self.first_price[k] - 1 < DRAWDOWN_TOLERANCE
+            stops.update(zip(k[beyond], i + bar[beyond]))
+        for k, stop in stops.items():
+            rows = np.zeros_like(self.tracked)
+            rows[k] = True
+            self.track(i, stop + 1, rows)
+            self.stop(k)
+        self.track(i, j, self.tracked)
+
+    def run(self, signal, DRAWDOWN_TOLERANCE, start=0):
+        """
+        :param signal: a boolean numpy array with the same length that klines
+        :param start: the first bar to evaluate (see backtesting)
+        :return: a list with the strategy_pos of each strategy
+        """
+        if len(self.strategies) == 0:
+            return []
+        for k, strategy in enumerate(self.strategies):
+            if is_stopped(strategy, DRAWDOWN_TOLERANCE):
+                self.stop(k)
+        signal_idx = np.flatnonzero(signal)
+        NROW = len(self.klines)
+        # the bars [i, j) are tracked with the state before the events of the bar j, searched from the bar e
+        i = e = start
+        while i < NROW:
+            j = self.next_event(e, signal_idx)
+            if j > i:
+                self.track_range(i, j, DRAWDOWN_TOLERANCE)
+            if j >= NROW:
+                break
+            self.step(j, signal[j])
+            i, e = j, j + 1
+        for k, strategy in enumerate(self.strategies):
+            self.sync(k)
+            strategy.so_magazine = [o for o, pending in zip(self.magazine[k], self.pending[k]) if pending]
+        return [s.strategy_pos for s in self.strategies]
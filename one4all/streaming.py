@@ -0,0 +1,313 @@
+"""
+streaming.py
+
+This file contains stateful indicators updated one kline at a time (O(1) by update), for computing the signals
+live. Every indicator gives the same values that its batch function in signals.py: the rolling mean and variance
+follow the add/remove updates with Kahan compensation of the pandas rolling windows, and the exponential means
+the recursion of pandas ewm(adjust=False).
+
+Usage:
+  signal = StreamBollSignal(TIMEFRAME_LENGTH=15)
+  for open_time, kline in OHLC.iterrows():
+      if signal.update(open_time, kline['Open'], kline['High'], kline['Low'], kline['Close']):
+          ...
+"""
+import math
+from one4all.signals import RSI_METHODS
+import numpy as np
+
+NAN = float('nan')
+
+
+class RingBuffer:
+    """Fixed length window of the last values, push returns the value leaving the window (None until it's full)"""
+
+    def __init__(self, length):
+        self.values = [NAN] * length
+        self.length = length
+        self.pos = 0
+        self.count = 0
+
+    def push(self, value):
+        evicted = self.values[self.pos] if self.count == self.length else None
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+        return evicted
+
+
+class RollingMean:
+    """
+    Streaming x.rolling(window=MA_LENGTH).mean(), NaN until the window has MA_LENGTH non NA values
+    """
+
+    def __init__(self, MA_LENGTH):
+        self.window = RingBuffer(MA_LENGTH)
+        self.nobs = 0
+        self.sum = 0.0
+        self.add_compensation = 0.0
+        self.remove_compensation = 0.0
+        self.same = 0
+        self.prev = NAN
+        self.value = NAN
+
+    def update(self, x):
+        evicted = self.window.push(x)
+        if evicted is not None and evicted == evicted:
+            self.nobs -= 1
+            y = -evicted - self.remove_compensation
+            t = self.sum + y
+            self.remove_compensation = t - self.sum - y
+            self.sum = t
+        if x == x:
+            self.nobs += 1
+            y = x - self.add_compensation
+            t = self.sum + y
+            self.add_compensation = t - self.sum - y
+            self.sum = t
+            self.same = self.same + 1 if x == self.prev else 1
+            self.prev = x
+        if self.nobs < self.window.length:
+            self.value = NAN
+        elif self.same >= self.nobs:
+            # una ventana de valores iguales no acumula error de punto flotante
+            self.value = self.prev
+        else:
+            self.value = self.sum / self.nobs
+        return self.value
+
+
+class RollingStd:
+    """
+    Streaming x.rolling(window=MA_LENGTH).std(ddof=ddof), using Welford updates
+    """
+
+    def __init__(self, MA_LENGTH, ddof=1):
+        self.window = RingBuffer(MA_LENGTH)
+        self.ddof = ddof
+        self.nobs = 0
+        self.mean = 0.0
+        self.ssqdm = 0.0
+        self.add_compensation = 0.0
+        self.remove_compensation = 0.0
+        self.same = 0
+        self.prev = NAN
+        self.value = NAN
+
+    def update(self, x):
+        evicted = self.window.push(x)
+        if evicted is not None and evicted == evicted:
+            self.nobs -= 1
+            if self.nobs:
+                prev_mean = self.mean - self.remove_compensation
+                y = evicted - self.remove_compensation
+                t = y - self.mean
+                self.remove_compensation = t + self.mean - y
+                self.mean -= t / self.nobs
+                self.ssqdm -= (evicted - prev_mean) * (evicted - self.mean)
+            else:
+                self.mean = 0.0
+                self.ssqdm = 0.0
+        if x == x:
+            self.nobs += 1
+            self.same = self.same + 1 if x == self.prev else 1
+            self.prev = x
+            prev_mean = self.mean - self.add_compensation
+            y = x - self.add_compensation
+            t = y - self.mean
+            self.add_compensation = t + self.mean - y
+            self.mean += t / self.nobs
+            self.ssqdm += (x - prev_mean) * (x - self.mean)
+        if self.nobs < self.window.length or self.nobs <= self.ddof:
+            self.value = NAN
+        elif self.same >= self.nobs or self.nobs == 1:
+            self.value = 0.0
+        else:
+            self.value = math.sqrt(max(self.ssqdm / (self.nobs - self.ddof), 0.0))
+        return self.value
+
+
+class StreamEWM:
+    """
+    Streaming x.ewm(alpha=alpha, adjust=False, min_periods=min_periods).mean()
+    """
+
+    def __init__(self, alpha, min_periods=0):
+        self.old_wt_factor = 1. - alpha
+        self.new_wt = alpha
+        self.old_wt = 1.
+        self.min_periods = max(min_periods, 1)
+        self.nobs = 0
+        self.weighted = None
+        self.value = NAN
+
+    def update(self, x):
+        is_observation = x == x
+        self.nobs += is_observation
+        if self.weighted is None or self.weighted != self.weighted:
+            self.weighted = x
+        else:
+            # los NA hacen decaer el peso del promedio anterior (ignore_na=False)
+            self.old_wt *= self.old_wt_factor
+            if is_observation:
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted + self.new_wt * x) / (self.old_wt + self.new_wt)
+                self.old_wt = 1.
+        self.value = self.weighted if self.nobs >= self.min_periods else NAN
+        return self.value
+
+
+class StreamRMA:
+    """
+    Streaming signals.RMA: an exponential mean with alpha = 1 / LENGTH seeded with the mean of the first LENGTH
+    values (the values before the first non NA are ignored)
+    """
+
+    def __init__(self, LENGTH=14):
+        self.LENGTH = LENGTH
+        self.seed = []
+        self.ewm = StreamEWM(1 / LENGTH)
+        self.value = NAN
+
+    def update(self, x):
+        if len(self.seed) < self.LENGTH:
+            if x == x or self.seed:
+                self.seed.append(x)
+            if len(self.seed) == self.LENGTH:
+                self.value = self.ewm.update(np.mean(self.seed))
+            return self.value
+        self.value = self.ewm.update(x)
+        return self.value
+
+
+class StreamBollinger:
+    """
+    Streaming bollinger_bands_series: the close price moving average, the lower and upper bands
+    """
+
+    def __init__(self, MA_LENGTH=20, SD_DEV=2.0):
+        self.SD_DEV = SD_DEV
+        self.mean = RollingMean(MA_LENGTH)
+        self.std = RollingStd(MA_LENGTH, ddof=0)
+
+    def update(self, close):
+        """:return: a tuple (moving average, lower band, upper band), with NaN until MA_LENGTH closes"""
+        tp_ma = self.mean.update(close)
+        tp_std = self.std.update(close)
+        return tp_ma, tp_ma - self.SD_DEV * tp_std, tp_ma + self.SD_DEV * tp_std
+
+
+class StreamRSI:
+    """
+    Streaming signals.RSI of the close prices, method 'ta' (ta.momentum.rsi) or 'rma' (tradingview)
+    """
+
+    def __init__(self, RSI_LENGTH=14, method='ta'):
+        if method not in RSI_METHODS:
+            raise ValueError('Unknown RSI method {!r}, expected one of {}'.format(method, RSI_METHODS))
+        self.method = method
+        if method == 'ta':
+            self.up = StreamEWM(1 / RSI_LENGTH, min_periods=RSI_LENGTH)
+            self.down = StreamEWM(1 / RSI_LENGTH, min_periods=RSI_LENGTH)
+        else:
+            self.up = StreamRMA(RSI_LENGTH)
+            self.down = StreamRMA(RSI_LENGTH)
+        self.prev_close = NAN
+        self.value = NAN
+
+    def update(self, close):
+        delta = close - self.prev_close
+        self.prev_close = close
+        if self.method == 'ta':
+            # ta reemplaza el primer delta (NA) por 0
+            up = self.up.update(delta if delta > 0 else 0.0)
+            down = self.down.update(-delta if delta < 0 else 0.0)
+            if up != up or down != down:
+                self.value = NAN
+            else:
+                self.value = 100.0 if down == 0 else 100 - (100 / (1 + up / down))
+            return self.value
+        up = self.up.update(max(delta, 0.0) if delta == delta else NAN)
+        down = self.down.update(max(-delta, 0.0) if delta == delta else NAN)
+        if up != up or down != down:
+            self.value = NAN
+        else:
+            self.value = 100.0 if down == 0 else (0.0 if up == 0 else 100 - (100 / (1 + up / down)))
+        return self.value
+
+
+class TimeframeAggregator:
+    """
+    Streaming transform_timeframe: aggregate every TIMEFRAME_LENGTH klines into one kline
+    """
+
+    def __init__(self, TIMEFRAME_LENGTH):
+        self.TIMEFRAME_LENGTH = TIMEFRAME_LENGTH
+        self.count = 0
+        self.bar = None
+
+    def update(self, open_time, open_price, high, low, close):
+        """:return: the aggregate kline (open_time, open, high, low, close) when it's completed, otherwise None"""
+        if self.count == 0:
+            self.bar = [open_time, open_price, high, low, close]
+        else:
+            # como np.fmax / np.fmin, un NA no reemplaza un valor
+            if high > self.bar[2] or self.bar[2] != self.bar[2]:
+                self.bar[2] = high
+            if low < self.bar[3] or self.bar[3] != self.bar[3]:
+                self.bar[3] = low
+            self.bar[4] = close
+        self.count += 1
+        if self.count < self.TIMEFRAME_LENGTH:
+            return None
+        self.count = 0
+        return tuple(self.bar)
+
+
+class StreamBollSignal:
+    """
+    Streaming compute_boll_signal: update receives the 1 minute klines and returns the signal of each one
+    """
+
+    def __init__(self, TIMEFRAME_LENGTH, MA=20, SD_DEV=2.0):
+        self.aggregator = TimeframeAggregator(TIMEFRAME_LENGTH)
+        self.bands = StreamBollinger(MA_LENGTH=MA, SD_DEV=SD_DEV)
+        self.armed = False
+        self.pending = False
+
+    def update(self, open_time, open_price, high, low, close):
+        # la señal de una kline agregada se activa en la primera kline de 1 minuto despues de su cierre
+        signal = self.pending
+        self.pending = False
+        bar = self.aggregator.update(open_time, open_price, high, low, close)
+        if bar is not None:
+            _, boll, _ = self.bands.update(bar[4])
+            if not self.armed and bar[4] < boll:
+                self.armed = True
+            elif self.armed and bar[4] > boll:
+                self.pending = True
+                self.armed = False
+        return signal
+
+
+class StreamRSISignal:
+    """
+    Streaming compute_rsi_signal. The batch signal covers the TIMEFRAME_LENGTH klines of the aggregate kline where
+    the RSI hit RSI_OBJ, which is known only at its close; live, the signal covers the TIMEFRAME_LENGTH klines
+    following that close, i.e. the batch signal shifted TIMEFRAME_LENGTH klines forward.
+    """
+
+    def __init__(self, TIMEFRAME_LENGTH, RSI_LENGTH=14, RSI_OBJ=70, LOWER_THAN=True, method='ta'):
+        self.aggregator = TimeframeAggregator(TIMEFRAME_LENGTH)
+        self.rsi = StreamRSI(RSI_LENGTH=RSI_LENGTH, method=method)
+        self.RSI_OBJ = RSI_OBJ
+        self.LOWER_THAN = LOWER_THAN
+        self.hit = False
+
+    def update(self, open_time, open_price, high, low, close):
+        signal = self.hit
+        bar = self.aggregator.update(open_time, open_price, high, low, close)
+        if bar is not None:
+            rsi = self.rsi.update(bar[4])
+            self.hit = rsi < self.RSI_OBJ if self.LOWER_THAN else rsi > self.RSI_OBJ
+        return signal
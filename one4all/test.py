@@ -5,10 +5,44 @@ This file tests the various necessary util functions.
 """
 from .utils import *
 from .signals import *
+from .strategy import *
+from .streaming import *
+from .live import *
+from .store import KlineStore
+from .cache import ResultCache
+from .checkpoint import load_checkpoint, resume, save_checkpoint
+from .walkforward import walk_forward, walk_forward_windows
+from .profiling import Profiler, deal_counters
+from .grid import build_signal, load_ohlc, main as grid_main, merge_shards, missing_shards, run_shard
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
 import unittest
+from unittest import mock
 import pandas as pd
 from pandas._testing import assert_series_equal, assert_frame_equal
 
+SAMPLE_CSV = './engine/sample_data/ETHUSDT_010122_150122.csv'
+# parametros DCA de los tests sobre la muestra, sample_grid cambia los que varian en cada test
+SAMPLE_PARAMS = {'TP': .5, 'bo_size': 10, 'so_qty': 4, 'size_1st_so': 10, 'so_vol_scale': 1.5, 'so_step': .5,
+                 'so_step_scale': 1.2, 'long': True, 'EC': .1}
+
+
+def read_sample(nrows=3000):
+    """The first nrows 1min klines of the sample data as an OHLC dataframe"""
+    OHLC = pd.read_csv(SAMPLE_CSV, parse_dates=['open_time'], index_col='open_time',
+                       nrows=nrows)[['open', 'high', 'low', 'close']]
+    OHLC.columns = ['Open', 'High', 'Low', 'Close']
+    return OHLC
+
+
+def sample_grid(**candidates):
+    """A ParameterGrid over SAMPLE_PARAMS where the given parameters take a list of candidates"""
+    return ParameterGrid(dict({key: [value] for key, value in SAMPLE_PARAMS.items()}, **candidates))
+
 
 class UTILSTest(unittest.TestCase):
     def setUp(self):
@@ -61,6 +95,107 @@ class UTILSTest(unittest.TestCase):
         #print(transform_timeframe(self.OHLC, 60).head())
         assert_frame_equal(self.OHLC60min, transform_timeframe(self.OHLC, 60).head())
 
+class PARAMETERGRIDTest(unittest.TestCase):
+    def test_parameterGrid_indexing(self):
+        """grid[i] must decode the same parameters set than the i-th iteration, also across sub grids"""
+        grid = ParameterGrid([{'TP': [.5, 1, 2], 'so_qty': [1, 2], 'long': [True]}, {}, {'EC': range(4), 'TP': [3]}])
+        candidates = list(grid)
+        self.assertEqual([grid[i] for i in range(len(grid))], candidates)
+        self.assertEqual(grid[-1], candidates[-1])
+        self.assertEqual(list(grid[2:9:3]), candidates[2:9:3])
+        self.assertRaises(IndexError, grid.__getitem__, len(grid))
+        self.assertEqual(sum([list(grid.shard(k, 3)) for k in range(3)], []), candidates)
+        sample = grid.sample(5, seed=0)
+        self.assertEqual(len(set(sample.indices)), 5)
+        self.assertEqual(list(sample), [candidates[i] for i in sample.indices])
+        # los IDs de un shard son sus indices en el grid completo
+        shard = dict(iter_spawn_strategy(dict, grid.shard(1, 3)))
+        self.assertEqual(list(shard), ['A' + str(i) for i in grid.shard(1, 3).indices])
+        self.assertEqual(list(shard.values()), list(grid.shard(1, 3)))
+
+    def test_parameterGrid_values(self):
+        """Sets and generators of values index, shard and sample like lists, and every sub grid is checked"""
+        grid = ParameterGrid({'TP': {.5}, 'so_qty': (q for q in [1, 2, 3]), 'long': [True, False]})
+        candidates = list(grid)
+        self.assertEqual(len(candidates), 6)
+        self.assertEqual(list(grid), candidates)
+        self.assertEqual(len(grid), 6)
+        self.assertEqual([grid[i] for i in range(len(grid))], candidates)
+        self.assertEqual(sum([list(grid.shard(k, 4)) for k in range(4)], []), candidates)
+        self.assertEqual(list(grid.sample(3, seed=1)), [candidates[i] for i in grid.sample(3, seed=1).indices])
+        self.assertRaises(TypeError, ParameterGrid, [{'TP': 1}, {'TP': [1]}])
+
+
+class TIMEFRAMETest(unittest.TestCase):
+    def setUp(self):
+        """Read the first day of the sample 1min klines"""
+        self.OHLC = read_sample(1440)
+
+    def test_transform_timeframe_resample(self):
+        """transform_timeframe must aggregate the whole bucket, like pandas resample"""
+        for tf in [15, 30, 60, 240]:
+            expected = self.OHLC.resample(f'{tf}min').agg({'Open': 'first', 'High': 'max', 'Low': 'min',
+                                                           'Close': 'last'})
+            assert_frame_equal(expected, transform_timeframe(self.OHLC, tf), check_freq=False)
+
+    def test_transform_timeframe_partial(self):
+        OHLC = self.OHLC.iloc[:100]
+        with self.assertRaises(AssertionError):
+            transform_timeframe(OHLC, 15)
+        OHLC15min = transform_timeframe(OHLC, 15, partial=True)
+        self.assertEqual(len(OHLC15min), 7)
+        assert_frame_equal(OHLC15min.iloc[:6], transform_timeframe(OHLC.iloc[:90], 15))
+        self.assertEqual(OHLC15min.iloc[-1].tolist(), [OHLC['Open'].iloc[90], OHLC['High'].iloc[90:].max(),
+                                                       OHLC['Low'].iloc[90:].min(), OHLC['Close'].iloc[-1]])
+
+
+class RESAMPLECACHETest(unittest.TestCase):
+    def setUp(self):
+        self.OHLC = read_sample(2880)
+
+    def test_derived_timeframes(self):
+        cache = ResampleCache()
+        for tf in [10, 15, 30, 60, 240, 30]:
+            assert_frame_equal(transform_timeframe(self.OHLC, tf), cache.transform(self.OHLC, tf))
+        # 30 from 15, 60 from 30 and 240 from 60; the second 30 from the cache
+        self.assertEqual((cache.hits, cache.misses, cache.derived), (1, 5, 3))
+        # other OHLC has other fingerprint
+        other = self.OHLC.copy()
+        other.iloc[100, 1] += 1
+        assert_frame_equal(transform_timeframe(other, 30), cache.transform(other, 30))
+        self.assertEqual(cache.derived, 3)
+
+    def test_edit_in_place(self):
+        """Editing the same OHLC object in place must not give the cached frame of the previous values"""
+        cache = ResampleCache()
+        OHLC = self.OHLC.copy()
+        cache.transform(OHLC, 60)
+        OHLC.iloc[10, 1] = 99999
+        self.assertEqual(cache.transform(OHLC, 60).High.iloc[0], 99999.0)
+        assert_frame_equal(cache.transform(OHLC, 60), transform_timeframe(OHLC, 60))
+        self.assertEqual(cache.misses, 2)
+
+    def test_partial(self):
+        """A partial frame in the cache doesn't skip the divisibility check of a later call without partial"""
+        cache = ResampleCache()
+        OHLC = self.OHLC.iloc[:100]
+        assert_frame_equal(cache.transform(OHLC, 15, partial=True), transform_timeframe(OHLC, 15, partial=True))
+        with self.assertRaises(AssertionError):
+            cache.transform(OHLC, 15)
+        cache.clear()
+        self.assertEqual((len(cache.frames), cache.nbytes, cache.hits, cache.misses, cache.derived), (0, 0, 0, 0, 0))
+
+    def test_eviction(self):
+        cache = ResampleCache()
+        cache.transform(self.OHLC, 15)
+        cache.max_bytes = cache.nbytes
+        cache.clear()
+        cache.transform(self.OHLC, 15)
+        cache.transform(self.OHLC, 30)
+        self.assertEqual(list(tf for _, tf in cache.frames), [30])
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+
+
 class REPORTSTest(unittest.TestCase):
     def setup(self):
        """Create a custom Position object to generate a report from the data stored in them.
@@ -72,6 +207,37 @@ class REPORTSTest(unittest.TestCase):
     def test_reports(self):
        pass
 
+    def test_ledger_report(self):
+        """A report read from a DealLedger must be equal to the report made with the Position objects"""
+        OHLC = read_sample()
+        signal = np.random.default_rng(0).random(OHLC.shape[0]) < 0.01
+        grid = sample_grid(TP=[.5, 1], so_qty=[0, 4])
+        deals = eval_strategies(spawn_strategy(DCA, grid), OHLC, signal, -0.35)
+        ledgers = eval_strategies(spawn_strategy(DCA, grid), OHLC, signal, -0.35, compact=True)
+        for name in deals:
+            self.assertIsInstance(ledgers[name], DealLedger)
+            assert_frame_equal(make_report(deals[name]), make_report(ledgers[name]))
+            # lazy per-deal lists: offsets in the report, materialized from the ledger on request
+            report, lazy = make_report(ledgers[name]), make_report(ledgers[name], lazy_nested=True)
+            self.assertNotIn('trigger_prices', lazy)
+            self.assertEqual((lazy.order_end - lazy.order_start).tolist(), report.order_size.tolist())
+            self.assertEqual(ledgers[name].nested('trigger_dates', as_str=True), report.trigger_dates.tolist())
+            self.assertEqual(ledgers[name].nested('price_best_try', deals=[1]), [report.price_best_try[1]])
+
+    def test_pct_drawdown(self):
+        """pct_drawdown is a float percentage, formatted as string only on request"""
+        OHLC = pd.DataFrame({'Open': [100.0, 99.8, 99.6], 'High': [100.2, 99.9, 101.5],
+                             'Low': [99.5, 96.79, 99.4], 'Close': [99.8, 99.6, 100.2]},
+                            index=pd.date_range('2022-01-01', periods=3, freq='min'))
+        deals = backtesting(DCA(TP=1, bo_size=1, so_qty=0, size_1st_so=1, so_vol_scale=1, so_step=1,
+                                so_step_scale=1, long=True, EC=0), OHLC, [True, False, False], -0.35)
+        report = make_report(deals)
+        self.assertEqual(report.pct_drawdown.dtype, np.float64)
+        self.assertAlmostEqual(report.pct_drawdown[0], -3.21)
+        formatted = make_report(deals, format_pct_drawdown=True)
+        self.assertEqual(formatted.pct_drawdown[0], '-3.21%')
+        self.assertEqual(summary_strategy(report, 1).max_drawdown, summary_strategy(formatted, 1).max_drawdown)
+
 
 class SIGNALTest(unittest.TestCase):
     def setup(self):
@@ -94,5 +260,468 @@ class SIGNALTest(unittest.TestCase):
         self.assertEqual(boll_signal(self.boll_df, [9, 10, 19, 15], [1, 3, 5, 7]),
                          [False, False, False, True, False, False, False, True, False])
 
+    def test_compute_boll_signal(self):
+        """The signal is set at the first minute after the closing of the kline where the re-entry happens; a
+        re-entry at the last kline is dropped"""
+        close = np.repeat([10, 10, 10, 4, 12, 12, 5, 13], 2)
+        OHLC = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close},
+                            index=pd.date_range('2022-01-01', periods=len(close), freq='1min'))
+        signal = compute_boll_signal(OHLC, TIMEFRAME_LENGTH=2, MA=2, SD_DEV=0.1, cache=None)
+        self.assertEqual(signal.columns.tolist(), ['BB2'])
+        self.assertEqual(np.where(signal['BB2'])[0].tolist(), [10])
+
+    def test_rsi_rma(self):
+        """RSI of tradingview: gains and losses averaged with alpha = 1 / RSI_LENGTH, seeded with their mean"""
+        close = pd.Series([10, 11, 10.5, 12, 11, 11.5, 13, 12.5])
+        delta = close.diff()
+        up, down = delta.clip(lower=0).iloc[1:4].mean(), (-delta).clip(lower=0).iloc[1:4].mean()
+        expected = [np.nan] * 3 + [100 - 100 / (1 + up / down)]
+        for i in range(4, len(close)):
+            up = (delta.clip(lower=0)[i] + 2 * up) / 3
+            down = ((-delta).clip(lower=0)[i] + 2 * down) / 3
+            expected.append(100 - 100 / (1 + up / down))
+        np.testing.assert_allclose(RSI(pd.DataFrame({'Close': close}), RSI_LENGTH=3, method='rma'), expected)
+        with self.assertRaises(ValueError):
+            RSI(pd.DataFrame({'Close': close}), method='ema')
+
+    def test_compute_rsi_signal(self):
+        """The signal covers the klines of every aggregate kline where the RSI hit RSI_OBJ, except the last one"""
+        close = np.repeat([10, 11, 12, 11, 13, 14, 15], 2).astype(float)
+        OHLC = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close},
+                            index=pd.date_range('2022-01-01', periods=len(close), freq='1min'))
+        rsi = RSI(transform_timeframe(OHLC, 2), RSI_LENGTH=2)
+        signal = compute_rsi_signal(OHLC, TIMEFRAME_LENGTH=2, RSI_LENGTH=2, RSI_OBJ=60, LOWER_THAN=False,
+                                    cache=None)
+        expected = np.repeat(np.append(rsi.to_numpy()[:-1] > 60, False), 2)
+        self.assertTrue(expected.any())
+        self.assertEqual(signal.tolist(), expected.tolist())
+
+    def test_project_signal_to(self):
+        signal = pd.Series([False, True, False, False, False, True, True, False, False, False])
+        assert_series_equal(project_signal_to(signal, 3),
+                            pd.Series([False, True, True, True, False, True, True, True, True, False]))
+        assert_series_equal(project_signal_to(signal, 0), signal)
+
+    def test_signal_window_operators(self):
+        signal = np.array([True, True, False, True, True, True, False, False, True, True])
+        self.assertEqual(np.where(hold_signal(signal, 2))[0].tolist(), [1, 4, 5, 9])
+        self.assertEqual(np.where(first_in_window(signal, 3))[0].tolist(), [0, 8])
+        self.assertEqual(np.where(cooldown_signal(signal, 3))[0].tolist(), [0, 3, 8])
+        signals = pd.DataFrame({'BB15': [True, False, False, True, False], 'BB60': [False, False, True, False, False]})
+        self.assertEqual(signal_and(signals, windows={'BB60': 2}).tolist(), [False, False, False, True, False])
+        self.assertEqual(signal_or(signals).tolist(), [True, False, True, True, False])
+
+class STREAMINGTest(unittest.TestCase):
+    def setUp(self):
+        self.OHLC = read_sample(2880)
+
+    def stream(self, indicator):
+        return pd.Series([indicator.update(*kline) for kline in self.OHLC.itertuples()], index=self.OHLC.index)
+
+    def test_streaming_indicators(self):
+        """The streaming indicators give exactly the values of the batch functions"""
+        close = self.OHLC['Close']
+        mean, std = RollingMean(20), RollingStd(20, ddof=0)
+        assert_series_equal(pd.Series([mean.update(x) for x in close], index=close.index), SMA(close, 20),
+                            check_names=False, check_exact=True)
+        assert_series_equal(pd.Series([std.update(x) for x in close], index=close.index),
+                            close.rolling(20).std(ddof=0), check_names=False, check_exact=True)
+        bands = StreamBollinger(20, 2.0)
+        boll = pd.Series([bands.update(x)[1] for x in close], index=close.index).dropna()
+        assert_series_equal(boll, bollinger_bands_series(close), check_names=False, check_exact=True)
+        for method in RSI_METHODS:
+            rsi = StreamRSI(14, method=method)
+            assert_series_equal(pd.Series([rsi.update(x) for x in close], index=close.index),
+                                RSI(self.OHLC, RSI_LENGTH=14, method=method), check_names=False, check_exact=True)
+        aggregator = TimeframeAggregator(15)
+        bars = [bar for bar in (aggregator.update(*kline) for kline in self.OHLC.itertuples()) if bar is not None]
+        expected = transform_timeframe(self.OHLC, 15)
+        self.assertEqual([bar[0] for bar in bars], expected.index.tolist())
+        self.assertEqual([list(bar[1:]) for bar in bars], expected.to_numpy().tolist())
+
+    def test_streaming_signals(self):
+        for tf in [15, 60]:
+            live = self.stream(StreamBollSignal(tf))
+            self.assertEqual(live.tolist(), compute_boll_signal(self.OHLC, tf, cache=None)['BB' + str(tf)].tolist())
+            # la señal del RSI en vivo es la señal batch desplazada un timeframe
+            live = self.stream(StreamRSISignal(tf, RSI_OBJ=50))
+            batch = compute_rsi_signal(self.OHLC, tf, RSI_OBJ=50, cache=None)
+            assert_series_equal(live, batch.shift(tf, fill_value=False))
+
+
+class BACKTESTINGTest(unittest.TestCase):
+    def setUp(self):
+        """Create a toy OHLC where the base order opens at 100, one safe order fills at 99 and the deal closes"""
+        self.OHLC = pd.DataFrame({'Open': [100.0, 99.8, 99.6, 100.2],
+                                  'High': [100.2, 99.9, 101.0, 100.4],
+                                  'Low': [99.5, 98.5, 99.4, 100.0],
+                                  'Close': [99.8, 99.6, 100.2, 100.3]},
+                                 index=pd.date_range('2022-01-01', periods=4, freq='min'))
+        self.params = {'TP': 1, 'bo_size': 1, 'so_qty': 1, 'size_1st_so': 1, 'so_vol_scale': 1,
+                       'so_step': 1, 'so_step_scale': 1, 'long': True, 'EC': 0}
+
+    @classmethod
+    def setUpClass(cls):
+        """The sample klines of the tests comparing modes and sweeps, read once"""
+        cls.sample = read_sample()
+
+    def test_backtesting(self):
+        deals = backtesting(DCA(**self.params), self.OHLC, [True, False, False, False], -0.35)
+        self.assertEqual(len(deals), 1)
+        self.assertTrue(deals[0].is_closed())
+        self.assertEqual([o.price for o in deals[0].order_list[:2]], [100.0, 99.0])
+        self.assertAlmostEqual(deals[0].order_list[-1].price, 99.5 * 1.01)
+        self.assertEqual(deals[0].order_list[-1].date, self.OHLC.index[2])
+        self.assertEqual(deals[0].drawdown['price'], 98.5)
+
+    def test_backtesting_klines(self):
+        """A Klines cursor and the OHLC dataframe must give the same deals"""
+        from_frame = backtesting(DCA(**self.params), self.OHLC, [True] * 4, -0.35)
+        from_klines = backtesting(DCA(**self.params), Klines.from_frame(self.OHLC), [True] * 4, -0.35)
+        self.assertEqual([[(o.size, o.price, o.date) for o in p.order_list] for p in from_frame],
+                         [[(o.size, o.price, o.date) for o in p.order_list] for p in from_klines])
+
+    def test_backtesting_events(self):
+        """The event-driven mode must give the same deals, drawdown and best_try than the bar by bar mode"""
+        OHLC = self.sample
+        signal = np.random.default_rng(0).random(OHLC.shape[0]) < 0.01
+        params = SAMPLE_PARAMS
+
+        def deal_info(deals):
+            return [(p.drawdown, [(o.size, o.price, o.date, o.best_try) for o in p.order_list]) for p in deals]
+
+        for long in [True, False]:
+            by_bar = backtesting(DCA(**dict(params, long=long)), OHLC, signal, -0.35)
+            by_event = backtesting(DCA(**dict(params, long=long)), OHLC, signal, -0.35, mode='event')
+            self.assertGreater(len(by_bar), 1)
+            self.assertEqual(deal_info(by_bar), deal_info(by_event))
+        # las estrategias short tambien saltan entre eventos
+        short = DCA(**dict(params, long=False))
+        with mock.patch.object(DCA, 'next', autospec=True, side_effect=DCA.next) as next_bar:
+            backtesting(short, OHLC, signal, -0.35, mode='event')
+        self.assertLess(next_bar.call_count, OHLC.shape[0] / 2)
+
+    def test_backtesting_events_early_stop(self):
+        """The drawdown tolerance broken on the bar just before an event (the take profit) stops the strategy"""
+        OHLC = pd.DataFrame({'Open': [100.0, 99.0, 95.0, 100.5],
+                             'High': [100.5, 99.2, 102.0, 100.8],
+                             'Low': [99.5, 94.0, 95.0, 100.0],
+                             'Close': [99.0, 95.0, 101.5, 100.5]},
+                            index=pd.date_range('2022-01-01', periods=4, freq='min'))
+        params = dict(self.params, so_qty=0)
+        signal = [True, False, False, False]
+        by_bar = backtesting(DCA(**params), OHLC, signal, -0.05)
+        by_event = backtesting(DCA(**params), OHLC, signal, -0.05, mode='event')
+        self.assertFalse(by_bar[-1].is_closed())
+        self.assertEqual([(p.closed, p.drawdown, [(o.size, o.price, o.date) for o in p.order_list]) for p in by_bar],
+                         [(p.closed, p.drawdown, [(o.size, o.price, o.date) for o in p.order_list])
+                          for p in by_event])
+
+    def test_tracking_levels(self):
+        """The tracking level changes the recorded drawdown/best_try but never the orders"""
+        OHLC = self.sample
+        signal = np.random.default_rng(3).random(OHLC.shape[0]) < 0.01
+        params = SAMPLE_PARAMS
+        full = backtesting(DCA(**params), OHLC, signal, -0.35)
+        for tracking in ['drawdown', 'none']:
+            for mode in ['bar', 'event']:
+                deals = backtesting(DCA(**params, tracking=tracking), OHLC, signal, -0.35, mode=mode)
+                self.assertEqual([[(o.size, o.price, o.date) for o in p.order_list] for p in full],
+                                 [[(o.size, o.price, o.date) for o in p.order_list] for p in deals])
+                self.assertTrue(all(o.bt_date == o.date for p in deals for o in p.order_list))
+        drawdown = backtesting(DCA(**params, tracking='drawdown'), OHLC, signal, -0.35, mode='event')
+        self.assertEqual([p.drawdown for p in full], [p.drawdown for p in drawdown])
+        report = make_report(drawdown, tracking='drawdown')
+        self.assertIn('pct_drawdown', report)
+        self.assertNotIn('price_best_try', report)
+        self.assertNotIn('pct_drawdown', make_report(drawdown, tracking='none'))
+        self.assertRaises(ValueError, DCA, **params, tracking='some')
+
+    def test_eval_strategies_batch(self):
+        """The batch mode advances every strategy in the same pass and keeps the deals of each one"""
+        OHLC = self.sample
+        signal = np.random.default_rng(2).random(OHLC.shape[0]) < 0.02
+        grid = sample_grid(TP=[.3, 1], so_qty=[0, 3], size_1st_so=[10, 20], so_step=[.2, .6], long=[True, False],
+                           tracking=['full', 'drawdown', 'none'])
+
+        def orders(deals):
+            return [(p.drawdown, p.TP_price, [(o.size, o.price, o.date, o.best_try) for o in p.order_list])
+                    for p in deals]
+        for tolerance in [-0.01, -0.35]:
+            by_bar = eval_strategies(spawn_strategy(DCA, grid), OHLC, signal, tolerance, progress=None)
+            # el batch no evalua las estrategias una por una
+            with mock.patch.object(DCA, 'next', side_effect=AssertionError), \
+                    mock.patch.object(DCA, 'next_event', side_effect=AssertionError):
+                batch = eval_strategies(spawn_strategy(DCA, grid), OHLC, signal, tolerance, mode='batch',
+                                        progress=None)
+            for name in by_bar:
+                self.assertEqual(orders(by_bar[name]), orders(batch[name]))
+        self.assertTrue(any(len(p.order_list) > 2 for deals in batch.values() for p in deals))
+        parallel = eval_strategies(spawn_strategy(DCA, grid), OHLC, signal, tolerance, mode='batch', n_jobs=2,
+                                   progress=None)
+        for name in by_bar:
+            self.assertEqual(orders(by_bar[name]), orders(parallel[name]))
+
+    def test_eval_strategies_parallel(self):
+        """Running the strategies in worker processes keeps the results and the strategy order"""
+        OHLC = self.sample
+        signal = np.random.default_rng(1).random(OHLC.shape[0]) < 0.01
+        grid = sample_grid(TP=[.5, 1], so_qty=[2, 4])
+        serial = eval_strategies(spawn_strategy(DCA, grid), OHLC, signal, -0.35)
+        parallel = eval_strategies(spawn_strategy(DCA, grid), OHLC, signal, -0.35, n_jobs=2)
+        self.assertEqual(list(serial), list(parallel))
+        for name in serial:
+            self.assertEqual([[(o.size, o.price, o.date) for o in p.order_list] for p in serial[name]],
+                             [[(o.size, o.price, o.date) for o in p.order_list] for p in parallel[name]])
+
+    def test_dedup_equivalent_strategies(self):
+        """Backtesting one strategy by group of equivalent DCA gives the same summaries than backtesting all"""
+        OHLC = self.sample
+        signal = np.random.default_rng(3).random(OHLC.shape[0]) < 0.02
+        grid = sample_grid(bo_size=[10, 20], so_qty=[0, 1, 3], size_1st_so=[10, 20], so_vol_scale=[1.2, 1.5],
+                           so_step_scale=[1, 1.3])
+        groups = group_equivalent_strategies(spawn_strategy(DCA, grid), scale=False)
+        # so_qty 0: bo_size x size_1st_so, so_qty 1: x size_1st_so, so_qty 3: every combination
+        self.assertEqual(len(groups), 2 + 4 + 16)
+        self.assertEqual(len(group_equivalent_strategies(spawn_strategy(DCA, grid))), 1 + 3 + 12)
+        expected = run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal)
+        for dedup in DEDUP_MODES:
+            assert_frame_equal(run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal, dedup=dedup),
+                               expected)
+
+    def test_walk_forward(self):
+        """Every (strategy, window) row must be the summary of backtesting the window slice alone"""
+        OHLC = self.sample.iloc[:2880]
+        signal = np.random.default_rng(4).random(OHLC.shape[0]) < 0.01
+        signal[1440:] = False
+        windows = walk_forward_windows(OHLC.index, '12h', step='6h')
+        self.assertEqual(windows, [(0, 720), (360, 1080), (720, 1440), (1080, 1800), (1440, 2160), (1800, 2520),
+                                   (2160, 2880)])
+        self.assertEqual(walk_forward_windows(OHLC.index, 1000, anchored=True), [(0, 1000), (0, 2000)])
+        grid = sample_grid(TP=[.5, 1], so_qty=[2])
+        results = walk_forward(spawn_strategy(DCA, grid), OHLC, signal, windows)
+        self.assertEqual(results.shape[0], 2 * len(windows))
+        first, last = windows[1]
+        expected = run_multiple_strategies(spawn_strategy(DCA, grid), OHLC.iloc[first:last], signal[first:last])
+        row = results.set_index(['window', 'strategy']).loc[(1, 'A1')]
+        self.assertEqual(row[expected.index].tolist(), expected['A1'].tolist())
+        # sin señal en la ultima ventana no hay deals
+        self.assertEqual(results[results.window == len(windows) - 1].num_deals.tolist(), [0, 0])
+        parallel = walk_forward(spawn_strategy(DCA, grid), OHLC, signal, windows, n_jobs=2)
+        assert_frame_equal(parallel, results)
+
+    def test_profiler(self):
+        """The profiler counts the same bars, orders, deals and early stops in every mode and replaces the prints"""
+        OHLC = self.sample
+        signal = np.random.default_rng(5).random(OHLC.shape[0]) < 0.02
+        grid = sample_grid(TP=[.5, 1], so_qty=[2, 4])
+        counters = []
+        for mode in ['bar', 'event', 'batch']:
+            events, progress = [], []
+            profiler = Profiler(hooks=[lambda event, info: events.append(event)])
+            run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal, -0.01, mode=mode, profiler=profiler,
+                                    progress=lambda done, total: progress.append((done, total)))
+            frame = profiler.to_frame()
+            counters.append(frame[['bars', 'orders_filled', 'deals_closed', 'early_stop']].values.tolist())
+            self.assertEqual(progress, [(1, 4), (2, 4), (3, 4), (4, 4)])
+            self.assertEqual(events.count('strategy'), 4)
+            self.assertEqual(set(profiler.phases), {'simulation', 'report', 'summary'})
+            self.assertTrue((frame['bars_per_sec'] > 0).all())
+            self.assertEqual(json.loads(profiler.to_json())['phases']['report']['calls'], 4)
+        self.assertEqual(counters[0], counters[1])
+        self.assertEqual(counters[0], counters[2])
+        deals = backtesting(DCA(**dict(next(iter(grid)))), OHLC, signal, -0.01)
+        self.assertEqual(counters[0][0], list(deal_counters(deals, as_klines(OHLC), -0.01).values()))
+        # sin progreso la libreria no escribe en stdout, el early stop y el dedup van al logging
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), self.assertLogs('one4all.backtesting', 'INFO') as logs:
+            run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal, -0.01, dedup='exact', progress=None)
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertTrue(any('early stop' in line for line in logs.output))
+        self.assertTrue(any('Equivalent' in line for line in logs.output))
+
+    def test_summary_only(self):
+        """The summaries made as the deals close are the ones of make_report + summary_strategy"""
+        OHLC = self.sample
+        signal = np.random.default_rng(7).random(OHLC.shape[0]) < 0.02
+        grid = sample_grid(TP=[.5, 1], so_qty=[0, 2, 4], long=[True, False], tracking=['full', 'none'])
+        for mode in ['bar', 'event', 'batch']:
+            expected = run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal, -0.02, mode=mode)
+            strategies = spawn_strategy(DCA, grid)
+            results = run_multiple_strategies(strategies, OHLC, signal, -0.02, mode=mode, summary_only=True)
+            assert_frame_equal(results, expected)
+            self.assertTrue(all(len(s.strategy_pos) == 0 and s.deal_summary is None for s in strategies.values()))
+        # la estrategia guarda solo el ultimo deal
+        strategy = DCA(**dict(next(iter(grid))))
+        strategy.deal_summary = DealSummary()
+        deals = backtesting(strategy, OHLC, signal, -0.02)
+        self.assertEqual(len(deals), 1)
+        self.assertEqual(len(strategy.deal_summary.completed(deals)), len(backtesting(DCA(**dict(next(iter(grid)))),
+                                                                                     OHLC, signal, -0.02)))
+
+    def test_checkpoint_resume(self):
+        """Resuming from checkpoints (with positions open or early stopped at the cuts) gives the deals of a full run"""
+        OHLC = self.sample
+        signal = np.random.default_rng(6).random(OHLC.shape[0]) < 0.02
+        grid = sample_grid(TP=[.5, 1], so_qty=[2, 4], long=[True, False])
+        cuts = [1000, 1500, OHLC.shape[0]]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoint.npz')
+            for tolerance, mode in product([-0.02, -0.01], ['bar', 'event', 'batch']):
+                expected = eval_strategies(spawn_strategy(DCA, grid), OHLC, signal, tolerance, mode=mode)
+                strategies = spawn_strategy(DCA, grid)
+                for strategy in strategies.values():
+                    backtesting(strategy, OHLC.iloc[:cuts[0]], signal[:cuts[0]], tolerance)
+                save_checkpoint(path, strategies, OHLC.iloc[:cuts[0]], signal[:cuts[0]], tolerance)
+                for cut in cuts[1:]:
+                    deals = resume(path, OHLC.iloc[:cut], signal[:cut], mode=mode)
+                for name in expected:
+                    assert_frame_equal(make_report(deals[name]), make_report(expected[name]))
+            restored, info = load_checkpoint(path)
+            self.assertEqual(info['bar'], OHLC.shape[0])
+            self.assertEqual(restored['A0'].get_params, DCA(**dict(next(iter(grid)))).get_params)
+            # el checkpoint no sirve si cambian las klines que ya proceso
+            signal[0] = not signal[0]
+            with self.assertRaises(ValueError):
+                resume(path, OHLC, signal)
+
+    def test_checkpoint_numpy_params(self):
+        """A grid of numpy values is saved and restored as python numbers"""
+        OHLC = self.sample.iloc[:1000]
+        signal = np.random.default_rng(7).random(OHLC.shape[0]) < 0.02
+        grid = sample_grid(TP=np.array([.5, 1]), so_qty=np.arange(2, 4), long=np.array([True, False]))
+        strategies = spawn_strategy(DCA, grid)
+        for strategy in strategies.values():
+            backtesting(strategy, OHLC, signal, -0.35)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoint.npz')
+            save_checkpoint(path, strategies, OHLC, signal, -0.35)
+            restored, info = load_checkpoint(path)
+        for name, strategy in strategies.items():
+            params = restored[name].get_params
+            self.assertEqual(params, strategy.get_params)
+            self.assertEqual([type(params[key]) for key in ['TP', 'so_qty', 'long']], [float, int, bool])
+
+
+class LIVETest(unittest.TestCase):
+    def test_live_runner(self):
+        """Replaying the sample klines gives the same deals than backtesting them"""
+        OHLC = read_sample(2880)
+        params = SAMPLE_PARAMS
+        signal = compute_boll_signal(OHLC, 15, cache=None)['BB15']
+        by_bar = backtesting(DCA(**params), OHLC, signal, -0.35)
+        runner = LiveRunner(DCA(**params), signal=StreamBollSignal(15))
+        live = asyncio.run(runner.run(replay_csv(SAMPLE_CSV, nrows=2880)))
+        self.assertGreater(len(by_bar), 1)
+        self.assertEqual([[(o.size, o.price, o.date, o.best_try) for o in p.order_list] for p in by_bar],
+                         [[(o.size, o.price, o.date, o.best_try) for o in p.order_list] for p in live])
+        events = [e['event'] for e in runner.events]
+        self.assertEqual(events.count('open'), len(live))
+        self.assertEqual(events.count('close'), sum(p.closed for p in live))
+        self.assertEqual(runner.latency()['klines'], 2880)
+        assert_frame_equal(runner.klines.to_frame(), OHLC, check_freq=False)
+
+
+class STORETest(unittest.TestCase):
+    def test_kline_store(self):
+        """The store gives the same klines than reading the CSV and slicing the date range"""
+        OHLC = pd.read_csv(SAMPLE_CSV, parse_dates=['open_time'], index_col='open_time', nrows=3000,
+                           usecols=['open_time', 'open', 'high', 'low', 'close', 'volume'])
+        OHLC.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+        OHLC.index = OHLC.index.as_unit('ns')
+        with tempfile.TemporaryDirectory() as root:
+            store = KlineStore(root)
+            # append incremental: las klines ya almacenadas se omiten
+            self.assertEqual(store.append('ETHUSDT', OHLC.iloc[:1000]), 1000)
+            self.assertEqual(store.append('ETHUSDT', OHLC.iloc[500:]), 2000)
+            self.assertEqual(store.symbols(), ['ETHUSDT'])
+            START, END = '2022-01-01 10:27:00', '2022-01-02 13:59:00'
+            assert_frame_equal(store.frame('ETHUSDT', START, END), OHLC.loc[START:END], check_freq=False)
+            arrays = store.arrays('ETHUSDT', START, END)
+            self.assertIsInstance(arrays['Close'], np.memmap)
+            klines = store.klines('ETHUSDT', START, END)
+            self.assertEqual(len(klines), OHLC.loc[START:END].shape[0])
+            params = dict(SAMPLE_PARAMS, so_qty=2)
+            deals = backtesting(DCA(**params), klines, [True] * len(klines), -0.35)
+            self.assertEqual(deals[0].order_list[0].date, pd.Timestamp(START))
+
+
+class CACHETest(unittest.TestCase):
+    def test_result_cache(self):
+        """A cached sweep gives the same summaries and only the new strategies of an extended grid are run"""
+        OHLC = read_sample()
+        signal = np.random.default_rng(0).random(OHLC.shape[0]) < 0.02
+        grid = sample_grid(TP=[.5, 1], so_qty=[2, 4])
+        expected = run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal)
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'cache.jsonl')
+            first = run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal, cache=path)
+            cached = run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal, cache=path)
+            assert_frame_equal(first, expected)
+            assert_frame_equal(cached, expected)
+            # una escritura interrumpida deja una linea incompleta que se ignora
+            with open(path, 'a') as f:
+                f.write('{"key": "')
+            cache = ResultCache(path)
+            self.assertEqual(len(cache), 4)
+            grid = sample_grid(TP=[.5, 1, 1.5], so_qty=[2, 4])
+            extended = run_multiple_strategies(spawn_strategy(DCA, grid), OHLC, signal, cache=cache)
+            self.assertEqual(len(cache), 6)
+            self.assertEqual(extended.shape[1], 6)
+            self.assertEqual(len(ResultCache(path)), 6)
+
+    def test_result_cache_numpy_params(self):
+        """The numpy scalars of a grid give the same key than the python numbers"""
+        params = dict(SAMPLE_PARAMS, so_qty=2, long=True)
+        numpy_params = dict(params, so_qty=np.int64(2), long=np.bool_(True), TP=np.float64(params['TP']))
+        self.assertEqual(ResultCache.key(DCA(**numpy_params), 'data', -0.35),
+                         ResultCache.key(DCA(**params), 'data', -0.35))
+        with tempfile.TemporaryDirectory() as root:
+            cache = ResultCache(os.path.join(root, 'cache.jsonl'))
+            cache.put('key', pd.Series({'profit': 1.0}), DCA(**numpy_params))
+            with open(cache.path) as f:
+                self.assertEqual(json.loads(f.readline())['params'], DCA(**params).get_params)
+
+
+class GRIDTest(unittest.TestCase):
+    def test_sharded_grid(self):
+        """Merging the shards gives the run_multiple_strategies table of the whole grid"""
+        spec = {'param_grid': {'TP': [.5, 1], 'bo_size': [10, 20], 'so_qty': [1, 3], 'size_1st_so': [10],
+                               'so_vol_scale': [1.5], 'so_step': [.5], 'so_step_scale': [1.2, 1.4], 'long': [True],
+                               'EC': [.1]},
+                'data': {'csv': SAMPLE_CSV, 'nrows': 2880},
+                'signal': {'signals': [{'name': 'boll', 'TIMEFRAME_LENGTH': 15}]},
+                'dedup': 'exact'}
+        OHLC = load_ohlc(spec['data'])
+        signal = build_signal(OHLC, spec['signal'])
+        expected = run_multiple_strategies(spawn_strategy(DCA, ParameterGrid(spec['param_grid'])), OHLC, signal)
+        with tempfile.TemporaryDirectory() as out:
+            self.assertEqual(sum(run_shard(spec, k, 3, out) for k in [0, 2]), 11)
+            self.assertEqual(missing_shards(out, 3), [1])
+            self.assertRaises(FileNotFoundError, merge_shards, spec, out, 3)
+            run_shard(spec, 1, 3, out)
+            assert_frame_equal(merge_shards(spec, out, 3), expected)
+
+    def test_local_shards(self):
+        """The local command runs the shards as processes and merges them into the table of a single shard"""
+        spec = {'param_grid': {'TP': [.5, 1], 'bo_size': [10], 'so_qty': [1, 3], 'size_1st_so': [10],
+                               'so_vol_scale': [1.5], 'so_step': [.5], 'so_step_scale': [1.2], 'long': [True],
+                               'EC': [.1]},
+                'data': {'csv': os.path.abspath(SAMPLE_CSV), 'nrows': 1440},
+                'signal': {'signals': [{'name': 'boll', 'TIMEFRAME_LENGTH': 15}]},
+                'mode': 'event'}
+        with tempfile.TemporaryDirectory() as root:
+            spec_path = os.path.join(root, 'spec.json')
+            with open(spec_path, 'w') as f:
+                json.dump(spec, f)
+            out, single = os.path.join(root, 'local'), os.path.join(root, 'single')
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(grid_main(['local', spec_path, '--shards', '2', '--out', out]), 0)
+            self.assertEqual(missing_shards(out, 2), [])
+            self.assertTrue(os.path.isfile(os.path.join(out, 'result.csv')))
+            self.assertEqual(run_shard(spec, 0, 1, single), 4)
+            assert_frame_equal(merge_shards(spec, out, 2), merge_shards(spec, single, 1))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,36 +3,144 @@ utils.py
 
 This file contains utility functions.
 """
-from collections.abc import Mapping, Iterable
+from collections import OrderedDict
+from collections.abc import Mapping, Iterable, Sized
 from functools import partial, reduce
-from itertools import product
+from itertools import count, product
+import numpy as np
 import pandas as pd
+import hashlib
 import operator
+import random
 
-def transform_timeframe(OHLC, TIMEFRAME_LENGTH):
+def transform_timeframe(OHLC, TIMEFRAME_LENGTH, partial=False):
     """
     Given a OHLC dataframe with 1 minutes klines, transform_timeframe returns a transformation with aggregate
     klines (like 15, 30 or 60 minutes).
 
-    TODO: Crear un assertions cuando no calzen el TIMEFRAME_LENGTH con el numero de klines en el OHLC o algo que
-    arroje un error explicito (HACER UN TEST CASE PARA ESTO)
-
+    The price columns are reshaped into (n_buckets, TIMEFRAME_LENGTH) numpy arrays and reduced along each row:
+    the first open, the highest high, the lowest low and the last close of every bucket.
 
     :param OHLC: a pandas dataframe with open, high, low, and close prices. As well, a open_time index
-    :param TIMEFRAME_LENGTH: a float specified the new timeframe conversion required
+    :param TIMEFRAME_LENGTH: a int specified the new timeframe conversion required
+    :param partial: aggregate the trailing klines that don't complete a bucket into a last partial kline, instead
+    of asserting that TIMEFRAME_LENGTH is a divisor of the number of klines
     :return: OHLC converted into the timeframe specified
     """
-    assert OHLC.shape[0] % TIMEFRAME_LENGTH == 0, "You must transform the timeframes OHLC by a divisor of the number of " \
-                                               "klines "
-    open_price = OHLC['Open'].iloc[[x for x in range(0, OHLC.shape[0], TIMEFRAME_LENGTH)]]
-    close_price = OHLC['Close'].iloc[[x + (TIMEFRAME_LENGTH-1) for x in range(0, OHLC.shape[0], TIMEFRAME_LENGTH)]]
-    high_price = [OHLC.iloc[int(x):int(x + (TIMEFRAME_LENGTH - 1)), OHLC.columns.get_loc('High')].max() for x in range(0, OHLC.shape[0], TIMEFRAME_LENGTH)]
-    low_price = [OHLC.iloc[int(x):int(x + (TIMEFRAME_LENGTH - 1)), OHLC.columns.get_loc('Low')].min() for x in range(0, OHLC.shape[0], TIMEFRAME_LENGTH)]
-    close_price.index = open_price.index
-    return pd.DataFrame({'Open': open_price,
-                         'High': high_price,
-                         'Low': low_price,
-                         'Close': close_price})
+    n_buckets, rest = divmod(OHLC.shape[0], TIMEFRAME_LENGTH)
+    if not partial:
+        assert rest == 0, "You must transform the timeframes OHLC by a divisor of the number of klines "
+    complete = n_buckets * TIMEFRAME_LENGTH
+
+    def aggregate(column, reduce):
+        values = OHLC[column].to_numpy()
+        buckets = reduce(values[:complete].reshape(n_buckets, TIMEFRAME_LENGTH))
+        if rest:
+            buckets = np.append(buckets, reduce(values[complete:].reshape(1, rest)))
+        return buckets
+
+    return pd.DataFrame({'Open': aggregate('Open', lambda x: x[:, 0]),
+                         'High': aggregate('High', lambda x: np.fmax.reduce(x, axis=1)),
+                         'Low': aggregate('Low', lambda x: np.fmin.reduce(x, axis=1)),
+                         'Close': aggregate('Close', lambda x: x[:, -1])},
+                        index=OHLC.index[::TIMEFRAME_LENGTH])
+
+
+class ResampleCache:
+    """
+    Memoize transform_timeframe results by OHLC fingerprint and timeframe, so the signal builders computing several
+    signals over the same 1 minute OHLC resample it only once by timeframe. A timeframe is derived from the largest
+    cached timeframe dividing it (e.g. 60 from 30, 240 from 60) instead of the 1 minute klines. The least recently
+    used timeframes are evicted when the cached frames exceed max_bytes.
+
+    Usage:
+      cache = ResampleCache(max_bytes=64 * 2 ** 20)
+      OHLC60 = cache.transform(OHLC, 60)
+      OHLC240 = cache.transform(OHLC, 240)  # aggregate OHLC60 by 4
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.derived = 0
+        self._weights = np.empty(0)
+
+    def _dot(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        dot = float(values @ self._weights)
+        return dot if dot == dot else float(np.nan_to_num(values) @ self._weights)
+
+    def fingerprint(self, OHLC):
+        """
+        A content key of OHLC: the shape, the first and last timestamps and a dot product of the index and every
+        price column with fixed random weights. It only costs a pass over the data, unlike hashing every byte.
+        It's computed on every call, so an OHLC edited in place gets a new key.
+        """
+        n = OHLC.shape[0]
+        if self._weights.shape[0] != n:
+            self._weights = np.random.default_rng(0).uniform(0.5, 1.5, n)
+        index = OHLC.index
+        if isinstance(index, pd.DatetimeIndex):
+            index_values = index.asi8
+        else:
+            index_values = pd.util.hash_array(index.to_numpy())
+        key = [OHLC.shape, str(index[0]) if n else None, str(index[-1]) if n else None, self._dot(index_values)]
+        key += [self._dot(OHLC[column].to_numpy()) for column in ['Open', 'High', 'Low', 'Close']]
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def transform(self, OHLC, TIMEFRAME_LENGTH, partial=False):
+        """
+        Cached transform_timeframe(OHLC, TIMEFRAME_LENGTH, partial)
+        :return: a copy of the cached OHLC converted into the timeframe specified
+        """
+        if not partial:
+            assert OHLC.shape[0] % TIMEFRAME_LENGTH == 0, \
+                "You must transform the timeframes OHLC by a divisor of the number of klines "
+        fingerprint = self.fingerprint(OHLC)
+        key = (fingerprint, TIMEFRAME_LENGTH)
+        if key in self.frames:
+            self.hits += 1
+            self.frames.move_to_end(key)
+            return self.frames[key][0].copy()
+
+        self.misses += 1
+        # las velas de un timeframe cacheado que divide al pedido contienen buckets completos del nuevo timeframe
+        divisors = [tf for fp, tf in self.frames if fp == fingerprint and TIMEFRAME_LENGTH % tf == 0]
+        if divisors:
+            self.derived += 1
+            lower = max(divisors)
+            self.frames.move_to_end((fingerprint, lower))
+            lower_frame, _ = self.frames[(fingerprint, lower)]
+            frame = transform_timeframe(lower_frame, TIMEFRAME_LENGTH // lower, partial=True)
+        else:
+            frame = transform_timeframe(OHLC, TIMEFRAME_LENGTH, partial=True)
+        self._store(key, frame)
+        return frame.copy()
+
+    def _store(self, key, frame):
+        size = int(frame.index.nbytes + sum(frame[column].to_numpy().nbytes for column in frame.columns))
+        if size > self.max_bytes:
+            return
+        self.frames[key] = (frame, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self.frames.popitem(last=False)
+            self.nbytes -= evicted
+
+    def clear(self):
+        """Drop the cached frames and reset the hits, misses and derived counters"""
+        self.frames.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.derived = 0
+
+
+# cache compartido por las funciones de signals.py
+RESAMPLE_CACHE = ResampleCache()
 
 
 def spawn_strategy(cls, parameter_grid):
@@ -43,14 +151,30 @@ def spawn_strategy(cls, parameter_grid):
     :param parameter_grid:
     :return: A dict with instantiation cls given the ParameterGrid
   """
-    spawn = [cls(**param) for param in parameter_grid]
-    return {'A' + str(i): x for i, x in enumerate(spawn)}
+    return dict(iter_spawn_strategy(cls, parameter_grid))
+
+
+def iter_spawn_strategy(cls, parameter_grid):
+    """
+    Lazy spawn_strategy: instantiate cls with every parameters set only when it's consumed, so a big grid is never
+    materialized. The ID of a ParameterGrid (or a shard or sample of it) is its flat index in the whole grid, so the
+    IDs of different shards don't collide.
+    :return: an iterator of (ID, strategy) tuples
+    """
+    indices = getattr(parameter_grid, 'indices', None)
+    if indices is None:
+        indices = range(len(parameter_grid)) if isinstance(parameter_grid, Sized) else count()
+    for i, param in zip(indices, parameter_grid):
+        yield 'A' + str(i), cls(**param)
 
 
 class ParameterGrid:
     """
     Minimal functionality based on Scikit-learn h class
     - dic: parameter name as key and as value a list of candidate value
+
+    The grid is never materialized: grid[i] decodes the flat index i of the iteration order, grid[a:b],
+    grid.shard(k, n) and grid.sample(n) return lazy views (GridView) of a part of the grid.
     """
 
     def __init__(self, param_grid):
@@ -63,11 +187,12 @@ class ParameterGrid:
             if not isinstance(grid, dict):
                 raise TypeError('Parameter grid is not a dict ({!r})'.format(grid))
 
-        for key in grid:
-            if not isinstance(grid[key], Iterable):
-                raise TypeError('Parameter grid is not a dict ({!r})'.format(grid))
+            for key in grid:
+                if not isinstance(grid[key], Iterable):
+                    raise TypeError('Parameter grid is not a dict ({!r})'.format(grid))
 
-        self.param_grid = param_grid
+        # tuplas: los sets y generadores se pueden indexar y recorrer varias veces
+        self.param_grid = [{key: tuple(values) for key, values in grid.items()} for grid in param_grid]
 
     def __iter__(self):
         """
@@ -93,3 +218,73 @@ class ParameterGrid:
         product = partial(reduce, operator.mul)
         return sum(product(len(v) for v in p.values()) if p else 1
                    for p in self.param_grid)
+
+    @property
+    def indices(self):
+        return range(len(self))
+
+    def __getitem__(self, ind):
+        """
+        The parameters set at the flat index ind of the iteration order, without iterating the grid: the index is
+        decoded as a mixed radix number whose digits are the positions in every list of values. A slice returns a
+        GridView.
+        """
+        if isinstance(ind, slice):
+            return GridView(self, self.indices[ind])
+        n = len(self)
+        if ind < 0:
+            ind += n
+        if not 0 <= ind < n:
+            raise IndexError('ParameterGrid index out of range')
+        for p in self.param_grid:
+            items = sorted(p.items())
+            total = reduce(operator.mul, (len(v) for _, v in items), 1)
+            if ind >= total:
+                ind -= total
+                continue
+            # como en product, la ultima clave cambia en cada punto del grid
+            offsets = []
+            for _, values in reversed(items):
+                ind, offset = divmod(ind, len(values))
+                offsets.append(offset)
+            return {key: values[offset] for (key, values), offset in zip(items, reversed(offsets))}
+
+    def shard(self, k, n):
+        """The k-th (0 <= k < n) of n contiguous shards of the grid, as a GridView"""
+        return self[:].shard(k, n)
+
+    def sample(self, n, seed=None):
+        """n parameters sets sampled without replacement, as a GridView"""
+        return self[:].sample(n, seed)
+
+
+class GridView:
+    """
+    A lazy selection of the points of a ParameterGrid by their flat indices (a range or a list)
+    """
+
+    def __init__(self, grid, indices):
+        self.grid = grid
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        return map(self.grid.__getitem__, self.indices)
+
+    def __getitem__(self, ind):
+        if isinstance(ind, slice):
+            return GridView(self.grid, self.indices[ind])
+        return self.grid[self.indices[ind]]
+
+    def shard(self, k, n):
+        if not 0 <= k < n:
+            raise ValueError('The shard k must be between 0 and n - 1, got k={} and n={}'.format(k, n))
+        size = len(self)
+        return self[size * k // n:size * (k + 1) // n]
+
+    def sample(self, n, seed=None):
+        # random.sample de un range no crea la lista de indices
+        positions = random.Random(seed).sample(range(len(self)), n)
+        return GridView(self.grid, [self.indices[i] for i in positions])
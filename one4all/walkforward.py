@@ -0,0 +1,123 @@
+"""
+walkforward.py
+
+This file contains a walk-forward evaluation: the strategies are backtested independently over rolling or anchored
+windows of the klines, to check how stable their results are across periods. The klines and the signal are built
+once over the whole history and every window is a slice of them, so the signals (and their resamples) are never
+computed again by window.
+
+Usage:
+  SIGNAL = compute_boll_signal(OHLC, TIMEFRAME_LENGTH=15)['BB15']
+  windows = walk_forward_windows(OHLC.index, length='7D', step='1D')
+  results = walk_forward(spawn_strategy(DCA, candidates), OHLC, SIGNAL, windows, n_jobs=-1)
+  results.groupby('strategy').pl_ret.describe()
+"""
+import copy
+import os
+import numpy as np
+import pandas as pd
+from .backtesting import as_klines, backtesting, backtesting_batch, parallel_map
+from .reports import make_report, summary_strategy
+
+
+def walk_forward_windows(index, length, step=None, anchored=False):
+    """
+    Split the klines into evaluation windows
+    :param index: the open_time index of the klines
+    :param length: the window length, a number of klines or a duration (a pd.Timedelta or a str like '7D')
+    :param step: the distance between consecutive windows, with the same unit than length (length by default)
+    :param anchored: every window starts at the first kline and the end moves step forward each time, instead of
+    rolling windows of a fixed length
+    :return: a list of (first, last) kline positions of every window, the window is [first, last)
+    """
+    n = len(index)
+    if isinstance(length, (int, np.integer)):
+        step = length if step is None else step
+        if length <= 0 or step <= 0:
+            raise ValueError('The window length and step must be positive')
+        return [(0 if anchored else end - length, end) for end in range(length, n + 1, step)]
+    length = pd.Timedelta(length)
+    step = length if step is None else pd.Timedelta(step)
+    if length <= pd.Timedelta(0) or step <= pd.Timedelta(0):
+        raise ValueError('The window length and step must be positive')
+    index = pd.DatetimeIndex(index)
+    if n == 0:
+        return []
+    # el fin de los datos es el cierre de la ultima kline
+    data_end = index[-1] + (index[-1] - index[-2] if n > 1 else pd.Timedelta(0))
+    windows = []
+    start = index[0]
+    while start + length <= data_end:
+        first = 0 if anchored else int(index.searchsorted(start))
+        last = int(index.searchsorted(start + length))
+        if last > first:
+            windows.append((first, last))
+        start += step
+    return windows
+
+
+def window_summaries(klines, signal, task, DRAWDOWN_TOLERANCE, mode='bar'):
+    """
+    Backtest a chunk of strategies over a window and summary each one
+    :param task: a tuple (window number, first, last, list of (name, strategy))
+    :return: a list with a dict by strategy: the window, the summary_strategy and the parameters
+    """
+    w, first, last, items = task
+    window = klines.window(first, last)
+    window_signal = signal[first:last]
+    strategies = {}
+    for name, strategy in items:
+        # cada ventana parte de la estrategia sin posiciones
+        strategies[name] = copy.copy(strategy)
+        strategies[name].strategy_pos, strategies[name].so_magazine = [], []
+    if mode == 'batch':
+        results = backtesting_batch(strategies, window, window_signal, DRAWDOWN_TOLERANCE)
+    else:
+        results = ((name, backtesting(strategy, window, window_signal, DRAWDOWN_TOLERANCE, mode))
+                   for name, strategy in strategies.items())
+    rows = []
+    for name, deals in results:
+        strategy = strategies[name]
+        report = make_report(deals, tracking=getattr(strategy, 'tracking', 'full'), lazy_nested=True)
+        row = {'strategy': name, 'window': w, 'window_start': window.index[0], 'window_end': window.index[-1]}
+        if report.shape[0]:
+            row.update(summary_strategy(report, MIN_CAPITAL=strategy.compute_min_capital()))
+        else:
+            row['num_deals'] = 0
+        row.update(strategy.get_params)
+        rows.append(row)
+    return rows
+
+
+def _window_worker(task, klines, signal, DRAWDOWN_TOLERANCE, mode):
+    return window_summaries(klines, signal, task, DRAWDOWN_TOLERANCE, mode)
+
+
+def walk_forward(strategy_dic, OHLC, signal, windows, DRAWDOWN_TOLERANCE=-0.35, mode='bar', n_jobs=1):
+    """
+    Backtest every strategy over every window, each window from scratch (no position is carried between windows)
+    :param strategy_dic: a dict of strategies (see spawn_strategy)
+    :param OHLC: the klines of the whole history, a dataframe or a Klines instance
+    :param signal: the signal over the whole history
+    :param windows: a list of (first, last) kline positions (see walk_forward_windows)
+    :param mode: backtesting mode, 'bar', 'event' or 'batch' (the strategies of a task run in the same pass)
+    :param n_jobs: number of worker processes, -1 uses every core. The klines and the signal are published once
+    as memory-mapped files and the (window, chunk of strategies) tasks run in the pool
+    :return: a pd.DataFrame with a row by (strategy, window): the window bounds, the summary_strategy (only
+    num_deals when the strategy made no deal in the window) and the parameters
+    """
+    klines = as_klines(OHLC)
+    signal = np.asarray(signal, dtype=bool)
+    assert signal.shape[0] == len(klines), 'The signal must have the same length that the klines'
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    items = list(strategy_dic.items())
+    size = max(1, -(-len(items) // max(n_jobs, 1)))
+    tasks = [(w, first, last, items[k:k + size]) for w, (first, last) in enumerate(windows)
+             for k in range(0, len(items), size)]
+    if n_jobs > 1 and len(tasks) > 1:
+        chunks = parallel_map(_window_worker, tasks, klines, signal, DRAWDOWN_TOLERANCE, mode, n_jobs)
+        rows = [row for chunk in chunks for row in chunk]
+    else:
+        rows = [row for task in tasks for row in window_summaries(klines, signal, task, DRAWDOWN_TOLERANCE, mode)]
+    return pd.DataFrame(rows)